@@ -0,0 +1,606 @@
+"""
+═══════════════════════════════════════════════════════════════════════════════
+⏱️ DEV-SERVER LOAD TEST
+═══════════════════════════════════════════════════════════════════════════════
+
+Measures dev-server.py throughput and latency without spending Groq/Gemini
+quota. The AI providers are replaced by local stubs that speak the same wire
+formats (Groq OpenAI-style JSON/SSE, Gemini generateContent/SSE, Ollama
+/api/chat JSON/NDJSON) with configurable latency, 429 bursts and errors.
+
+Commands:
+  run     start the stubs and dev-server.py (pointed at them), run the load
+          scenarios at each concurrency level, print the report, stop both
+  stubs   only run the stub upstreams (all three providers on one port)
+  load    only run the load generator against an already running dev-server
+
+Usage:
+  python3 dev-server-loadtest.py run [--scenarios static,chat,stream] [--concurrency 1,8,32] [--duration 5]
+  python3 dev-server-loadtest.py run --server-mode asyncio --env AI_FALLBACK_PROVIDER=ollama --burst-429 groq=10/3/1
+  python3 dev-server-loadtest.py stubs --port 18500 --latency groq=300,gemini=200,ollama=800
+  python3 dev-server-loadtest.py load --target http://127.0.0.1:3000 --scenarios chat --provider ollama
+
+  With `stubs`, point a dev-server at them:
+    GROQ_BASE_URL=http://127.0.0.1:18500/openai/v1 GEMINI_BASE_URL=http://127.0.0.1:18500/v1beta
+    OLLAMA_URL=http://127.0.0.1:18500 GROQ_API_KEY=stub GEMINI_API_KEY=stub python3 dev-server.py
+
+Scenarios:
+  static        GET /index.html (gzip accepted)
+  chat          POST /api/ai/chat, a distinct prompt per request (never cached)
+  chat-cached   POST /api/ai/chat, one temperature-0 prompt (cache hits / coalescing)
+  stream        POST /api/ai/chat with "stream": true (also reports time to first byte)
+  batch         POST /api/ai/chat/batch with --batch-size distinct prompts
+
+Stub behaviour (per provider, "provider=value,..." lists):
+  --latency     mean latency in ms before the response (default groq=300,gemini=250,ollama=600)
+  --jitter      uniform jitter as a fraction of the latency (default 0.3)
+  --error-rate  share of requests answered with 500 (default none)
+  --burst-429   every/length/retry_after in seconds: during the first `length` seconds of
+                every `every`-second period, answer 429 with Retry-After (default none)
+
+Regression gates (exit code 1 when any scenario exceeds them):
+  --max-p99-ms, --max-error-rate, --min-rps
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+ROOT_DIR = Path(__file__).resolve().parent
+PROVIDERS = ("groq", "gemini", "ollama")
+SCENARIOS = ("static", "chat", "chat-cached", "stream", "batch")
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# STUB UPSTREAMS
+# ═══════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class StubProfile:
+    """How one stub provider behaves"""
+    latency_ms: float
+    jitter: float = 0.3
+    error_rate: float = 0.0
+    burst_every_s: float = 0.0
+    burst_length_s: float = 0.0
+    retry_after_s: float = 1.0
+    stream_chunks: int = 6
+    chunk_interval_ms: float = 20.0
+
+    def delay_s(self) -> float:
+        spread = self.latency_ms * self.jitter
+        return max(0.0, self.latency_ms + random.uniform(-spread, spread)) / 1000
+
+    def in_burst(self, elapsed_s: float) -> bool:
+        return self.burst_every_s > 0 and (elapsed_s % self.burst_every_s) < self.burst_length_s
+
+
+class StubState:
+    """Profiles and counters shared by the stub handler threads"""
+
+    def __init__(self, profiles: Dict[str, StubProfile]):
+        self.profiles = profiles
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.counters = {p: {"requests": 0, "ok": 0, "errors": 0, "rate_limited": 0, "streams": 0} for p in PROVIDERS}
+
+    def count(self, provider: str, key: str):
+        with self.lock:
+            self.counters[provider][key] += 1
+
+
+def _approx_tokens(messages) -> int:
+    text = " ".join(str((m or {}).get("content") or "") for m in messages or [] if isinstance(m, dict))
+    return max(1, len(text) // 4)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Routes by path: /openai/v1/* = Groq, /v1beta/models/* = Gemini, /api/chat = Ollama"""
+    protocol_version = "HTTP/1.1"
+    server_version = "StubUpstream/1.0"
+    # Headers and body are separate writes: without TCP_NODELAY every keep-alive
+    # response after the first stalls ~40 ms on delayed ACKs (fake upstream latency)
+    disable_nagle_algorithm = True
+    state: StubState = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.startswith("/stub/stats"):
+            with self.state.lock:
+                return self._send_json(200, self.state.counters)
+        self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or "0")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json(400, {"error": "invalid json"})
+
+        path = self.path.split("?", 1)[0]
+        if path.startswith("/openai/v1/chat/completions"):
+            provider, stream = "groq", body.get("stream") is True
+        elif path.startswith("/v1beta/models/"):
+            provider, stream = "gemini", ":streamGenerateContent" in path
+        elif path == "/api/chat":
+            provider, stream = "ollama", body.get("stream") is True
+        else:
+            return self._send_json(404, {"error": "not found"})
+
+        state, profile = self.state, self.state.profiles[provider]
+        state.count(provider, "requests")
+
+        if profile.in_burst(time.monotonic() - state.started):
+            state.count(provider, "rate_limited")
+            retry = f"{profile.retry_after_s:g}"
+            return self._send_json(429, {"error": {"message": "stub rate limit", "code": "rate_limit_exceeded"}}, {
+                "Retry-After": retry,
+                "x-ratelimit-remaining-requests": "0",
+                "x-ratelimit-reset-requests": f"{retry}s",
+            })
+
+        time.sleep(profile.delay_s())
+        if random.random() < profile.error_rate:
+            state.count(provider, "errors")
+            return self._send_json(500, {"error": {"message": "stub upstream error"}})
+
+        prompt_tokens = _approx_tokens(body.get("messages") or [{"content": json.dumps(body.get("contents", ""))}])
+        words = [f"w{i} " for i in range(max(1, profile.stream_chunks))]
+        if stream:
+            state.count(provider, "streams")
+            self._stream(provider, body, words, prompt_tokens, profile)
+        else:
+            self._send_json(200, self._completion(provider, body, "".join(words), prompt_tokens, len(words)))
+        state.count(provider, "ok")
+
+    def _completion(self, provider: str, body: dict, text: str, prompt_tokens: int, completion_tokens: int) -> dict:
+        if provider == "gemini":
+            return {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": completion_tokens, "totalTokenCount": prompt_tokens + completion_tokens},
+            }
+        if provider == "ollama":
+            return {"model": body.get("model"), "message": {"role": "assistant", "content": text}, "done": True, "prompt_eval_count": prompt_tokens, "eval_count": completion_tokens}
+        return {
+            "id": f"stub-{time.time_ns()}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens},
+        }
+
+    def _stream(self, provider: str, body: dict, words: List[str], prompt_tokens: int, profile: StubProfile):
+        content_type = "application/x-ndjson" if provider == "ollama" else "text/event-stream"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        last = len(words) - 1
+        for i, word in enumerate(words):
+            if provider == "ollama":
+                item = {"message": {"role": "assistant", "content": word}, "done": False}
+                frame = json.dumps(item) + "\n"
+            elif provider == "gemini":
+                event = {"candidates": [{"content": {"parts": [{"text": word}]}}]}
+                if i == last:
+                    event["candidates"][0]["finishReason"] = "STOP"
+                    event["usageMetadata"] = {"promptTokenCount": prompt_tokens, "candidatesTokenCount": len(words), "totalTokenCount": prompt_tokens + len(words)}
+                frame = f"data: {json.dumps(event)}\r\n\r\n"
+            else:
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "model": body.get("model"), "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": "stop" if i == last else None}]}
+                frame = f"data: {json.dumps(chunk)}\n\n"
+            self._write_chunk(frame.encode("utf-8"))
+            time.sleep(profile.chunk_interval_ms / 1000)
+        if provider == "ollama":
+            self._write_chunk((json.dumps({"message": {"role": "assistant", "content": ""}, "done": True, "prompt_eval_count": prompt_tokens, "eval_count": len(words)}) + "\n").encode("utf-8"))
+        elif provider == "groq":
+            self._write_chunk(b"data: [DONE]\n\n")
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def start_stubs(port: int, profiles: Dict[str, StubProfile]) -> StubServer:
+    """Start the stub upstreams in a background thread"""
+    handler = type("BoundStubHandler", (StubHandler,), {"state": StubState(profiles)})
+    server = StubServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, name="stub-upstreams", daemon=True).start()
+    return server
+
+
+def parse_provider_values(spec: str) -> Dict[str, str]:
+    """Parse "groq=300,ollama=800" (a bare value applies to every provider)"""
+    values: Dict[str, str] = {}
+    for item in (spec or "").split(","):
+        if not item.strip():
+            continue
+        if "=" in item:
+            provider, value = item.split("=", 1)
+            values[provider.strip().lower()] = value.strip()
+        else:
+            values.update({p: item.strip() for p in PROVIDERS})
+    return values
+
+
+def build_profiles(args) -> Dict[str, StubProfile]:
+    latency = parse_provider_values(args.latency)
+    errors = parse_provider_values(args.error_rate)
+    bursts = parse_provider_values(args.burst_429)
+    profiles = {}
+    for provider in PROVIDERS:
+        profile = StubProfile(
+            latency_ms=float(latency.get(provider, 300)),
+            jitter=args.jitter,
+            error_rate=float(errors.get(provider, 0)),
+            stream_chunks=args.stream_chunks,
+        )
+        if provider in bursts:
+            every, length, retry_after = (float(x) for x in bursts[provider].split("/"))
+            profile.burst_every_s, profile.burst_length_s, profile.retry_after_s = every, length, retry_after
+        profiles[provider] = profile
+    return profiles
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# LOAD GENERATOR
+# ═══════════════════════════════════════════════════════════════════════════
+
+class Connection:
+    """Minimal keep-alive HTTP/1.1 client connection (one per virtual user)"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, body: bytes = b"", headers: Optional[Dict[str, str]] = None) -> Tuple[int, float]:
+        """Send one request and read the whole response; returns (status, time to first byte)"""
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        head = {"Host": f"{self.host}:{self.port}", "Content-Length": str(len(body)), **(headers or {})}
+        started = time.perf_counter()
+        self.writer.write((f"{method} {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in head.items()) + "\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        ttfb = time.perf_counter() - started
+        if not status_line:
+            raise ConnectionResetError("server closed the connection")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        if "chunked" in response_headers.get("transfer-encoding", "").lower():
+            while True:
+                size = int((await self.reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                await self.reader.readexactly(size + 2)
+        elif "content-length" in response_headers:
+            await self.reader.readexactly(int(response_headers["content-length"]))
+        elif method != "HEAD" and status not in (204, 304):
+            await self.reader.read()
+            self.close()
+        if response_headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, ttfb
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+def make_request(scenario: str, provider: str, batch_size: int, n: int) -> Tuple[str, str, bytes, Dict[str, str]]:
+    """(method, path, body, headers) for request number n of a scenario"""
+    if scenario == "static":
+        return "GET", "/index.html", b"", {"Accept-Encoding": "gzip"}
+
+    def chat(prompt: str, temperature: float, stream: bool = False) -> dict:
+        return {
+            "provider": provider,
+            "model": "llama-3.3-70b-versatile" if provider == "groq" else "gemini-2.0-flash" if provider == "gemini" else "qwen2.5:14b",
+            "messages": [{"role": "system", "content": "You are a strength coach."}, {"role": "user", "content": prompt}],
+            "temperature": temperature,
+            "max_tokens": 256,
+            **({"stream": True} if stream else {}),
+        }
+
+    if scenario == "chat-cached":
+        body = chat("Plan a deload week.", 0)
+    elif scenario == "stream":
+        body = chat(f"Session {n}: warm-up ideas?", 0.2, stream=True)
+    elif scenario == "batch":
+        body = {"requests": [chat(f"Batch {n} day {i}: session plan", 0.2) for i in range(batch_size)]}
+    else:
+        body = chat(f"Request {n}: suggest a squat accessory.", 0.2)
+    path = "/api/ai/chat/batch" if scenario == "batch" else "/api/ai/chat"
+    return "POST", path, json.dumps(body).encode("utf-8"), {"Content-Type": "application/json"}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+async def run_scenario(target: str, scenario: str, concurrency: int, duration_s: float, provider: str, batch_size: int) -> dict:
+    """Drive one scenario with `concurrency` keep-alive virtual users for duration_s"""
+    parts = urlsplit(target)
+    host, port = parts.hostname or "127.0.0.1", parts.port or 80
+    latencies: List[float] = []
+    ttfbs: List[float] = []
+    statuses: Dict[str, int] = {}
+    counter = iter(range(10**9))
+    deadline = time.perf_counter() + duration_s
+
+    async def user():
+        conn = Connection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                method, path, body, headers = make_request(scenario, provider, batch_size, next(counter))
+                started = time.perf_counter()
+                try:
+                    status, ttfb = await conn.request(method, path, body, headers)
+                except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    conn.close()
+                    statuses["conn_error"] = statuses.get("conn_error", 0) + 1
+                    await asyncio.sleep(0.05)
+                    continue
+                latencies.append(time.perf_counter() - started)
+                ttfbs.append(ttfb)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+        finally:
+            conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    ttfbs.sort()
+    total = sum(statuses.values())
+    errors = sum(n for status, n in statuses.items() if not status.isdigit() or int(status) >= 400)
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": percentile(latencies, 50) * 1000,
+        "p95": percentile(latencies, 95) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "ttfb_p50": percentile(ttfbs, 50) * 1000,
+        "statuses": statuses,
+    }
+
+
+def print_report(rows: List[dict]):
+    print(f"{'scenario':<13}{'conc':>6}{'requests':>10}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ttfb p50':>10}  statuses")
+    for row in rows:
+        statuses = " ".join(f"{k}:{v}" for k, v in sorted(row["statuses"].items()))
+        print(
+            f"{row['scenario']:<13}{row['concurrency']:>6}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10.1f}"
+            f"{row['p50']:>10.1f}{row['p95']:>10.1f}{row['p99']:>10.1f}{row['ttfb_p50']:>10.1f}  {statuses}"
+        )
+
+
+def check_gates(rows: List[dict], args) -> List[str]:
+    failures = []
+    for row in rows:
+        name = f"{row['scenario']}@{row['concurrency']}"
+        if args.max_p99_ms is not None and row["p99"] > args.max_p99_ms:
+            failures.append(f"{name}: p99 {row['p99']:.1f} ms > {args.max_p99_ms} ms")
+        if args.max_error_rate is not None and row["error_rate"] > args.max_error_rate:
+            failures.append(f"{name}: error rate {row['error_rate']:.3f} > {args.max_error_rate}")
+        if args.min_rps is not None and row["rps"] < args.min_rps:
+            failures.append(f"{name}: {row['rps']:.1f} rps < {args.min_rps}")
+    return failures
+
+
+def fetch_json(url: str) -> Optional[dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            return json.load(resp)
+    except (OSError, ValueError):
+        return None
+
+
+async def run_load(target: str, args) -> List[dict]:
+    rows = []
+    for scenario in args.scenarios:
+        for concurrency in args.concurrency:
+            rows.append(await run_scenario(target, scenario, concurrency, args.duration, args.provider, args.batch_size))
+    return rows
+
+
+# ═══════════════════════════════════════════════════════════════════════════
+# COMMANDS
+# ═══════════════════════════════════════════════════════════════════════════
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_dev_server(port: int, stub_port: int, args) -> subprocess.Popen:
+    """Launch dev-server.py with every provider pointed at the stubs"""
+    stub = f"http://127.0.0.1:{stub_port}"
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "HOST": "127.0.0.1",
+        "SERVER_MODE": args.server_mode,
+        "GROQ_API_KEY": "stub",
+        "GEMINI_API_KEY": "stub",
+        "GROQ_BASE_URL": f"{stub}/openai/v1",
+        "GEMINI_BASE_URL": f"{stub}/v1beta",
+        "OLLAMA_URL": stub,
+        "AI_CACHE": "1",
+        "AI_CACHE_DIR": "",
+    }
+    if not args.keep_limits:
+        # Measure the proxy, not the provider quotas (use --keep-limits to test throttling)
+        env.update({"AI_RATE_LIMITS": "groq=0/0,gemini=0/0,ollama=0/0", "AI_MIN_INTERVAL_MS": "0"})
+    for item in args.env:
+        name, _, value = item.partition("=")
+        env[name] = value
+
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    proc = subprocess.Popen([sys.executable, str(ROOT_DIR / "dev-server.py")], env=env, cwd=ROOT_DIR, stdout=log, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"dev-server.py exited with code {proc.returncode}")
+        if fetch_json(f"http://127.0.0.1:{port}/api/dev/stats") is not None:
+            return proc
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("dev-server.py did not start within 15 s")
+
+
+def cmd_stubs(args):
+    server = start_stubs(args.port, build_profiles(args))
+    print(f"[loadtest] Stub upstreams on http://127.0.0.1:{args.port} (stats: /stub/stats)")
+    print(f"  GROQ_BASE_URL=http://127.0.0.1:{args.port}/openai/v1")
+    print(f"  GEMINI_BASE_URL=http://127.0.0.1:{args.port}/v1beta")
+    print(f"  OLLAMA_URL=http://127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+def cmd_load(args) -> int:
+    rows = asyncio.run(run_load(args.target, args))
+    print_report(rows)
+    return report_gates(rows, args)
+
+
+def cmd_run(args) -> int:
+    stub_port = args.port or free_port()
+    stubs = start_stubs(stub_port, build_profiles(args))
+    server_port = free_port()
+    proc = start_dev_server(server_port, stub_port, args)
+    try:
+        rows = asyncio.run(run_load(f"http://127.0.0.1:{server_port}", args))
+        stats = fetch_json(f"http://127.0.0.1:{server_port}/api/dev/stats") or {}
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        stubs.shutdown()
+
+    print(f"dev-server.py ({args.server_mode} mode), stubs {args.latency or 'default latency'}, {args.duration:g} s per run")
+    print_report(rows)
+    with stubs.RequestHandlerClass.state.lock:
+        upstream = stubs.RequestHandlerClass.state.counters
+    print("\nupstream calls (retries and fallbacks show up as calls beyond the client requests):")
+    for provider, counters in upstream.items():
+        if counters["requests"]:
+            print(f"  {provider:<8}" + "  ".join(f"{k}={v}" for k, v in counters.items()))
+    for section in ("rate_limits", "hedging", "coalescing", "pool"):
+        if stats.get(section):
+            print(f"  {section}: {json.dumps(stats[section])}")
+    return report_gates(rows, args)
+
+
+def report_gates(rows: List[dict], args) -> int:
+    failures = check_gates(rows, args)
+    for failure in failures:
+        print(f"[loadtest] FAIL {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def stub_options(p):
+        p.add_argument("--port", type=int, default=0, help="stub port (run: random free port)")
+        p.add_argument("--latency", default="groq=300,gemini=250,ollama=600", help="provider=ms,...")
+        p.add_argument("--jitter", type=float, default=0.3, help="latency jitter fraction")
+        p.add_argument("--error-rate", default="", help="provider=share of 500s,...")
+        p.add_argument("--burst-429", default="", help="provider=every/length/retry_after seconds,...")
+        p.add_argument("--stream-chunks", type=int, default=6, help="chunks per streamed response")
+
+    def load_options(p):
+        p.add_argument("--scenarios", default="static,chat,stream", type=lambda s: [x for x in s.split(",") if x in SCENARIOS], help=",".join(SCENARIOS))
+        p.add_argument("--concurrency", default="1,8,32", type=lambda s: [int(x) for x in s.split(",") if x.strip()], help="virtual users per run")
+        p.add_argument("--duration", type=float, default=5.0, help="seconds per scenario and concurrency level")
+        p.add_argument("--provider", default="groq", choices=PROVIDERS, help="provider for AI scenarios")
+        p.add_argument("--batch-size", type=int, default=8, help="items per batch request")
+        p.add_argument("--max-p99-ms", type=float, default=None)
+        p.add_argument("--max-error-rate", type=float, default=None)
+        p.add_argument("--min-rps", type=float, default=None)
+
+    p_run = sub.add_parser("run", help="stubs + dev-server.py + load")
+    stub_options(p_run)
+    load_options(p_run)
+    p_run.add_argument("--server-mode", default="threads", choices=("threads", "asyncio"))
+    p_run.add_argument("--keep-limits", action="store_true", help="keep the default AI_RATE_LIMITS / AI_MIN_INTERVAL_MS")
+    p_run.add_argument("--env", action="append", default=[], help="extra NAME=value for dev-server.py (repeatable)")
+    p_run.add_argument("--server-log", default="", help="write dev-server.py output to this file")
+
+    p_stubs = sub.add_parser("stubs", help="run the stub upstreams only")
+    stub_options(p_stubs)
+    p_stubs.set_defaults(port=18500)
+
+    p_load = sub.add_parser("load", help="load an already running dev-server")
+    load_options(p_load)
+    p_load.add_argument("--target", default="http://127.0.0.1:3000")
+
+    args = parser.parse_args()
+    if args.command == "stubs":
+        cmd_stubs(args)
+    elif args.command == "load":
+        sys.exit(cmd_load(args))
+    else:
+        sys.exit(cmd_run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,8 @@ Usage (sh):
   export PORT=3000   # optional
   python3 dev-server.py
 
+  SERVER_MODE=asyncio python3 dev-server.py   # optional: single-threaded asyncio core
+
 Then open:
   http://localhost:3000/generate-workout.html
   (from phone on same Wi‑Fi) http://<LAN_IP>:3000/generate-workout.html
@@ -19,28 +21,187 @@ AI routing:
     - POST /api/ai/ollama-chat  (force Ollama)
     - POST /api/ai/gemini-chat  (force Gemini)
 
+    Add "stream": true to the body to receive OpenAI-style SSE chunks
+    (`data: {"object": "chat.completion.chunk", ...}` ... `data: [DONE]`);
+    Ollama NDJSON and Gemini streamGenerateContent are normalized to the same frames.
+
+Server:
+    - SERVER_MODE=threads|asyncio  threads (default): one thread per connection;
+                                   asyncio: one event loop, HTTP/1.1 keep-alive,
+                                   thousands of pending AI calls in one process
+    - KEEPALIVE_TIMEOUT_S=15       idle keep-alive connections are closed after this
+    - ASYNC_BACKLOG=1024           listen backlog (both modes)
+    Both modes speak HTTP/1.1 to browsers and run upstream AI I/O on an
+    asyncio event loop (a background thread in threads mode).
+
 Environment variables:
     - AI_PROVIDER=groq|ollama|gemini
     - AI_FALLBACK_PROVIDER=ollama  (optional)
-    - AI_MIN_INTERVAL_MS=900       (optional)
+    - AI_MIN_INTERVAL_MS=900       (optional) min spacing between calls to the same provider + API key
+    - AI_RATE_LIMITS=groq=30/6000,gemini=15/250000,ollama=0/0
+                                   (optional) requests/min and tokens/min per provider + API key,
+                                   0 = unlimited; providers with 0/0 are never throttled
+    - AI_RATE_MAX_WAIT_MS=30000    (optional) answer 429 instead of queueing longer than this
     - AI_MAX_429_RETRIES=2         (optional)
+    - GROQ_BASE_URL=https://api.groq.com/openai/v1
     - OLLAMA_URL=http://localhost:11434
     - OLLAMA_MODEL=qwen2.5:14b
     - GEMINI_API_KEY=...           (required for Gemini)
+    - GEMINI_BASE_URL=https://generativelanguage.googleapis.com/v1beta
+    The base URLs can point at the stub upstreams of dev-server-loadtest.py.
+
+Response cache (optional):
+    - AI_CACHE=1                   enable the /api/ai/* response cache
+    - AI_CACHE_ALL=0               1 = also cache non-deterministic requests
+                                   (default: only temperature 0 or JSON mode)
+    - AI_CACHE_MAX_MB=64           in-memory LRU size limit
+    - AI_CACHE_TTL_S=86400         entry lifetime (both tiers)
+    - AI_CACHE_DIR=                on-disk tier that survives restarts, e.g. .cache/ai
+                                   (default: empty = memory only)
+    - AI_CACHE_DISK_MAX_MB=512     on-disk tier size limit
+
+    Per-request control via the X-AI-Cache request header:
+      bypass  -> don't read or write the cache (also: Cache-Control: no-store)
+      refresh -> skip the lookup, store the fresh response (also: Cache-Control: no-cache)
+    Responses carry X-AI-Cache: HIT | MISS | BYPASS | REFRESH.
+
+Request coalescing:
+    - AI_COALESCE=1                concurrent identical /api/ai/* requests (same provider +
+                                   canonical payload) share one upstream call and its result
+                                   or error; X-AI-Cache: bypass opts out. Followers get
+                                   X-AI-Coalesced: 1; saved calls show in /api/dev/stats.
+
+History compaction (optional):
+    - AI_COMPACT=1                 before /api/ai/* calls, drop system blocks already sent
+                                   earlier in the conversation and fit the history into a
+                                   per-provider prompt budget (~4 chars per token)
+    - AI_COMPACT_BUDGETS=groq=4000,gemini=8000,ollama=3000
+                                   prompt token budget per provider (0 = only dedupe)
+    - AI_COMPACT_KEEP_TURNS=4      the last N user turns are never dropped
+    Over budget, the oldest turns are replaced by one "[N earlier messages omitted ...]"
+    system note; system prompts are always kept. If the kept turns alone are still too
+    long, older messages are cut in the middle. Responses carry X-AI-Tokens-Saved.
+
+Hedged requests (optional):
+    - AI_HEDGE_PROVIDER=ollama     if the primary provider hasn't answered by the hedge
+                                   deadline, send the same request to this provider too and
+                                   return whichever succeeds first (the other is cancelled)
+    - AI_HEDGE_PERCENTILE=95       deadline = this latency percentile of the primary provider
+    - AI_HEDGE_MIN_SAMPLES=20      until then, AI_HEDGE_DEFAULT_MS is used
+    - AI_HEDGE_DEFAULT_MS=8000
+    - AI_HEDGE_MIN_MS=500          lower bound for the deadline
+    The model id is mapped to the hedge provider's default model when it
+    belongs to another provider. Streaming requests are not hedged.
+
+Batch chat (POST /api/ai/chat/batch):
+    Body: {"requests": [<chat body>, ...], "stream": false} (or just the array).
+    Items run concurrently through the same pipeline as /api/ai/chat (cache,
+    coalescing, rate limits, routing); results come back in input order as
+    {"results": [{"index", "status", "provider", "cache", "tokens_saved", "duration_ms", "body"}], "summary"}.
+    With "stream": true (or Accept: application/x-ndjson) each result is sent
+    as an NDJSON line as soon as it completes, then a {"done": true, ...} line.
+    - AI_BATCH_MAX_ITEMS=64
+    - AI_BATCH_CONCURRENCY=groq=4,gemini=4,ollama=2
+                                   max items in flight per provider, across all batches
+
+Provider health (circuit breakers):
+    - AI_ROUTING_PROVIDERS=        (optional) e.g. groq,gemini,ollama: when the requested provider
+                                   is unhealthy or fails, try the others ranked by recent
+                                   error rate and latency (empty = requested provider only)
+    - AI_BREAKER_WINDOW_S=30       sliding window of recent calls per provider
+    - AI_BREAKER_MIN_CALLS=5       calls in the window before the breaker can open
+    - AI_BREAKER_ERROR_RATE=0.5    open at this share of failures (5xx, 401/403/408/429, network)
+    - AI_BREAKER_SLOW_MS=30000     calls at least this slow count as slow...
+    - AI_BREAKER_SLOW_RATE=0.5     ...and open the breaker at this share
+    - AI_BREAKER_OPEN_S=10         time before a half-open probe; doubles after a failed probe
+                                   (max 300 s)
+    While a breaker is open, calls to that provider fail immediately with 503
+    (which also triggers AI_FALLBACK_PROVIDER).
+
+Observability:
+    - GET /metrics                 Prometheus text format: per-route and per-provider latency
+                                   histograms, rate-limit waits, retries, fallbacks, token
+                                   usage, cache/pool counters, thread + connection gauges
+    - TIMING_LOG=                  (optional) one JSON line per request with its timing
+                                   breakdown: "-" = stderr, otherwise a file path
+
+Upstream connections:
+    - AI_POOL_MAX_IDLE=8           keep-alive connections kept per upstream host
+    - AI_POOL_IDLE_S=60            drop pooled connections idle longer than this
+
+Static files:
+    - STATIC_CACHE_MAX_MB=128      in-memory cache of file bytes + compressed variants
+    - STATIC_CACHE_MAX_FILE_MB=8   larger files are never cached or read into memory: they
+                                   are sent from disk with sendfile (zero-copy)
+    - STATIC_GZIP_MIN_BYTES=1024   smallest text asset worth compressing
+    - STATIC_CACHE_POLICIES="/assets/*=public, max-age=86400;*=no-cache"
+                                   Cache-Control per URL path glob, first match wins
+    Files are served with strong ETags + Last-Modified (304 on revalidation)
+    and support single byte ranges (Range / If-Range -> 206, 416).
+    Compressible types are negotiated via Accept-Encoding: a sibling
+    <file>.br / <file>.gz newer than the file is served as-is, otherwise
+    gzip (or brotli, if the `brotli` package is installed) is produced once
+    per file version and cached.
+
+Image derivatives (needs the optional `Pillow` package):
+    GET /assets/hero-gym.jpg?w=640&fmt=webp returns a resized, re-encoded copy of a
+    .jpg/.png/.webp file. w snaps up to the next IMAGE_WIDTHS step (never past the
+    source width); fmt is webp, avif, jpeg or png (default: the source format).
+    Variants are generated on first request by a worker pool and kept on disk,
+    keyed by the source's content hash, so they are served with
+    "Cache-Control: public, max-age=31536000, immutable". Without Pillow the
+    original file is served.
+    - IMAGE_DERIVATIVES=1          0 = ignore ?w= / ?fmt= and always serve the original
+    - IMAGE_CACHE_DIR=.cache/images
+    - IMAGE_WIDTHS=320,640,960,1280,1920
+    - IMAGE_QUALITY=75             JPEG/WebP/AVIF encoder quality
+    - IMAGE_WORKERS=4              concurrent encodes (default: min(4, CPU count))
+    Pre-generate every width at deploy time:
+      python3 dev-server.py pregenerate-images [--formats webp,jpeg] [--dir assets] [--prune]
+
+Dev endpoints:
+    - GET /api/dev/stats          static/AI cache, connection pool and rate limiter counters (JSON)
 """
 
 from __future__ import annotations
 
+import argparse
+import asyncio
+import gzip
+import hashlib
+import html
+import http.client
+import io
 import json
 import mimetypes
 import os
+import re
 import socket
+import ssl
+import sys
 import threading
 import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextvars import ContextVar
+from email.utils import formatdate, parsedate_to_datetime
+from fnmatch import fnmatchcase
+from http import HTTPStatus
 from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from pathlib import Path
-from urllib.request import Request, urlopen
-from urllib.error import HTTPError, URLError
+from urllib.error import URLError
+from urllib.parse import parse_qs, unquote, urlsplit
+
+try:
+    import brotli  # optional: on-the-fly .br for static files
+except ImportError:
+    brotli = None
+
+try:
+    from PIL import Image, ImageOps  # optional: responsive image derivatives
+    from PIL import features as pil_features
+except ImportError:
+    Image = ImageOps = pil_features = None
 
 ROOT_DIR = Path(__file__).resolve().parent
 
@@ -85,12 +246,17 @@ _load_dotenv_file(ROOT_DIR / ".env.local")
 
 PORT = int(os.environ.get("PORT", "3000"))
 HOST = os.environ.get("HOST", "0.0.0.0")
+SERVER_MODE = "asyncio" if str(os.environ.get("SERVER_MODE", "threads")).strip().lower() == "asyncio" else "threads"
+KEEPALIVE_TIMEOUT_S = max(1, int(os.environ.get("KEEPALIVE_TIMEOUT_S", "15")))
+ASYNC_BACKLOG = max(1, int(os.environ.get("ASYNC_BACKLOG", "1024")))
 
 AI_PROVIDER = str(os.environ.get("AI_PROVIDER", "groq")).strip().lower() or "groq"
 AI_FALLBACK_PROVIDER = str(os.environ.get("AI_FALLBACK_PROVIDER", "")).strip().lower()
 AI_MIN_INTERVAL_MS = max(0, int(os.environ.get("AI_MIN_INTERVAL_MS", "900")))
 AI_MAX_429_RETRIES = max(0, int(os.environ.get("AI_MAX_429_RETRIES", "2")))
 
+GROQ_BASE_URL = str(os.environ.get("GROQ_BASE_URL", "https://api.groq.com/openai/v1")).strip() or "https://api.groq.com/openai/v1"
+
 OLLAMA_URL = str(os.environ.get("OLLAMA_URL", "http://localhost:11434")).strip() or "http://localhost:11434"
 OLLAMA_DEFAULT_MODEL = str(os.environ.get("OLLAMA_MODEL", "qwen2.5:14b")).strip() or "qwen2.5:14b"
 
@@ -101,53 +267,1522 @@ GEMINI_API_KEY = (
 )
 GEMINI_BASE_URL = str(os.environ.get("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com/v1beta")).strip() or "https://generativelanguage.googleapis.com/v1beta"
 
-_ai_lock = threading.Lock()
-_last_ai_call_at = 0.0
+AI_CACHE_ENABLED = str(os.environ.get("AI_CACHE", "0")).strip().lower() in ("1", "true", "yes", "on")
+AI_CACHE_ALL = str(os.environ.get("AI_CACHE_ALL", "0")).strip().lower() in ("1", "true", "yes", "on")
+AI_CACHE_MAX_MB = max(0, int(os.environ.get("AI_CACHE_MAX_MB", "64")))
+AI_CACHE_TTL_S = max(0, int(os.environ.get("AI_CACHE_TTL_S", "86400")))
+AI_CACHE_DIR = str(os.environ.get("AI_CACHE_DIR", "")).strip()
+AI_CACHE_DISK_MAX_MB = max(0, int(os.environ.get("AI_CACHE_DISK_MAX_MB", "512")))
 
+AI_RATE_LIMITS = str(os.environ.get("AI_RATE_LIMITS", "groq=30/6000,gemini=15/250000,ollama=0/0")).strip()
+AI_RATE_MAX_WAIT_MS = max(0, int(os.environ.get("AI_RATE_MAX_WAIT_MS", "30000")))
 
-def _sleep(ms: int):
-    if ms > 0:
-        time.sleep(ms / 1000.0)
+STATIC_CACHE_MAX_MB = max(0, int(os.environ.get("STATIC_CACHE_MAX_MB", "128")))
+STATIC_CACHE_MAX_FILE_MB = max(0, int(os.environ.get("STATIC_CACHE_MAX_FILE_MB", "8")))
+STATIC_GZIP_MIN_BYTES = max(0, int(os.environ.get("STATIC_GZIP_MIN_BYTES", "1024")))
+STATIC_CACHE_POLICIES = str(os.environ.get("STATIC_CACHE_POLICIES", "/assets/*=public, max-age=86400;*=no-cache")).strip()
 
+IMAGE_DERIVATIVES = str(os.environ.get("IMAGE_DERIVATIVES", "1")).strip().lower() in ("1", "true", "yes", "on")
+IMAGE_CACHE_DIR = str(os.environ.get("IMAGE_CACHE_DIR", ".cache/images")).strip() or ".cache/images"
+IMAGE_WIDTHS = str(os.environ.get("IMAGE_WIDTHS", "320,640,960,1280,1920")).strip()
+IMAGE_QUALITY = min(100, max(1, int(os.environ.get("IMAGE_QUALITY", "75"))))
+IMAGE_WORKERS = max(1, int(os.environ.get("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+AI_COALESCE = str(os.environ.get("AI_COALESCE", "1")).strip().lower() in ("1", "true", "yes", "on")
+
+AI_HEDGE_PROVIDER = str(os.environ.get("AI_HEDGE_PROVIDER", "")).strip().lower()
+AI_HEDGE_PERCENTILE = min(99.9, max(1.0, float(os.environ.get("AI_HEDGE_PERCENTILE", "95"))))
+AI_HEDGE_MIN_SAMPLES = max(1, int(os.environ.get("AI_HEDGE_MIN_SAMPLES", "20")))
+AI_HEDGE_DEFAULT_MS = max(0, int(os.environ.get("AI_HEDGE_DEFAULT_MS", "8000")))
+AI_HEDGE_MIN_MS = max(0, int(os.environ.get("AI_HEDGE_MIN_MS", "500")))
+
+TIMING_LOG = str(os.environ.get("TIMING_LOG", "")).strip()
+
+AI_BATCH_MAX_ITEMS = max(1, int(os.environ.get("AI_BATCH_MAX_ITEMS", "64")))
+AI_BATCH_CONCURRENCY = str(os.environ.get("AI_BATCH_CONCURRENCY", "groq=4,gemini=4,ollama=2")).strip()
+
+AI_COMPACT = str(os.environ.get("AI_COMPACT", "0")).strip().lower() in ("1", "true", "yes", "on")
+AI_COMPACT_BUDGETS = str(os.environ.get("AI_COMPACT_BUDGETS", "groq=4000,gemini=8000,ollama=3000")).strip()
+AI_COMPACT_KEEP_TURNS = max(1, int(os.environ.get("AI_COMPACT_KEEP_TURNS", "4")))
+
+AI_ROUTING_PROVIDERS = [p.strip().lower() for p in str(os.environ.get("AI_ROUTING_PROVIDERS", "")).split(",") if p.strip()]
+AI_BREAKER_WINDOW_S = max(1.0, float(os.environ.get("AI_BREAKER_WINDOW_S", "30")))
+AI_BREAKER_MIN_CALLS = max(1, int(os.environ.get("AI_BREAKER_MIN_CALLS", "5")))
+AI_BREAKER_ERROR_RATE = min(1.0, max(0.01, float(os.environ.get("AI_BREAKER_ERROR_RATE", "0.5"))))
+AI_BREAKER_SLOW_MS = max(1, int(os.environ.get("AI_BREAKER_SLOW_MS", "30000")))
+AI_BREAKER_SLOW_RATE = min(1.0, max(0.01, float(os.environ.get("AI_BREAKER_SLOW_RATE", "0.5"))))
+AI_BREAKER_OPEN_S = max(0.1, float(os.environ.get("AI_BREAKER_OPEN_S", "10")))
+
+GROQ_DEFAULT_MODEL = "llama-3.3-70b-versatile"
+GEMINI_DEFAULT_MODEL = "gemini-2.0-flash"
+
+AI_POOL_MAX_IDLE = max(0, int(os.environ.get("AI_POOL_MAX_IDLE", "8")))
+AI_POOL_IDLE_S = max(0.0, float(os.environ.get("AI_POOL_IDLE_S", "60")))
+
+
+class TokenBucket:
+    """Classic token bucket; takes may overdraw it so waiters queue up in order."""
+
+    def __init__(self, capacity: float, per_second: float):
+        self.capacity = float(capacity)
+        self.rate = float(per_second)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """Seconds until `amount` tokens are available (amount is capped at capacity)."""
+        deficit = min(amount, self.capacity) - self.tokens
+        return max(0.0, deficit / self.rate) if self.rate > 0 else 0.0
+
+    def take(self, amount: float):
+        self.tokens -= amount
+
+    def give(self, amount: float):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class RateLimiter:
+    """Independent request + token buckets per (provider, API key).
+
+    acquire() reserves capacity under a short per-bucket lock and awaits the
+    wait *outside* it, so callers only ever wait on their own provider/key.
+    observe() adapts the buckets to what the upstream reports: Retry-After
+    on 429, and x-ratelimit-remaining-*/x-ratelimit-reset-* headers; it also
+    refunds the difference between the estimated and the actual token usage.
+    """
+
+    def __init__(self, limits: dict[str, tuple[int, int]], min_interval_ms: int, max_wait_ms: int):
+        self.limits = limits
+        self.min_interval_s = min_interval_ms / 1000.0
+        self.max_wait_s = max_wait_ms / 1000.0
+        self._limiters: dict[tuple[str, str], dict] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def parse_limits(spec: str) -> dict[str, tuple[int, int]]:
+        """Parse "groq=30/6000,gemini=15/250000" into {provider: (rpm, tpm)}."""
+        limits: dict[str, tuple[int, int]] = {}
+        for item in spec.split(","):
+            if "=" not in item:
+                continue
+            provider, value = item.split("=", 1)
+            rpm, _, tpm = value.partition("/")
+            try:
+                limits[provider.strip().lower()] = (max(0, int(rpm or 0)), max(0, int(tpm or 0)))
+            except ValueError:
+                continue
+        return limits
+
+    async def acquire(self, provider: str, key_id: str, tokens: int) -> dict:
+        """Wait for capacity; return the reservation to pass to observe()."""
+        reservation = {"provider": provider, "key": key_id, "tokens": tokens, "waited_ms": 0}
+        limiter = self._limiter(provider, key_id)
+        if limiter is None:
+            return reservation
+
+        with limiter["lock"]:
+            now = time.monotonic()
+            for bucket in (limiter["requests"], limiter["tokens"]):
+                if bucket is not None:
+                    bucket.refill(now)
+            start = max(now, limiter["blocked_until"], limiter["next_slot"])
+            wait = start - now
+            if limiter["requests"] is not None:
+                wait = max(wait, limiter["requests"].wait_for(1))
+            if limiter["tokens"] is not None:
+                wait = max(wait, limiter["tokens"].wait_for(tokens))
+
+            if wait > self.max_wait_s:
+                limiter["rejected"] += 1
+                raise UpstreamError(
+                    429,
+                    {"error": f"Rate limit for {provider}: retry in {wait:.1f}s", "retry_after_ms": int(wait * 1000)},
+                    "Local rate limit",
+                )
+
+            if limiter["requests"] is not None:
+                limiter["requests"].take(1)
+            if limiter["tokens"] is not None:
+                limiter["tokens"].take(tokens)
+            limiter["next_slot"] = now + wait + self.min_interval_s
+            limiter["acquired"] += 1
+            limiter["waited_ms"] += int(wait * 1000)
+
+        if wait > 0:
+            await asyncio.sleep(wait)
+        reservation["waited_ms"] = int(wait * 1000)
+        return reservation
+
+    def observe(self, reservation: dict, status: int, headers, used_tokens: int | None = None, attempt: int = 0):
+        limiter = self._limiter(reservation["provider"], reservation["key"])
+        if limiter is None:
+            return
+
+        now = time.monotonic()
+        with limiter["lock"]:
+            if used_tokens is not None and limiter["tokens"] is not None:
+                limiter["tokens"].give(reservation["tokens"] - used_tokens)
+
+            for kind in ("requests", "tokens"):
+                bucket = limiter[kind]
+                remaining = _header_number(headers, f"x-ratelimit-remaining-{kind}")
+                if bucket is None or remaining is None:
+                    continue
+                bucket.refill(now)
+                bucket.tokens = min(bucket.tokens, remaining)
+                if remaining <= 0:
+                    reset_s = _parse_duration_s(headers.get(f"x-ratelimit-reset-{kind}") if headers else None)
+                    if reset_s:
+                        limiter["blocked_until"] = max(limiter["blocked_until"], now + reset_s)
+
+            if status == 429:
+                limiter["throttled"] += 1
+                limiter["blocked_until"] = max(limiter["blocked_until"], now + _retry_after_ms(headers, attempt) / 1000.0)
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            items = list(self._limiters.items())
+        for (provider, key_id), limiter in items:
+            with limiter["lock"]:
+                for bucket in (limiter["requests"], limiter["tokens"]):
+                    if bucket is not None:
+                        bucket.refill(now)
+                out[f"{provider}:{key_id}"] = {
+                    "rpm": self.limits[provider][0],
+                    "tpm": self.limits[provider][1],
+                    "requests_available": round(limiter["requests"].tokens, 2) if limiter["requests"] else None,
+                    "tokens_available": round(limiter["tokens"].tokens) if limiter["tokens"] else None,
+                    "blocked_for_ms": max(0, int((limiter["blocked_until"] - now) * 1000)),
+                    "acquired": limiter["acquired"],
+                    "waited_ms": limiter["waited_ms"],
+                    "rejected": limiter["rejected"],
+                    "throttled": limiter["throttled"],
+                }
+        return out
+
+    def enforces(self, provider: str) -> bool:
+        """False for providers configured 0/0 (or not at all): observe() keeps no backoff state for them."""
+        rpm, tpm = self.limits.get(provider, (0, 0))
+        return bool(rpm or tpm)
+
+    def _limiter(self, provider: str, key_id: str) -> dict | None:
+        if not self.enforces(provider):
+            return None
+        rpm, tpm = self.limits[provider]
+        with self._lock:
+            limiter = self._limiters.get((provider, key_id))
+            if limiter is None:
+                limiter = {
+                    "lock": threading.Lock(),
+                    "requests": TokenBucket(rpm, rpm / 60.0) if rpm else None,
+                    "tokens": TokenBucket(tpm, tpm / 60.0) if tpm else None,
+                    "blocked_until": 0.0,
+                    "next_slot": 0.0,
+                    "acquired": 0,
+                    "waited_ms": 0,
+                    "rejected": 0,
+                    "throttled": 0,
+                }
+                self._limiters[(provider, key_id)] = limiter
+            return limiter
+
+
+_rate_limiter = RateLimiter(RateLimiter.parse_limits(AI_RATE_LIMITS), AI_MIN_INTERVAL_MS, AI_RATE_MAX_WAIT_MS)
+
+
+def _parse_provider_ints(spec: str, minimum: int = 1) -> dict[str, int]:
+    """Parse "groq=4,ollama=2" into {provider: value}; values are clamped to minimum."""
+    values: dict[str, int] = {}
+    for item in spec.split(","):
+        provider, _, value = item.partition("=")
+        try:
+            values[provider.strip().lower()] = max(minimum, int(value))
+        except ValueError:
+            continue
+    return values
+
+
+def _header_number(headers, name: str) -> float | None:
+    try:
+        value = headers.get(name) if headers else None
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_duration_s(value: str | None) -> float | None:
+    """Parse rate-limit reset values like "7.66s", "2m59.56s", "450ms" or plain seconds."""
+    if not value:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        return None
+    return sum(float(number) * units[unit] for number, unit in parts)
+
+
+def _api_key_id(provider: str) -> str:
+    """Short non-reversible id of the API key in use, so each key gets its own buckets."""
+    if provider == "groq":
+        secret = str(os.environ.get("GROQ_API_KEY") or "")
+    elif provider == "gemini":
+        secret = GEMINI_API_KEY
+    else:
+        secret = ""
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()[:8] if secret else "-"
+
+
+def _approx_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def _estimate_request_tokens(payload: dict) -> int:
+    """Prompt estimate + max_tokens: an upper bound reserved before the call."""
+    messages = payload.get("messages") if isinstance(payload.get("messages"), list) else []
+    prompt = sum(_approx_tokens(str((m or {}).get("content") or "")) for m in messages)
+    max_tokens = payload.get("max_tokens") if isinstance(payload.get("max_tokens"), int) else 2048
+    return prompt + max_tokens
+
+
+def _usage_tokens(data: object) -> int | None:
+    try:
+        total = ((data or {}).get("usage") or {}).get("total_tokens")
+        return int(total) if total else None
+    except Exception:
+        return None
+
+
+# Chat-template tokens each message costs on top of its text (role markers, separators)
+_MESSAGE_OVERHEAD_TOKENS = {"groq": 4, "gemini": 3, "ollama": 5}
+_COMPACT_MARKER = "[{count} earlier messages omitted to fit the context budget]"
 
-def _throttle_ai_calls():
-    global _last_ai_call_at
-    if AI_MIN_INTERVAL_MS <= 0:
-        return
-    with _ai_lock:
-        now = time.monotonic() * 1000.0
-        wait_ms = max(0.0, float(AI_MIN_INTERVAL_MS) - (now - _last_ai_call_at))
-        if wait_ms > 0:
-            _sleep(int(wait_ms))
-        _last_ai_call_at = time.monotonic() * 1000.0
 
+def _message_role(message: object) -> str:
+    return str(message.get("role") or "").strip().lower() if isinstance(message, dict) else ""
 
-def _http_post_json(url: str, payload: dict, headers: dict | None = None, timeout: int = 60):
-    req = Request(
+
+def _message_text(message: object) -> str:
+    """Text of a chat message; multimodal content contributes its text parts."""
+    content = message.get("content") if isinstance(message, dict) else None
+    if isinstance(content, list):
+        return "\n".join(str(part.get("text") or "") for part in content if isinstance(part, dict))
+    return str(content or "")
+
+
+def _message_tokens(message: object, provider: str) -> int:
+    return _MESSAGE_OVERHEAD_TOKENS.get(provider, 4) + _approx_tokens(_message_text(message))
+
+
+def _truncate_middle(text: str, max_chars: int) -> str:
+    """Keep the head and tail of text, dropping the middle to fit max_chars."""
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    return f"{text[:head]}\n[... trimmed ...]\n{text[len(text) - (max_chars - head):]}"
+
+
+def _dedupe_system_blocks(messages: list) -> tuple[list, int]:
+    """Drop system blocks (paragraphs) already sent in an earlier system message."""
+    seen: set[str] = set()
+    out = []
+    removed = 0
+    for message in messages:
+        if _message_role(message) == "system" and isinstance(message.get("content"), str):
+            blocks = [block for block in re.split(r"\n\s*\n", message["content"]) if block.strip()]
+            kept = []
+            for block in blocks:
+                key = " ".join(block.split())
+                if key in seen:
+                    removed += 1
+                    continue
+                seen.add(key)
+                kept.append(block)
+            if not kept:
+                continue
+            if len(kept) != len(blocks):
+                message = {**message, "content": "\n\n".join(kept)}
+        out.append(message)
+    return out, removed
+
+
+def _compact_messages(messages: list, provider: str, budget: int, keep_turns: int) -> tuple[list, dict]:
+    """Fit a chat history into about budget prompt tokens.
+
+    Repeated system blocks are dropped first. If the history is still over
+    budget, whole turns (a user message and the replies that follow it) are
+    dropped oldest first and replaced by one marker message; system messages
+    and the last keep_turns turns are always kept. As a last resort, long
+    messages other than the final turn are cut in the middle. budget 0 only
+    dedupes.
+    """
+    out, deduped = _dedupe_system_blocks(messages)
+    stats = {"system_blocks_deduped": deduped, "messages_dropped": 0, "messages_trimmed": 0}
+    tokens = [_message_tokens(m, provider) for m in out]
+    total = sum(tokens)
+    if not budget or total <= budget:
+        return out, stats
+
+    turn_starts = [i for i, m in enumerate(out) if _message_role(m) == "user"]
+    cutoff = turn_starts[-keep_turns] if len(turn_starts) > keep_turns else 0
+    marker_tokens = _message_tokens({"content": _COMPACT_MARKER.format(count=0)}, provider)
+    dropped: set[int] = set()
+    for i in range(cutoff):
+        if _message_role(out[i]) == "system":
+            continue
+        # Only stop at a turn boundary, so no reply loses the message it answers
+        if _message_role(out[i]) == "user" and total + marker_tokens <= budget:
+            break
+        dropped.add(i)
+        total -= tokens[i]
+    if dropped:
+        first = min(dropped)
+        marker = {"role": "system", "content": _COMPACT_MARKER.format(count=len(dropped))}
+        kept = [(m, t) for i, (m, t) in enumerate(zip(out, tokens)) if i not in dropped]
+        kept.insert(first, (marker, marker_tokens))
+        out, tokens = [m for m, _ in kept], [t for _, t in kept]
+        total += marker_tokens
+        stats["messages_dropped"] = len(dropped)
+
+    last_turn = max((i for i, m in enumerate(out) if _message_role(m) == "user"), default=len(out))
+    candidates = sorted((i for i in range(last_turn) if _message_role(out[i]) != "system" and isinstance(out[i], dict) and isinstance(out[i].get("content"), str)), key=lambda i: -tokens[i])
+    for i in candidates:
+        excess = total - budget
+        if excess <= 0:
+            break
+        # ~4 characters per token, as in _approx_tokens; keep at least a short excerpt
+        max_chars = max(200, (tokens[i] - excess) * 4)
+        text = out[i]["content"]
+        if len(text) <= max_chars:
+            continue
+        out[i] = {**out[i], "content": _truncate_middle(text, max_chars)}
+        new_tokens = _message_tokens(out[i], provider)
+        total -= tokens[i] - new_tokens
+        tokens[i] = new_tokens
+        stats["messages_trimmed"] += 1
+    return out, stats
+
+
+_compact_budgets = _parse_provider_ints(AI_COMPACT_BUDGETS, minimum=0)
+_compaction_counters = {"requests": 0, "compacted": 0, "system_blocks_deduped": 0, "messages_dropped": 0, "messages_trimmed": 0, "tokens_saved": 0}
+
+
+def _compact_payload(provider: str, payload: dict) -> int | None:
+    """Apply AI_COMPACT to payload["messages"]; return the tokens saved, or None when compaction is off."""
+    if not AI_COMPACT:
+        return None
+    messages = payload["messages"]
+    compacted, stats = _compact_messages(messages, provider, _compact_budgets.get(provider, 0), AI_COMPACT_KEEP_TURNS)
+    saved = max(0, sum(_message_tokens(m, provider) for m in messages) - sum(_message_tokens(m, provider) for m in compacted))
+    payload["messages"] = compacted
+
+    _compaction_counters["requests"] += 1
+    for name, n in stats.items():
+        _compaction_counters[name] += n
+    if saved:
+        _compaction_counters["compacted"] += 1
+        _compaction_counters["tokens_saved"] += saved
+        _metrics.inc("devserver_ai_compaction_tokens_saved_total", saved, provider=provider)
+    _trace(tokens_saved=saved)
+    return saved
+
+
+async def _acquire_rate_limit(provider: str, payload: dict) -> dict:
+    reservation = await _rate_limiter.acquire(provider, _api_key_id(provider), _estimate_request_tokens(payload))
+    if reservation["waited_ms"]:
+        _trace_add("rate_wait_ms", reservation["waited_ms"])
+    return reservation
+
+
+class ConnectionPool:
+    """Persistent upstream HTTP(S) connections, keyed by (scheme, host, port).
+
+    All upstream I/O runs on one asyncio event loop (the server loop in
+    asyncio mode, a background loop in threads mode), so a pending AI call
+    costs a coroutine and a socket, not a parked thread. Requests borrow a
+    connection and hand it back once the response has been read in full, so
+    Groq/Gemini calls skip DNS + TCP + TLS setup and Ollama calls skip the
+    localhost reconnect. Idle connections are checked before reuse (older
+    than idle_s, or already closed by the server, means discard) and at
+    most max_idle are kept per host.
+    """
+
+    def __init__(self, max_idle: int, idle_s: float):
+        self.max_idle = max_idle
+        self.idle_s = idle_s
+        self._idle: dict[tuple, list[tuple[asyncio.StreamReader, asyncio.StreamWriter, float]]] = {}
+        self._ssl_context = ssl.create_default_context()
+        self.counters = {"hits": 0, "misses": 0, "stale": 0, "retries": 0, "released": 0, "closed": 0}
+
+    @staticmethod
+    def split(url: str) -> tuple[tuple, str]:
+        """Return ((scheme, host, port), path-with-query) for url."""
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == "https" else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+        return (scheme, parts.hostname, port), path
+
+    async def acquire(self, key: tuple, timeout: float) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, bool]:
+        """Return (reader, writer, reused)."""
+        now = time.monotonic()
+        idle = self._idle.get(key) or []
+        while idle:
+            reader, writer, released_at = idle.pop()
+            if now - released_at <= self.idle_s and not reader.at_eof() and not writer.is_closing():
+                self.counters["hits"] += 1
+                return reader, writer, True
+            self.counters["stale"] += 1
+            writer.close()
+        self.counters["misses"] += 1
+
+        scheme, host, port = key
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self._ssl_context if scheme == "https" else None),
+            timeout,
+        )
+        return reader, writer, False
+
+    def release(self, key: tuple, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        idle = self._idle.setdefault(key, [])
+        if writer.is_closing() or len(idle) >= self.max_idle:
+            self.counters["closed"] += 1
+            writer.close()
+            return
+        self.counters["released"] += 1
+        idle.append((reader, writer, time.monotonic()))
+
+    def stats(self) -> dict:
+        return {
+            **self.counters,
+            "idle": {f"{scheme}://{host}:{port}": len(conns) for (scheme, host, port), conns in list(self._idle.items())},
+            "max_idle": self.max_idle,
+            "idle_s": self.idle_s,
+        }
+
+
+_pool = ConnectionPool(AI_POOL_MAX_IDLE, AI_POOL_IDLE_S)
+
+
+class UpstreamResponse:
+    """HTTP/1.1 response read incrementally from a pooled connection.
+
+    The connection goes back to the pool on close() only if the body was
+    read to the end and the server didn't ask to close; otherwise it is
+    dropped. Every read is bounded by the request timeout.
+    """
+
+    def __init__(self, key: tuple, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, status: int, headers, timeout: float):
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.status = status
+        self.headers = headers
+        self.timeout = timeout
+        self.chunked = "chunked" in str(headers.get("Transfer-Encoding") or "").lower()
+        length = headers.get("Content-Length")
+        self.length = int(length) if length is not None and not self.chunked else None
+        self.will_close = str(headers.get("Connection") or "").lower() == "close" or (
+            not self.chunked and self.length is None and status not in (204, 304)
+        )
+        self.complete = status in (204, 304) or self.length == 0
+        self._closed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+    async def pieces(self):
+        """Yield body bytes as they arrive (chunked, Content-Length or until EOF)."""
+        read = lambda aw: asyncio.wait_for(aw, self.timeout)  # noqa: E731
+        if self.complete:
+            return
+        if self.chunked:
+            while True:
+                size_line = await read(self.reader.readline())
+                if not size_line:
+                    raise ConnectionResetError("Upstream closed mid-body")
+                size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+                if size == 0:
+                    # Trailers end with an empty line
+                    while (await read(self.reader.readline())).strip():
+                        pass
+                    break
+                yield await read(self.reader.readexactly(size))
+                await read(self.reader.readexactly(2))
+        elif self.length is not None:
+            remaining = self.length
+            while remaining > 0:
+                data = await read(self.reader.read(min(65536, remaining)))
+                if not data:
+                    raise ConnectionResetError("Upstream closed mid-body")
+                remaining -= len(data)
+                yield data
+        else:
+            while True:
+                data = await read(self.reader.read(65536))
+                if not data:
+                    break
+                yield data
+        self.complete = True
+
+    async def read(self) -> bytes:
+        try:
+            return b"".join([piece async for piece in self.pieces()])
+        finally:
+            self.close()
+
+    async def lines(self):
+        """Yield the body line by line (for SSE and NDJSON)."""
+        buffer = b""
+        async for piece in self.pieces():
+            buffer += piece
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                yield line
+        if buffer:
+            yield buffer
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.complete and not self.will_close:
+            _pool.release(self.key, self.reader, self.writer)
+        else:
+            self.writer.close()
+
+
+async def _upstream_post(url: str, body: bytes, headers: dict, timeout: float) -> UpstreamResponse:
+    """POST body over a pooled connection and return the response once its headers arrive.
+
+    A reused connection the server already dropped fails on send or on the
+    status line; that attempt is retried once on a fresh connection.
+    Network failures are raised as URLError, as urlopen used to.
+    """
+    key, path = _pool.split(url)
+    scheme, host, port = key
+    host_header = host if port == (443 if scheme == "https" else 80) else f"{host}:{port}"
+    head = {
+        "Host": host_header,
+        "User-Agent": "GRPerform/1.0 (Python dev-server)",
+        "Accept-Encoding": "identity",
+        "Connection": "keep-alive",
+        **headers,
+        "Content-Length": str(len(body)),
+    }
+    request = (f"POST {path} HTTP/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in head.items()) + "\r\n").encode("latin-1") + body
+
+    while True:
+        try:
+            reader, writer, reused = await _pool.acquire(key, timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise URLError(e) from e
+        try:
+            writer.write(request)
+            await writer.drain()
+            raw_head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), timeout)
+            status_line, _, header_block = raw_head.partition(b"\r\n")
+            status = int(status_line.split(None, 2)[1])
+            return UpstreamResponse(key, reader, writer, status, http.client.parse_headers(io.BytesIO(header_block)), timeout)
+        except (ConnectionResetError, BrokenPipeError, asyncio.IncompleteReadError) as e:
+            writer.close()
+            if reused:
+                _pool.counters["retries"] += 1
+                continue
+            raise URLError(e) from e
+        except (OSError, asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError, IndexError) as e:
+            writer.close()
+            raise URLError(e) from e
+        except asyncio.CancelledError:
+            # e.g. a hedged call that lost the race: the response can't be read any more
+            writer.close()
+            raise
+
+
+def _json_or_raw(raw: bytes) -> object:
+    text = raw.decode("utf-8", "replace")
+    try:
+        return json.loads(text) if text else {"raw": text}
+    except Exception:
+        return {"raw": text}
+
+
+async def _http_post_json(url: str, payload: dict, headers: dict | None = None, timeout: int = 60):
+    resp = await _upstream_post(
         url,
-        data=json.dumps(payload).encode("utf-8"),
-        headers={"Content-Type": "application/json", **(headers or {})},
-        method="POST",
+        json.dumps(payload).encode("utf-8"),
+        {"Content-Type": "application/json", **(headers or {})},
+        timeout,
     )
     try:
-        with urlopen(req, timeout=timeout) as resp:
-            body = resp.read().decode("utf-8")
+        raw = await resp.read()
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError) as e:
+        raise URLError(e) from e
+    return resp.status, _json_or_raw(raw), resp.headers
+
+
+class ResponseCache:
+    """Two-tier cache for AI proxy responses, keyed by a hash of provider + payload.
+
+    - Memory tier: LRU over serialized response bytes, bounded by total size.
+    - Disk tier (optional): one file per key under disk_dir, survives restarts;
+      the file mtime is the store time, oldest files are pruned past max size.
+    Both tiers expire entries after ttl_s seconds.
+    """
+
+    def __init__(self, max_bytes: int, ttl_s: int, disk_dir: Path | None = None, disk_max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._disk_writes = 0
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expired": 0}
+
+    @staticmethod
+    def key(provider: str, payload: dict) -> str:
+        """Canonical hash: sorted keys, compact separators, numbers normalized."""
+        normalized = dict(payload)
+        if isinstance(normalized.get("temperature"), (int, float)):
+            normalized["temperature"] = float(normalized["temperature"])
+        canonical = json.dumps(
+            {"provider": provider, "payload": normalized},
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> tuple[bytes, float] | None:
+        """Return (body, age_seconds) or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, body = entry
+                if now - stored_at <= self.ttl_s:
+                    self._entries.move_to_end(key)
+                    self.counters["hits"] += 1
+                    return body, now - stored_at
+                self._drop(key)
+                self.counters["expired"] += 1
+
+        found = self._disk_get(key, now)
+        with self._lock:
+            if found is None:
+                self.counters["misses"] += 1
+                return None
+            body, stored_at = found
+            self.counters["disk_hits"] += 1
+            self._insert(key, stored_at, body)
+        return body, now - stored_at
+
+    def put(self, key: str, body: bytes):
+        now = time.time()
+        with self._lock:
+            self.counters["stores"] += 1
+            self._insert(key, now, body)
+        self._disk_put(key, body)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_s": self.ttl_s,
+                "disk_dir": str(self.disk_dir) if self.disk_dir else None,
+            }
+
+    def _insert(self, key: str, stored_at: float, body: bytes):
+        if len(body) > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (stored_at, body)
+        self._bytes += len(body)
+        while self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.counters["evictions"] += 1
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+    def _disk_path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str, now: float) -> tuple[bytes, float] | None:
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            stored_at = path.stat().st_mtime
+            if now - stored_at > self.ttl_s:
+                path.unlink(missing_ok=True)
+                return None
+            return path.read_bytes(), stored_at
+        except OSError:
+            return None
+
+    def _disk_put(self, key: str, body: bytes):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp.write_bytes(body)
+            os.replace(tmp, path)
+        except OSError:
+            # Best-effort only; the memory tier still works.
+            return
+        self._disk_writes += 1
+        if self._disk_writes % 50 == 0:
+            self._disk_prune()
+
+    def _disk_prune(self):
+        """Drop expired files, then the oldest ones until under disk_max_bytes."""
+        now = time.time()
+        files = []
+        for path in self.disk_dir.glob("*/*.json"):
             try:
-                data = json.loads(body)
-            except Exception:
-                data = {"raw": body}
-            return int(resp.status), data, resp.headers
-    except HTTPError as e:
-        raw = ""
+                st = path.stat()
+            except OSError:
+                continue
+            if now - st.st_mtime > self.ttl_s:
+                path.unlink(missing_ok=True)
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+
+
+def _cache_dir(raw: str) -> Path | None:
+    if not raw:
+        return None
+    path = Path(raw)
+    return path if path.is_absolute() else ROOT_DIR / path
+
+
+_response_cache = (
+    ResponseCache(
+        AI_CACHE_MAX_MB * 1024 * 1024,
+        AI_CACHE_TTL_S,
+        disk_dir=_cache_dir(AI_CACHE_DIR),
+        disk_max_bytes=AI_CACHE_DISK_MAX_MB * 1024 * 1024,
+    )
+    if AI_CACHE_ENABLED
+    else None
+)
+
+
+class SingleFlight:
+    """Coalesce concurrent identical upstream calls onto one in-flight task.
+
+    The first caller for a key starts the call; callers arriving while it is
+    pending await the same task and get its result or its exception. The key
+    is dropped as soon as the call settles, so nothing is served after the
+    fact (that's ResponseCache's job). All callers run on one event loop, so
+    no lock is needed.
+    """
+
+    def __init__(self):
+        self._calls: dict[str, asyncio.Task] = {}
+        self._waiters: dict[str, int] = {}
+        # calls: upstream calls started; saved: requests served by joining one
+        self.counters = {"calls": 0, "saved": 0, "errors": 0, "max_waiters": 0}
+
+    async def do(self, key: str, fn) -> tuple[object, bool]:
+        """Return (result, shared); shared is True when another caller's call was reused."""
+        task = self._calls.get(key)
+        if task is not None:
+            self.counters["saved"] += 1
+            self._waiters[key] += 1
+            self.counters["max_waiters"] = max(self.counters["max_waiters"], self._waiters[key])
+            # shield: a follower going away must not cancel the shared call
+            return await asyncio.shield(task), True
+
+        task = asyncio.ensure_future(fn())
+        self._calls[key] = task
+        self._waiters[key] = 1
+        self.counters["calls"] += 1
+        task.add_done_callback(lambda t: self._settled(key, t))
+        return await asyncio.shield(task), False
+
+    def _settled(self, key: str, task: asyncio.Task):
+        self._calls.pop(key, None)
+        self._waiters.pop(key, None)
+        # Reading the exception also keeps asyncio from logging it when every waiter is gone
+        if task.cancelled() or task.exception() is not None:
+            self.counters["errors"] += 1
+
+    def stats(self) -> dict:
+        return {**self.counters, "in_flight": len(self._calls)}
+
+
+_single_flight = SingleFlight() if AI_COALESCE else None
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with fixed buckets (seconds), Prometheus-style.
+
+    percentile() interpolates linearly inside the bucket that holds the
+    rank, like histogram_quantile(); past the last finite bucket it returns
+    that bucket's upper bound.
+    """
+
+    BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 12.0, 20.0, 30.0, 60.0, 120.0)
+
+    def __init__(self, buckets: tuple[float, ...] | None = None):
+        if buckets is not None:
+            self.BUCKETS = buckets
+        self.counts = [0] * (len(self.BUCKETS) + 1)  # last slot: +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = next((i for i, bound in enumerate(self.BUCKETS) if seconds <= bound), len(self.BUCKETS))
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def percentile(self, q: float) -> float | None:
+        with self._lock:
+            if not self.count:
+                return None
+            rank = self.count * q / 100.0
+            seen = 0
+            for index, n in enumerate(self.counts):
+                if n and seen + n >= rank:
+                    if index == len(self.BUCKETS):
+                        return self.BUCKETS[-1]
+                    lower = self.BUCKETS[index - 1] if index else 0.0
+                    return lower + (self.BUCKETS[index] - lower) * (rank - seen) / n
+                seen += n
+            return self.BUCKETS[-1]
+
+    def cumulative(self) -> tuple[list[tuple[str, int]], float, int]:
+        """([(le, cumulative count), ...], sum, count) for the Prometheus exposition."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        out, running = [], 0
+        for bound, n in zip((*(f"{b:g}" for b in self.BUCKETS), "+Inf"), counts):
+            running += n
+            out.append((bound, running))
+        return out, total, count
+
+    def stats(self) -> dict:
+        p50, p95, p99 = (self.percentile(q) for q in (50, 95, 99))
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000) if self.count else None,
+            "p50_ms": round(p50 * 1000) if p50 is not None else None,
+            "p95_ms": round(p95 * 1000) if p95 is not None else None,
+            "p99_ms": round(p99 * 1000) if p99 is not None else None,
+        }
+
+
+# Successful call latency per provider (rate-limit queueing included: it's what callers wait)
+_latency = {provider: LatencyHistogram() for provider in ("groq", "ollama", "gemini")}
+_hedge_counters = {"fired": 0, "primary_won": 0, "hedge_won": 0, "both_failed": 0}
+
+
+class Metrics:
+    """Labelled counters, gauges and histograms rendered as Prometheus text (format 0.0.4).
+
+    Components that already keep their own counters (rate limiter, caches,
+    pool, ...) are exported from their stats() at scrape time instead.
+    """
+
+    HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+    HELP = {
+        "devserver_http_requests_total": ("counter", "HTTP requests served, by route, method and status."),
+        "devserver_http_request_duration_seconds": ("histogram", "Time to serve a request (streams: until the last byte), by route."),
+        "devserver_http_requests_in_flight": ("gauge", "Requests currently being served."),
+        "devserver_open_connections": ("gauge", "Open client connections."),
+        "devserver_threads": ("gauge", "Live Python threads."),
+        "devserver_ai_provider_latency_seconds": ("histogram", "AI provider call latency, rate-limit waits included."),
+        "devserver_ai_upstream_responses_total": ("counter", "Upstream AI responses, by provider and HTTP status."),
+        "devserver_ai_retries_total": ("counter", "Upstream calls retried after a 429, by provider."),
+        "devserver_ai_fallbacks_total": ("counter", "Requests answered by the fallback provider after an upstream error."),
+        "devserver_ai_tokens_total": ("counter", "Tokens reported by upstream usage blocks, by provider and type."),
+        "devserver_ai_rate_limit_acquired_total": ("counter", "Rate limiter reservations granted."),
+        "devserver_ai_rate_limit_throttled_total": ("counter", "Reservations that had to wait."),
+        "devserver_ai_rate_limit_rejected_total": ("counter", "Requests rejected because the wait would exceed AI_RATE_MAX_WAIT_MS."),
+        "devserver_ai_rate_limit_wait_seconds_total": ("counter", "Time spent waiting in the rate limiter."),
+        "devserver_ai_hedges_total": ("counter", "Hedged request outcomes."),
+        "devserver_ai_failovers_total": ("counter", "Requests served by another provider than the requested one (health routing)."),
+        "devserver_ai_breaker_state": ("gauge", "Circuit breaker state per provider: 0 closed, 1 half-open, 2 open."),
+        "devserver_ai_breaker_opened_total": ("counter", "Times a provider's circuit breaker opened."),
+        "devserver_ai_breaker_rejected_total": ("counter", "Calls rejected by an open circuit breaker."),
+        "devserver_ai_compaction_tokens_saved_total": ("counter", "Prompt tokens removed by history compaction (AI_COMPACT), by provider."),
+        "devserver_ai_coalesced_total": ("counter", "Requests that joined an identical in-flight upstream call."),
+        "devserver_ai_calls_in_flight": ("gauge", "Distinct upstream calls in flight (coalescing on)."),
+        "devserver_ai_cache_events_total": ("counter", "AI response cache events."),
+        "devserver_ai_cache_bytes": ("gauge", "AI response cache memory tier size."),
+        "devserver_upstream_pool_events_total": ("counter", "Upstream connection pool events."),
+        "devserver_upstream_pool_idle_connections": ("gauge", "Idle pooled upstream connections."),
+        "devserver_static_events_total": ("counter", "Static file cache events."),
+        "devserver_static_cache_bytes": ("gauge", "Static file cache size."),
+        "devserver_image_events_total": ("counter", "Image derivative events."),
+        "devserver_image_generated_bytes_total": ("counter", "Bytes of sources and of the variants generated from them."),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values: dict[str, dict[tuple, float]] = {}
+        self._histograms: dict[str, dict[tuple, LatencyHistogram]] = {}
+
+    def inc(self, name: str, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            histogram = self._histograms.setdefault(name, {}).get(key)
+            if histogram is None:
+                histogram = self._histograms[name][key] = LatencyHistogram(self.HTTP_BUCKETS)
+        histogram.observe(seconds)
+
+    @staticmethod
+    def _line(name: str, labels, value: float) -> str:
+        label_text = ",".join(
+            f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34)).replace(chr(10), chr(92) + "n")}"'
+            for k, v in labels
+        )
+        return f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}"
+
+    def render(self, extra_values: dict, extra_histograms: dict) -> str:
+        """extra_values: {name: {labels: value}}; extra_histograms: {name: {labels: LatencyHistogram}}."""
+        with self._lock:
+            values = {name: dict(series) for name, series in self._values.items()}
+            histograms = {name: dict(series) for name, series in self._histograms.items()}
+        for name, series in extra_values.items():
+            values.setdefault(name, {}).update(series)
+        histograms.update(extra_histograms)
+
+        lines = []
+        for name in sorted(set(values) | set(histograms)):
+            kind, help_text = self.HELP.get(name, ("untyped", ""))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in sorted(values.get(name, {}).items()):
+                lines.append(self._line(name, labels, value))
+            for labels, histogram in sorted(histograms.get(name, {}).items()):
+                buckets, total, count = histogram.cumulative()
+                for le, running in buckets:
+                    lines.append(self._line(f"{name}_bucket", (*labels, ("le", le)), running))
+                lines.append(self._line(f"{name}_sum", labels, total))
+                lines.append(self._line(f"{name}_count", labels, count))
+        return "\n".join(lines) + "\n"
+
+
+_metrics = Metrics()
+
+# Per-request timing breakdown, filled in along the async pipeline. Tasks
+# spawned for a request (hedges, coalesced calls) copy the context and so
+# update the same dict.
+_request_trace: ContextVar[dict | None] = ContextVar("request_trace", default=None)
+
+
+def _trace(**fields):
+    trace = _request_trace.get()
+    if trace is not None:
+        trace.update(fields)
+
+
+def _trace_add(name: str, amount: float):
+    trace = _request_trace.get()
+    if trace is not None:
+        trace[name] = round(trace.get(name, 0) + amount, 1)
+
+
+class TimingLog:
+    """Structured request log: one JSON object per line."""
+
+    def __init__(self, target: str):
+        self._lock = threading.Lock()
+        if target in ("-", "stderr"):
+            self._file = sys.stderr
+        else:
+            path = Path(target) if Path(target).is_absolute() else ROOT_DIR / target
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def write(self, entry: dict):
+        line = json.dumps(entry, separators=(",", ":"), default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+
+_timing_log = TimingLog(TIMING_LOG) if TIMING_LOG else None
+
+
+def _route_label(path: str) -> str:
+    """Low-cardinality route name for metrics."""
+    route = path.split("?", 1)[0]
+    if route in AI_ROUTES or route in (BATCH_ROUTE, "/api/dev/stats", "/metrics", "/favicon.ico"):
+        return route
+    return "/api/other" if route.startswith("/api/") else "static"
+
+
+def _record_request(method: str, path: str, status: int, seconds: float, trace: dict):
+    route = _route_label(path)
+    _metrics.inc("devserver_http_requests_total", route=route, method=method, status=str(status))
+    _metrics.observe("devserver_http_request_duration_seconds", seconds, route=route)
+    if _timing_log is not None:
+        _timing_log.write({
+            "ts": round(time.time(), 3),
+            "method": method,
+            "path": path,
+            "route": route,
+            "status": status,
+            "duration_ms": round(seconds * 1000, 1),
+            **trace,
+        })
+
+
+def _record_usage(provider: str, usage: dict | None):
+    if not isinstance(usage, dict):
+        return
+    for kind in ("prompt", "completion"):
+        tokens = usage.get(f"{kind}_tokens")
+        if isinstance(tokens, (int, float)) and tokens > 0:
+            _metrics.inc("devserver_ai_tokens_total", tokens, provider=provider, type=kind)
+
+
+def _observe_upstream(reservation: dict, status: int, headers, used_tokens: int | None = None, attempt: int = 0):
+    """Feed an upstream response to the rate limiter and the metrics."""
+    _rate_limiter.observe(reservation, status, headers, used_tokens, attempt)
+    _metrics.inc("devserver_ai_upstream_responses_total", provider=reservation["provider"], status=str(status))
+
+
+def _render_metrics() -> str:
+    values: dict[str, dict[tuple, float]] = {}
+
+    def put(name: str, value: float, **labels):
+        values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    put("devserver_threads", threading.active_count())
+    for limiter, st in _rate_limiter.stats().items():
+        provider = limiter.split(":", 1)[0]
+        for field in ("acquired", "throttled", "rejected"):
+            put(f"devserver_ai_rate_limit_{field}_total", st[field], provider=provider, limiter=limiter)
+        put("devserver_ai_rate_limit_wait_seconds_total", st["waited_ms"] / 1000, provider=provider, limiter=limiter)
+    for provider, breaker in _breakers.items():
+        st = breaker.stats()
+        put("devserver_ai_breaker_state", {"closed": 0, "half_open": 1, "open": 2}[st["state"]], provider=provider)
+        put("devserver_ai_breaker_opened_total", st["opened"], provider=provider)
+        put("devserver_ai_breaker_rejected_total", st["rejected"], provider=provider)
+    for outcome, n in _hedge_counters.items():
+        put("devserver_ai_hedges_total", n, outcome=outcome)
+    if _single_flight is not None:
+        flight = _single_flight.stats()
+        put("devserver_ai_coalesced_total", flight["saved"])
+        put("devserver_ai_calls_in_flight", flight["in_flight"])
+    if _response_cache is not None:
+        cache = _response_cache.stats()
+        for event, n in _response_cache.counters.items():
+            put("devserver_ai_cache_events_total", n, event=event)
+        put("devserver_ai_cache_bytes", cache["bytes"])
+    pool = _pool.stats()
+    for event, n in _pool.counters.items():
+        put("devserver_upstream_pool_events_total", n, event=event)
+    put("devserver_upstream_pool_idle_connections", sum(pool["idle"].values()))
+    static = _static.stats()
+    for event, n in _static.counters.items():
+        put("devserver_static_events_total", n, event=event)
+    put("devserver_static_cache_bytes", static["bytes"])
+    if _images is not None:
+        images = _images.stats()
+        for event in ("hits", "generated", "coalesced", "errors", "unavailable"):
+            put("devserver_image_events_total", images[event], event=event)
+        for kind in ("source", "variant"):
+            put("devserver_image_generated_bytes_total", images[f"{kind}_bytes"], kind=kind)
+
+    histograms = {"devserver_ai_provider_latency_seconds": {(("provider", p),): h for p, h in _latency.items()}}
+    return _metrics.render(values, histograms)
+
+
+class CircuitBreaker:
+    """Per-provider circuit breaker over a sliding window of recent calls.
+
+    closed -> open when the window holds at least min_calls and the error
+    rate or the slow-call rate reaches its threshold. open -> half_open
+    once open_s has passed; half_open lets a single probe call through:
+    success closes the breaker, failure reopens it for twice as long.
+    """
+
+    MAX_OPEN_S = 300.0
+
+    def __init__(self, window_s: float, min_calls: int, error_rate: float, slow_s: float, slow_rate: float, open_s: float):
+        self.window_s = window_s
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_s = slow_s
+        self.slow_rate = slow_rate
+        self.base_open_s = open_s
+        self.open_s = open_s
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._probing = False
+        self._calls: deque[tuple[float, bool, float | None]] = deque()  # (time, ok, latency_s)
+        self._lock = threading.Lock()
+        self.counters = {"opened": 0, "rejected": 0, "probes": 0}
+
+    def _refresh(self, now: float):
+        if self.state == "open" and now - self.opened_at >= self.open_s:
+            self.state = "half_open"
+            self._probing = False
+        while self._calls and now - self._calls[0][0] > self.window_s:
+            self._calls.popleft()
+
+    def ready(self) -> bool:
+        """Would allow() let a call through right now? (no side effects)"""
+        with self._lock:
+            self._refresh(time.monotonic())
+            return self.state == "closed" or (self.state == "half_open" and not self._probing)
+
+    def allow(self) -> bool:
+        with self._lock:
+            self._refresh(time.monotonic())
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                self.counters["probes"] += 1
+                return True
+            self.counters["rejected"] += 1
+            return False
+
+    def record(self, ok: bool, latency_s: float | None = None):
+        now = time.monotonic()
+        slow = latency_s is not None and latency_s >= self.slow_s
+        with self._lock:
+            self._refresh(now)
+            if self.state == "half_open":
+                if self._probing:
+                    self._probing = False
+                    if ok and not slow:
+                        self.state = "closed"
+                        self.open_s = self.base_open_s
+                        self._calls.clear()
+                    else:
+                        self._open(now, min(self.MAX_OPEN_S, self.open_s * 2))
+                return
+            if self.state == "open":
+                # Late result of a call that started before the breaker opened
+                return
+
+            self._calls.append((now, ok, latency_s))
+            n = len(self._calls)
+            if n < self.min_calls:
+                return
+            errors = sum(1 for _, call_ok, _ in self._calls if not call_ok)
+            slow_calls = sum(1 for _, _, latency in self._calls if latency is not None and latency >= self.slow_s)
+            if errors / n >= self.error_rate or slow_calls / n >= self.slow_rate:
+                self._open(now, self.base_open_s)
+
+    def release(self):
+        """A call was cancelled before finishing (e.g. lost a hedge race): free the probe slot."""
+        with self._lock:
+            self._probing = False
+
+    def _open(self, now: float, open_s: float):
+        self.state = "open"
+        self.opened_at = now
+        self.open_s = open_s
+        self._calls.clear()
+        self.counters["opened"] += 1
+
+    def score(self) -> float:
+        """Routing cost: mean recent latency, inflated by the recent error rate (lower is better)."""
+        with self._lock:
+            self._refresh(time.monotonic())
+            calls = list(self._calls)
+        latencies = [latency for _, ok, latency in calls if ok and latency is not None]
+        mean = sum(latencies) / len(latencies) if latencies else 1.0
+        error_rate = sum(1 for _, ok, _ in calls if not ok) / len(calls) if calls else 0.0
+        return mean * (1 + 4 * error_rate)
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh(time.monotonic())
+            calls = list(self._calls)
+            state, open_s, opened_at = self.state, self.open_s, self.opened_at
+        errors = sum(1 for _, ok, _ in calls if not ok)
+        return {
+            "state": state,
+            "calls": len(calls),
+            "error_rate": round(errors / len(calls), 3) if calls else 0.0,
+            "score": round(self.score(), 3),
+            "retry_in_ms": max(0, int((opened_at + open_s - time.monotonic()) * 1000)) if state == "open" else 0,
+            **self.counters,
+        }
+
+
+_breakers = {
+    provider: CircuitBreaker(
+        AI_BREAKER_WINDOW_S,
+        AI_BREAKER_MIN_CALLS,
+        AI_BREAKER_ERROR_RATE,
+        AI_BREAKER_SLOW_MS / 1000,
+        AI_BREAKER_SLOW_RATE,
+        AI_BREAKER_OPEN_S,
+    )
+    for provider in ("groq", "ollama", "gemini")
+}
+
+
+def _is_provider_failure(error: Exception) -> bool:
+    """Errors that say something about the provider's health (not about the request)."""
+    if isinstance(error, UpstreamError):
+        return error.status >= 500 or error.status in (401, 403, 408, 429)
+    return isinstance(error, (URLError, asyncio.TimeoutError, OSError))
+
+
+def _route_candidates(provider: str) -> list[str]:
+    """Providers to try, in order: the requested one unless its breaker is open, then the
+    healthy AI_ROUTING_PROVIDERS by score, then any waiting for a half-open probe."""
+    provider = provider if provider in _breakers else "groq"
+    if not AI_ROUTING_PROVIDERS:
+        return [provider]
+    others = [p for p in dict.fromkeys(AI_ROUTING_PROVIDERS) if p in _breakers and p != provider]
+    closed = sorted((p for p in others if _breakers[p].state == "closed"), key=lambda p: _breakers[p].score())
+    probing = [p for p in others if _breakers[p].state != "closed" and _breakers[p].ready()]
+    ordered = ([provider] if _breakers[provider].ready() else []) + closed + probing
+    # Nothing usable: still try the requested provider, to get its "circuit open" error
+    return ordered or [provider]
+
+
+def _hedge_delay_s(provider: str) -> float:
+    histogram = _latency[provider]
+    estimate = histogram.percentile(AI_HEDGE_PERCENTILE) if histogram.count >= AI_HEDGE_MIN_SAMPLES else None
+    delay_ms = estimate * 1000 if estimate is not None else AI_HEDGE_DEFAULT_MS
+    return max(AI_HEDGE_MIN_MS, delay_ms) / 1000
+
+
+def _model_for_provider(provider: str, model: str | None) -> str:
+    """Map a model id to one `provider` serves, for requests re-routed from another provider."""
+    model = str(model or "").strip()
+    if provider == "ollama":
+        # Ollama ids are name:tag
+        return model if ":" in model else OLLAMA_DEFAULT_MODEL
+    if provider == "gemini":
+        return model if model.startswith("gemini") else GEMINI_DEFAULT_MODEL
+    return model if model and ":" not in model and not model.startswith("gemini") else GROQ_DEFAULT_MODEL
+
+
+def _is_deterministic(payload: dict) -> bool:
+    return payload.get("temperature") == 0 or isinstance(payload.get("response_format"), dict)
+
+
+def _retry_after_ms(headers, attempt: int) -> int:
+    """Backoff before retrying a 429: Retry-After if present, else exponential."""
+    ra = headers.get("Retry-After") if headers else None
+    try:
+        ra_ms = int(float(ra) * 1000) if ra is not None else None
+    except Exception:
+        ra_ms = None
+    return ra_ms if ra_ms is not None else min(5000, int(900 * (2**attempt)))
+
+
+async def _http_post_stream(url: str, payload: dict, headers: dict | None = None, timeout: int = 60):
+    """POST JSON and return (status, open response, headers) for incremental reads.
+
+    On HTTP errors the error body is read and returned (parsed) in place of
+    the response object, like _http_post_json.
+    """
+    resp = await _upstream_post(
+        url,
+        json.dumps(payload).encode("utf-8"),
+        {"Content-Type": "application/json", **(headers or {})},
+        timeout,
+    )
+    if resp.status >= 400:
         try:
-            raw = e.read().decode("utf-8") if hasattr(e, "read") else ""
-        except Exception:
-            raw = ""
+            raw = await resp.read()
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            raw = b""
+        return resp.status, _json_or_raw(raw), resp.headers
+    return resp.status, resp, resp.headers
+
+
+async def _iter_sse_json(resp: UpstreamResponse):
+    """Yield the JSON payload of every `data:` line of an SSE response, until [DONE].
+
+    The body is read to the end so a pooled connection can be reused.
+    """
+    done = False
+    async for raw in resp.lines():
+        line = raw.decode("utf-8", "replace").strip()
+        if done or not line.startswith("data:"):
+            continue
+        data = line[5:].strip()
+        if data == "[DONE]":
+            done = True
+            continue
         try:
-            data = json.loads(raw) if raw else {"raw": raw}
-        except Exception:
-            data = {"raw": raw}
-        return int(getattr(e, "code", 500) or 500), data, getattr(e, "headers", None)
+            yield json.loads(data)
+        except ValueError:
+            continue
+
+
+def _sse_frame(payload: dict) -> bytes:
+    return f"data: {json.dumps(payload)}\n\n".encode("utf-8")
+
+
+def _openai_chunk(stream_id: str, model: str, content: str | None = None, finish_reason: str | None = None, role: str | None = None) -> dict:
+    delta: dict = {}
+    if role:
+        delta["role"] = role
+    if content is not None:
+        delta["content"] = content
+    return {
+        "id": stream_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def _wants_json(payload: dict) -> bool:
+    try:
+        return isinstance(payload.get("response_format"), dict) and payload.get("response_format", {}).get("type") == "json_object"
+    except Exception:
+        return False
+
+
+def _groq_request() -> tuple[str, dict]:
+    api_key = os.environ.get("GROQ_API_KEY")
+    if not api_key:
+        raise UpstreamError(500, {"error": "Server misconfigured: GROQ_API_KEY missing"}, "GROQ_API_KEY missing")
+    return f"{GROQ_BASE_URL.rstrip('/')}/chat/completions", {
+        "Authorization": f"Bearer {api_key}",
+        "User-Agent": "GRPerform/1.0 (Python dev-server)",
+    }
+
+
+def _ollama_request(payload: dict, stream: bool) -> tuple[str, str, dict]:
+    """Return (model, url, body) for Ollama /api/chat."""
+    model_raw = payload.get("model")
+    looks_like_ollama_id = isinstance(model_raw, str) and (":" in model_raw)
+    model = model_raw if looks_like_ollama_id else OLLAMA_DEFAULT_MODEL
+
+    messages = payload.get("messages") if isinstance(payload.get("messages"), list) else []
+    temperature = payload.get("temperature") if isinstance(payload.get("temperature"), (int, float)) else 0.2
+    max_tokens = payload.get("max_tokens") if isinstance(payload.get("max_tokens"), int) else 2048
+
+    url = f"{OLLAMA_URL.rstrip('/')}/api/chat"
+    return model, url, {
+        "model": model,
+        "messages": messages,
+        "stream": stream,
+        **({"format": "json"} if _wants_json(payload) else {}),
+        "options": {"temperature": temperature, "num_predict": max_tokens},
+    }
+
+
+_GEMINI_FINISH_REASONS = {"STOP": "stop", "MAX_TOKENS": "length", "SAFETY": "content_filter", "RECITATION": "content_filter"}
+
+
+def _gemini_request(payload: dict, stream: bool) -> tuple[str, str, dict]:
+    """Return (model, url, body) for Gemini generateContent / streamGenerateContent (SSE)."""
+    if not GEMINI_API_KEY:
+        raise UpstreamError(500, {"error": "Server misconfigured: GEMINI_API_KEY missing"}, "GEMINI_API_KEY missing")
+
+    model_raw = payload.get("model")
+    model = str(model_raw or GEMINI_DEFAULT_MODEL).strip() or GEMINI_DEFAULT_MODEL
+
+    messages = payload.get("messages") if isinstance(payload.get("messages"), list) else []
+    temperature = payload.get("temperature") if isinstance(payload.get("temperature"), (int, float)) else 0.2
+    max_tokens = payload.get("max_tokens") if isinstance(payload.get("max_tokens"), int) else 2048
+
+    # Gemini: split system instructions vs chat turns
+    sys_parts: list[str] = []
+    contents: list[dict] = []
+    for m in messages:
+        role = str((m or {}).get("role") or "").strip().lower()
+        text = str((m or {}).get("content") or "")
+        if not text:
+            continue
+        if role == "system":
+            sys_parts.append(text)
+            continue
+        gem_role = "user" if role in ("user", "developer") else "model" if role == "assistant" else "user"
+        contents.append({"role": gem_role, "parts": [{"text": text}]})
+
+    body: dict = {
+        "contents": contents or [{"role": "user", "parts": [{"text": ""}]}],
+        "generationConfig": {
+            "temperature": float(temperature),
+            "maxOutputTokens": int(max_tokens),
+            **({"responseMimeType": "application/json"} if _wants_json(payload) else {}),
+        },
+    }
+    if sys_parts:
+        body["systemInstruction"] = {"parts": [{"text": "\n\n".join(sys_parts)}]}
+
+    base = f"{GEMINI_BASE_URL.rstrip('/')}/models/{model}"
+    if stream:
+        url = f"{base}:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
+    else:
+        url = f"{base}:generateContent?key={GEMINI_API_KEY}"
+    return model, url, body
+
+
+def _gemini_usage(data: dict) -> dict | None:
+    try:
+        usage = (data or {}).get("usageMetadata") or {}
+        return {
+            "prompt_tokens": int(usage.get("promptTokenCount") or 0),
+            "completion_tokens": int(usage.get("candidatesTokenCount") or 0),
+            "total_tokens": int(usage.get("totalTokenCount") or 0),
+        }
+    except Exception:
+        return None
+
+
+def _ollama_usage(data: dict) -> dict | None:
+    """OpenAI-style usage from Ollama's prompt_eval_count / eval_count."""
+    if not isinstance(data, dict) or "eval_count" not in data:
+        return None
+    prompt = int(data.get("prompt_eval_count") or 0)
+    completion = int(data.get("eval_count") or 0)
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
 
 
 class UpstreamError(Exception):
@@ -174,6 +1809,1345 @@ def _wrap_ollama_as_openai(model: str, content: str) -> dict:
     }
 
 
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/javascript",
+    "application/json",
+    "application/manifest+json",
+    "application/xml",
+    "image/svg+xml",
+)
+
+
+class FileRange:
+    """Response body that is a byte range of a file on disk.
+
+    Servers send it with sendfile, so large files never pass through Python
+    memory no matter how many downloads run at once.
+    """
+
+    def __init__(self, path: Path, offset: int, length: int):
+        self.path = path
+        self.offset = offset
+        self.length = length
+
+    def send(self, sock: socket.socket):
+        with self.path.open("rb") as f:
+            sock.sendfile(f, self.offset, self.length)
+
+    async def send_async(self, writer: asyncio.StreamWriter):
+        with self.path.open("rb") as f:
+            await asyncio.get_running_loop().sendfile(writer.transport, f, self.offset, self.length)
+
+
+class StaticFiles:
+    """Static file responses with an mtime-validated memory cache.
+
+    response() is pure (request in, (status, headers, body) out) so any server
+    loop can use it. Each cached entry holds the file bytes, a strong ETag
+    derived from the content hash, Last-Modified, and the compressed variants
+    produced so far; it is revalidated against (mtime_ns, size) on every
+    request and rebuilt when the file changes. The cache is an LRU bounded by
+    total bytes, variants included.
+
+    Files larger than max_file_bytes bypass the cache: their ETag comes from
+    size + mtime and the body is a FileRange, never loaded into memory.
+    Single byte ranges are honoured for identity responses.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, max_file_bytes: int, gzip_min_bytes: int, policies: list[tuple[str, str]]):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.gzip_min_bytes = gzip_min_bytes
+        self.policies = policies
+        self._entries: OrderedDict[Path, dict] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "not_modified": 0,
+            "compressed": 0,
+            "precompressed": 0,
+            "evictions": 0,
+            "from_disk": 0,
+            "ranges": 0,
+            "range_not_satisfiable": 0,
+        }
+
+    @staticmethod
+    def parse_policies(spec: str) -> list[tuple[str, str]]:
+        """Parse "/assets/*=public, max-age=86400;*=no-cache" into [(glob, cache-control)]."""
+        policies = []
+        for item in spec.split(";"):
+            pattern, sep, value = item.partition("=")
+            if sep and pattern.strip() and value.strip():
+                policies.append((pattern.strip(), value.strip()))
+        return policies
+
+    def resolve(self, raw_path: str) -> tuple[str, Path | None]:
+        """Return (url path, file path) or (url path, None) for traversal attempts."""
+        path = unquote(raw_path.split("?", 1)[0])
+        if path == "/":
+            path = "/index.html"
+
+        # Prevent path traversal
+        file_path = (self.root / path.lstrip("/")).resolve()
+        if not str(file_path).startswith(str(self.root)):
+            return path, None
+        return path, file_path
+
+    def response(self, raw_path: str, headers) -> tuple[int, list[tuple[str, str]], bytes | FileRange]:
+        path, file_path = self.resolve(raw_path)
+        if file_path is None:
+            return 400, [], b""
+        try:
+            st = file_path.stat()
+        except OSError:
+            return 404, [], b""
+        if not file_path.is_file():
+            return 404, [], b""
+
+        entry = self._entry(file_path, st)
+        # Ranges apply to the identity representation: don't compress range requests
+        encoding = None if headers.get("Range") else self._negotiate(entry, headers.get("Accept-Encoding") or "")
+        body = entry["data"] if encoding is None else entry["variants"][encoding]
+        etag = entry["etag"] if encoding is None else f'{entry["etag"][:-1]}-{encoding}"'
+
+        out = [
+            ("Content-Type", entry["ctype"]),
+            ("Cache-Control", self.policy(path)),
+            ("ETag", etag),
+            ("Last-Modified", entry["last_modified"]),
+        ]
+        if entry["compressible"]:
+            out.append(("Vary", "Accept-Encoding"))
+
+        if self._not_modified(headers, etag, entry["mtime"]):
+            with self._lock:
+                self.counters["not_modified"] += 1
+            return 304, out, b""
+
+        if encoding is not None:
+            out.append(("Content-Encoding", encoding))
+            out.append(("Content-Length", str(len(body))))
+            return 200, out, body
+
+        out.append(("Accept-Ranges", "bytes"))
+        size = entry["size"]
+        try:
+            byte_range = self._requested_range(headers, size, etag, entry["last_modified"])
+        except ValueError:
+            with self._lock:
+                self.counters["range_not_satisfiable"] += 1
+            return 416, [("Content-Range", f"bytes */{size}"), ("Content-Length", "0")], b""
+
+        start, end = byte_range if byte_range is not None else (0, size - 1)
+        length = end - start + 1
+        if body is None:
+            body = FileRange(entry["path"], start, length)
+        elif byte_range is not None:
+            body = body[start : end + 1]
+        out.append(("Content-Length", str(length)))
+        if byte_range is None:
+            return 200, out, body
+
+        with self._lock:
+            self.counters["ranges"] += 1
+        out.append(("Content-Range", f"bytes {start}-{end}/{size}"))
+        return 206, out, body
+
+    def policy(self, path: str) -> str:
+        for pattern, value in self.policies:
+            if fnmatchcase(path, pattern):
+                return value
+        return "no-cache"
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _entry(self, file_path: Path, st: os.stat_result) -> dict:
+        if st.st_size > self.max_file_bytes:
+            return self._disk_entry(file_path, st)
+
+        with self._lock:
+            entry = self._entries.get(file_path)
+            if entry is not None and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                self._entries.move_to_end(file_path)
+                self.counters["hits"] += 1
+                return entry
+            self.counters["misses"] += 1
+
+        data = file_path.read_bytes()
+        ctype, _ = mimetypes.guess_type(str(file_path))
+        if not ctype:
+            ctype = "application/octet-stream"
+        entry = {
+            "path": file_path,
+            "data": data,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "mtime": int(st.st_mtime),
+            "ctype": ctype,
+            "etag": f'"{hashlib.sha1(data).hexdigest()[:20]}"',
+            "last_modified": formatdate(st.st_mtime, usegmt=True),
+            "compressible": ctype.startswith(COMPRESSIBLE_TYPES),
+            "variants": {},
+        }
+        with self._lock:
+            self._store(file_path, entry)
+        return entry
+
+    def _disk_entry(self, file_path: Path, st: os.stat_result) -> dict:
+        """Metadata-only entry for files sent straight from disk."""
+        ctype, _ = mimetypes.guess_type(str(file_path))
+        with self._lock:
+            self.counters["from_disk"] += 1
+        return {
+            "path": file_path,
+            "data": None,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "mtime": int(st.st_mtime),
+            "ctype": ctype or "application/octet-stream",
+            # Hashing would mean reading the whole file: validate on size + mtime instead
+            "etag": f'"{st.st_size:x}-{st.st_mtime_ns:x}"',
+            "last_modified": formatdate(st.st_mtime, usegmt=True),
+            "compressible": False,
+            "variants": {},
+        }
+
+    def _negotiate(self, entry: dict, accept_encoding: str) -> str | None:
+        """Pick br or gz (in that order) if the client accepts it and it's worth sending."""
+        if not entry["compressible"] or entry["size"] < self.gzip_min_bytes:
+            return None
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding not in accepted:
+                continue
+            if encoding in entry["variants"]:
+                return encoding
+            variant = self._variant(entry, encoding)
+            if variant is None:
+                continue
+            with self._lock:
+                entry["variants"][encoding] = variant
+                if self._entries.get(entry["path"]) is entry:
+                    self._bytes += len(variant)
+                    self._evict()
+            return encoding
+        return None
+
+    def _variant(self, entry: dict, encoding: str) -> bytes | None:
+        # A precompressed sibling (build output) wins if it isn't stale
+        sibling = entry["path"].with_name(entry["path"].name + (".br" if encoding == "br" else ".gz"))
+        try:
+            if sibling.stat().st_mtime_ns >= entry["mtime_ns"]:
+                with self._lock:
+                    self.counters["precompressed"] += 1
+                return sibling.read_bytes()
+        except OSError:
+            pass
+
+        if encoding == "br":
+            if brotli is None:
+                return None
+            compressed = brotli.compress(entry["data"])
+        else:
+            compressed = gzip.compress(entry["data"], compresslevel=6, mtime=0)
+        if len(compressed) >= entry["size"]:
+            return None
+        with self._lock:
+            self.counters["compressed"] += 1
+        return compressed
+
+    @staticmethod
+    def _requested_range(headers, size: int, etag: str, last_modified: str) -> tuple[int, int] | None:
+        """Return the inclusive (start, end) to send, or None for the whole file.
+
+        Only a single "bytes=" range is honoured; multiple ranges and
+        malformed headers fall back to the full response, as do ranges whose
+        If-Range validator no longer matches. Raises ValueError when the
+        range is unsatisfiable (416).
+        """
+        range_header = str(headers.get("Range") or "").strip()
+        if not range_header:
+            return None
+        if_range = str(headers.get("If-Range") or "").strip()
+        if if_range:
+            # Strong comparison for entity tags; dates must match Last-Modified exactly
+            if if_range.startswith(('"', "W/")):
+                if if_range != etag:
+                    return None
+            elif if_range != last_modified:
+                return None
+
+        unit, _, spec = range_header.partition("=")
+        if unit.strip().lower() != "bytes" or "," in spec:
+            return None
+        first, sep, last = (part.strip() for part in spec.strip().partition("-"))
+        if not sep or not (first or last) or (first and not first.isdigit()) or (last and not last.isdigit()):
+            return None
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            if start >= size:
+                raise ValueError("range starts past the end of the file")
+            return start, min(int(last), size - 1) if last else size - 1
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - suffix), size - 1
+
+    @staticmethod
+    def _not_modified(headers, etag: str, mtime: int) -> bool:
+        if_none_match = headers.get("If-None-Match")
+        if if_none_match:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            # Weak comparison, as RFC 9110 requires for If-None-Match
+            return "*" in tags or any(t.removeprefix("W/") == etag for t in tags)
+        if_modified_since = headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return mtime <= int(parsedate_to_datetime(if_modified_since).timestamp())
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _store(self, file_path: Path, entry: dict):
+        old = self._entries.pop(file_path, None)
+        if old is not None:
+            self._bytes -= old["size"] + sum(len(v) for v in old["variants"].values())
+        self._entries[file_path] = entry
+        self._bytes += entry["size"]
+        self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._entries:
+            _, old = self._entries.popitem(last=False)
+            self._bytes -= old["size"] + sum(len(v) for v in old["variants"].values())
+            self.counters["evictions"] += 1
+
+
+def _accepted_encodings(header: str) -> set[str]:
+    """Codings from Accept-Encoding with q > 0 (x-gzip counts as gzip)."""
+    accepted = set()
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if name and q > 0:
+            accepted.add("gzip" if name == "x-gzip" else name)
+    return accepted
+
+
+_static = StaticFiles(
+    ROOT_DIR,
+    STATIC_CACHE_MAX_MB * 1024 * 1024,
+    STATIC_CACHE_MAX_FILE_MB * 1024 * 1024,
+    STATIC_GZIP_MIN_BYTES,
+    StaticFiles.parse_policies(STATIC_CACHE_POLICIES),
+)
+
+
+class ImageDerivatives:
+    """Resized, re-encoded variants of raster images (/assets/x.jpg?w=640&fmt=webp).
+
+    Requested widths snap up to a fixed ladder, capped at the source width,
+    so each source has a bounded set of variants. A variant's file name
+    includes the source's content hash, so a changed photo gets new variants
+    and a variant, once written, never changes: responses can be cached by
+    browsers for a year. Missing variants are encoded by a thread pool (Pillow
+    releases the GIL while decoding, resizing and encoding) and written
+    atomically to cache_dir; concurrent requests for the same variant wait on
+    one job.
+
+    response() returns None for anything it doesn't handle (no ?w= / ?fmt=,
+    not a raster image, Pillow missing or failing), and the caller then
+    serves the original file.
+    """
+
+    SOURCE_TYPES = {".jpg": "jpeg", ".jpeg": "jpeg", ".png": "png", ".webp": "webp"}
+    # fmt -> (content type, file extension, Pillow format)
+    FORMATS = {
+        "webp": ("image/webp", "webp", "WEBP"),
+        "avif": ("image/avif", "avif", "AVIF"),
+        "jpeg": ("image/jpeg", "jpg", "JPEG"),
+        "png": ("image/png", "png", "PNG"),
+    }
+    CACHE_CONTROL = "public, max-age=31536000, immutable"
+    MAX_WIDTH = 10_000
+
+    def __init__(self, static: StaticFiles, cache_dir: Path, widths: list[int], quality: int, workers: int):
+        self.static = static
+        self.cache_dir = cache_dir
+        self.widths = sorted(set(widths))
+        self.quality = quality
+        self.workers = workers
+        self.formats = {
+            fmt for fmt in self.FORMATS if fmt in ("jpeg", "png") or (pil_features is not None and fmt in pil_features.modules and pil_features.check_module(fmt))
+        }
+        self._pool: ThreadPoolExecutor | None = None
+        self._jobs: dict[Path, Future] = {}
+        self._sources: dict[Path, dict] = {}
+        self._lock = threading.Lock()
+        # source_bytes / variant_bytes: sizes before and after, for generated variants
+        self.counters = {"hits": 0, "generated": 0, "coalesced": 0, "errors": 0, "unavailable": 0, "source_bytes": 0, "variant_bytes": 0}
+
+    @staticmethod
+    def parse_widths(spec: str) -> list[int]:
+        return [int(w) for w in (part.strip() for part in spec.split(",")) if w.isdigit() and int(w) > 0]
+
+    def response(self, raw_path: str, headers) -> tuple[int, list[tuple[str, str]], bytes | FileRange] | None:
+        url = urlsplit(raw_path)
+        params = parse_qs(url.query)
+        suffix = Path(unquote(url.path)).suffix.lower()
+        if not ("w" in params or "fmt" in params) or suffix not in self.SOURCE_TYPES:
+            return None
+        if Image is None:
+            with self._lock:
+                self.counters["unavailable"] += 1
+            return None
+
+        try:
+            requested, fmt = self._parse(params, self.SOURCE_TYPES[suffix])
+        except ValueError:
+            return 400, [], b""
+        _, source = self.static.resolve(raw_path)
+        if source is None:
+            return 400, [], b""
+        try:
+            st = source.stat()
+        except OSError:
+            return 404, [], b""
+        if not source.is_file():
+            return 404, [], b""
+
+        try:
+            info = self._source_info(source, st)
+            width = self._snap(requested, info["width"])
+            target = self._target(info, width, fmt)
+            cache = self._variant(source, target, width, fmt)
+            vst = target.stat()
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            # Corrupt or unsupported source, full disk, ...: the original still works
+            with self._lock:
+                self.counters["errors"] += 1
+            sys.stderr.write(f"[dev-server] image derivative failed for {raw_path}: {e}\n")
+            return None
+
+        etag = f'"{target.stem}"'
+        out = [
+            ("Content-Type", self.FORMATS[fmt][0]),
+            ("Cache-Control", self.CACHE_CONTROL),
+            ("ETag", etag),
+            ("Last-Modified", formatdate(vst.st_mtime, usegmt=True)),
+            ("X-Image-Cache", cache),
+        ]
+        if self.static._not_modified(headers, etag, int(vst.st_mtime)):
+            return 304, out, b""
+        out.append(("Content-Length", str(vst.st_size)))
+        return 200, out, FileRange(target, 0, vst.st_size)
+
+    def pregenerate(self, directory: Path, formats: list[str], prune: bool = False) -> dict:
+        """Generate every ladder width in each format for the images under directory.
+
+        Returns per-variant totals next to the originals' size; files Pillow
+        can't read are skipped, failed encodes are listed. With prune,
+        cached files that none of these variants use (older versions of a
+        source, dropped widths or formats) are deleted.
+        """
+        unsupported = [fmt for fmt in formats if fmt not in self.formats]
+        if Image is None or unsupported:
+            raise ValueError("Pillow is not installed" if Image is None else f"unsupported format(s): {', '.join(unsupported)}")
+
+        sources = sorted(p for p in directory.rglob("*") if p.is_file() and p.suffix.lower() in self.SOURCE_TYPES and not p.name.startswith("."))
+        targets: dict[str, list[Path]] = {}
+        source_bytes = 0
+        keep: set[Path] = set()
+        jobs: dict[Future, Path] = {}
+        skipped, errors = [], []
+        for source in sources:
+            st = source.stat()
+            try:
+                info = self._source_info(source, st)
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                # e.g. an SVG saved as .png: the server falls back to the original for it too
+                skipped.append(f"{source}: {e}")
+                continue
+            source_bytes += st.st_size
+            for fmt in formats:
+                for requested in self.widths or [None]:
+                    width = self._snap(requested, info["width"])
+                    target = self._target(info, width, fmt)
+                    keep.add(target)
+                    job = self._job(source, target, width, fmt)
+                    if job is not None:
+                        jobs[job] = source
+                    targets.setdefault(f"{fmt} {requested}w" if requested else fmt, []).append(target)
+        for job in as_completed(jobs):
+            try:
+                job.result()
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                errors.append(f"{jobs[job]}: {e}")
+
+        variants = {key: sum(t.stat().st_size for t in paths if t.exists()) for key, paths in targets.items()}
+
+        pruned = 0
+        if prune and self.cache_dir.is_dir():
+            for path in self.cache_dir.iterdir():
+                if path.is_file() and path not in keep:
+                    path.unlink(missing_ok=True)
+                    pruned += 1
+        return {
+            "sources": len(sources) - len(skipped),
+            "source_bytes": source_bytes,
+            "generated": len(jobs),
+            "variants": variants,
+            "pruned": pruned,
+            "skipped": skipped,
+            "errors": errors,
+        }
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                **self.counters,
+                "enabled": Image is not None,
+                "formats": sorted(self.formats),
+                "widths": self.widths,
+                "workers": self.workers,
+                "in_flight": len(self._jobs),
+            }
+
+    def _parse(self, params: dict, source_fmt: str) -> tuple[int | None, str]:
+        raw_width = (params.get("w") or [""])[-1].strip()
+        fmt = (params.get("fmt") or [source_fmt])[-1].strip().lower()
+        fmt = "jpeg" if fmt == "jpg" else fmt
+        if fmt not in self.formats:
+            raise ValueError(f"unsupported format: {fmt}")
+        if not raw_width:
+            return None, fmt
+        if not raw_width.isdigit() or not 0 < int(raw_width) <= self.MAX_WIDTH:
+            raise ValueError(f"invalid width: {raw_width}")
+        return int(raw_width), fmt
+
+    def _snap(self, requested: int | None, source_width: int) -> int:
+        """Round up to the next ladder width, never past the source width."""
+        if requested is None:
+            return source_width
+        width = next((w for w in self.widths if w >= requested), self.widths[-1] if self.widths else requested)
+        return min(width, source_width)
+
+    def _target(self, info: dict, width: int, fmt: str) -> Path:
+        return self.cache_dir / f'{info["digest"]}-{width}w-q{self.quality}.{self.FORMATS[fmt][1]}'
+
+    def _source_info(self, source: Path, st: os.stat_result) -> dict:
+        """Content hash and display width of a source, memoized per (mtime, size)."""
+        with self._lock:
+            info = self._sources.get(source)
+        if info is not None and info["mtime_ns"] == st.st_mtime_ns and info["size"] == st.st_size:
+            return info
+
+        digest = hashlib.sha1()
+        with source.open("rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        with Image.open(source) as img:
+            width, _ = self._display_size(img)
+        info = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "digest": digest.hexdigest()[:20], "width": width}
+        with self._lock:
+            self._sources[source] = info
+        return info
+
+    def _variant(self, source: Path, target: Path, width: int, fmt: str) -> str:
+        """Make sure target exists; return "HIT" if it already did, "MISS" otherwise."""
+        job = self._job(source, target, width, fmt)
+        if job is None:
+            with self._lock:
+                self.counters["hits"] += 1
+            return "HIT"
+        job.result()
+        return "MISS"
+
+    def _job(self, source: Path, target: Path, width: int, fmt: str) -> Future | None:
+        """The pending encode for target (started if needed), or None if it's on disk."""
+        if target.exists():
+            return None
+        with self._lock:
+            job = self._jobs.get(target)
+            if job is not None:
+                self.counters["coalesced"] += 1
+                return job
+            # The job may have finished between the exists() above and taking the lock
+            if target.exists():
+                return None
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-worker")
+            job = self._pool.submit(self._generate, source, target, width, fmt)
+            self._jobs[target] = job
+            return job
+
+    def _generate(self, source: Path, target: Path, width: int, fmt: str):
+        tmp = target.with_name(f".{target.name}.{threading.get_ident()}.tmp")
+        try:
+            with Image.open(source) as img:
+                icc_profile = img.info.get("icc_profile")
+                display_width, display_height = self._display_size(img)
+                height = max(1, round(display_height * width / display_width))
+                # JPEG: let the decoder downscale by 1/2..1/8 first, far cheaper than a full decode
+                img.draft(None, (width, height) if img.size == (display_width, display_height) else (height, width))
+                img = ImageOps.exif_transpose(img)
+
+                has_alpha = img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info)
+                mode = "RGBA" if has_alpha and fmt != "jpeg" else "RGB"
+                if img.mode != mode and not (img.mode == "L" and mode == "RGB"):
+                    img = img.convert(mode)
+                if img.width != width:
+                    img = img.resize((width, height), Image.Resampling.LANCZOS)
+
+                options: dict = {"icc_profile": icc_profile} if icc_profile else {}
+                if fmt == "jpeg":
+                    options.update(quality=self.quality, optimize=True, progressive=True)
+                elif fmt == "webp":
+                    options.update(quality=self.quality, method=4)
+                elif fmt == "avif":
+                    options.update(quality=self.quality)
+                else:
+                    options.update(optimize=True)
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                img.save(tmp, self.FORMATS[fmt][2], **options)
+            os.replace(tmp, target)
+            with self._lock:
+                self.counters["generated"] += 1
+                self.counters["source_bytes"] += source.stat().st_size
+                self.counters["variant_bytes"] += target.stat().st_size
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+        finally:
+            with self._lock:
+                self._jobs.pop(target, None)
+
+    @staticmethod
+    def _display_size(img) -> tuple[int, int]:
+        # EXIF orientations 5-8 rotate by 90 degrees: the stored width is the displayed height
+        if img.getexif().get(0x0112) in (5, 6, 7, 8):
+            return img.height, img.width
+        return img.width, img.height
+
+
+_images = (
+    ImageDerivatives(_static, _cache_dir(IMAGE_CACHE_DIR), ImageDerivatives.parse_widths(IMAGE_WIDTHS), IMAGE_QUALITY, IMAGE_WORKERS)
+    if IMAGE_DERIVATIVES
+    else None
+)
+
+
+def _static_response(raw_path: str, headers) -> tuple[int, list[tuple[str, str]], bytes | FileRange]:
+    """An image derivative for ?w= / ?fmt= requests, otherwise the file as-is."""
+    response = _images.response(raw_path, headers) if _images is not None else None
+    return response if response is not None else _static.response(raw_path, headers)
+
+
+AI_ROUTES = {
+    "/api/ai/chat": None,  # provider-agnostic
+    "/api/ai/groq-chat": "groq",
+    "/api/ai/ollama-chat": "ollama",
+    "/api/ai/gemini-chat": "gemini",
+}
+
+BATCH_ROUTE = "/api/ai/chat/batch"
+
+MAX_BODY_BYTES = 1_000_000
+MAX_BATCH_BODY_BYTES = 16_000_000
+
+
+def _content_length(headers) -> int | None:
+    """Request body length, or None if Content-Length is malformed or negative."""
+    try:
+        length = int(headers.get("Content-Length") or "0")
+    except ValueError:
+        return None
+    return length if length >= 0 else None
+
+
+def _max_body_bytes(path: str) -> int:
+    return MAX_BATCH_BODY_BYTES if path.split("?", 1)[0] == BATCH_ROUTE else MAX_BODY_BYTES
+
+
+async def _call_groq(payload: dict) -> dict:
+    url, headers = _groq_request()
+
+    attempt = 0
+    while True:
+        # On a retry this waits out the Retry-After recorded by observe() (limited providers)
+        reservation = await _acquire_rate_limit("groq", payload)
+        status, data, resp_headers = await _http_post_json(url, payload, headers=headers, timeout=60)
+        _observe_upstream(reservation, status, resp_headers, _usage_tokens(data), attempt)
+
+        if status == 429 and attempt < AI_MAX_429_RETRIES:
+            if not _rate_limiter.enforces("groq"):
+                # No limiter to hold the Retry-After: back off here
+                await asyncio.sleep(_retry_after_ms(resp_headers, attempt) / 1000.0)
+            attempt += 1
+            _metrics.inc("devserver_ai_retries_total", provider="groq")
+            _trace_add("retries", 1)
+            continue
+
+        if status >= 400:
+            raise UpstreamError(status, data, "Groq API error")
+
+        _record_usage("groq", data.get("usage") if isinstance(data, dict) else None)
+        return data
+
+
+async def _call_ollama(payload: dict) -> dict:
+    model, url, body = _ollama_request(payload, stream=False)
+
+    reservation = await _acquire_rate_limit("ollama", payload)
+    status, data, resp_headers = await _http_post_json(url, body, headers={}, timeout=120)
+    _observe_upstream(reservation, status, resp_headers)
+
+    if status >= 400:
+        raise UpstreamError(status, data, "Ollama API error")
+
+    _record_usage("ollama", _ollama_usage(data))
+
+    content = ""
+    try:
+        content = str((data or {}).get("message", {}).get("content") or "")
+    except Exception:
+        content = ""
+    return _wrap_ollama_as_openai(model, content)
+
+
+async def _call_gemini(payload: dict) -> dict:
+    model, url, body = _gemini_request(payload, stream=False)
+
+    reservation = await _acquire_rate_limit("gemini", payload)
+    status, data, resp_headers = await _http_post_json(url, body, headers={}, timeout=120)
+    _observe_upstream(reservation, status, resp_headers, (_gemini_usage(data) or {}).get("total_tokens") or None)
+    if status >= 400:
+        raise UpstreamError(status, data, "Gemini API error")
+
+    content_text = ""
+    try:
+        cand = (data or {}).get("candidates", [{}])[0]
+        parts = ((cand or {}).get("content") or {}).get("parts") or []
+        if parts:
+            content_text = str((parts[0] or {}).get("text") or "")
+    except Exception:
+        content_text = ""
+
+    wrapped = _wrap_ollama_as_openai(model, content_text)
+    usage = _gemini_usage(data)
+    if usage is not None:
+        wrapped["usage"] = usage
+    _record_usage("gemini", usage)
+    return wrapped
+
+
+# Streaming variants: async generators of OpenAI "chat.completion.chunk" dicts.
+# The upstream request is made on the first __anext__(), so connection and
+# HTTP errors surface before any response bytes are sent to the browser.
+
+
+async def _stream_groq(payload: dict):
+    url, headers = _groq_request()
+
+    attempt = 0
+    while True:
+        reservation = await _acquire_rate_limit("groq", payload)
+        status, resp, resp_headers = await _http_post_stream(url, {**payload, "stream": True}, headers=headers, timeout=60)
+        _observe_upstream(reservation, status, resp_headers, attempt=attempt)
+
+        if status == 429 and attempt < AI_MAX_429_RETRIES:
+            if not _rate_limiter.enforces("groq"):
+                # No limiter to hold the Retry-After: back off here
+                await asyncio.sleep(_retry_after_ms(resp_headers, attempt) / 1000.0)
+            attempt += 1
+            _metrics.inc("devserver_ai_retries_total", provider="groq")
+            _trace_add("retries", 1)
+            continue
+
+        if status >= 400:
+            raise UpstreamError(status, resp, "Groq API error")
+        break
+
+    # Groq already speaks OpenAI SSE: relay the chunks as they are
+    async with resp:
+        async for chunk in _iter_sse_json(resp):
+            # Groq reports usage on the last chunk, under x_groq when not OpenAI-style
+            _record_usage("groq", chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage"))
+            yield chunk
+
+
+async def _stream_ollama(payload: dict):
+    model, url, body = _ollama_request(payload, stream=True)
+
+    reservation = await _acquire_rate_limit("ollama", payload)
+    status, resp, resp_headers = await _http_post_stream(url, body, headers={}, timeout=120)
+    _observe_upstream(reservation, status, resp_headers)
+    if status >= 400:
+        raise UpstreamError(status, resp, "Ollama API error")
+
+    stream_id = f"ollama-{int(time.time())}"
+    async with resp:
+        yield _openai_chunk(stream_id, model, role="assistant")
+        # Ollama streams NDJSON: one {"message": {...}, "done": bool} object per line
+        async for raw in resp.lines():
+            line = raw.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except ValueError:
+                continue
+            if item.get("error"):
+                raise UpstreamError(502, item, "Ollama stream error")
+            content = str((item.get("message") or {}).get("content") or "")
+            if item.get("done"):
+                _record_usage("ollama", _ollama_usage(item))
+                # Keep reading to the end of the body so the connection can be pooled
+                yield _openai_chunk(stream_id, model, content or None, finish_reason="stop")
+            elif content:
+                yield _openai_chunk(stream_id, model, content)
+
+
+async def _stream_gemini(payload: dict):
+    model, url, body = _gemini_request(payload, stream=True)
+
+    reservation = await _acquire_rate_limit("gemini", payload)
+    status, resp, resp_headers = await _http_post_stream(url, body, headers={}, timeout=120)
+    _observe_upstream(reservation, status, resp_headers)
+    if status >= 400:
+        raise UpstreamError(status, resp, "Gemini API error")
+
+    stream_id = f"gemini-{int(time.time())}"
+    async with resp:
+        yield _openai_chunk(stream_id, model, role="assistant")
+        async for event in _iter_sse_json(resp):
+            cand = ((event or {}).get("candidates") or [{}])[0] or {}
+            parts = (cand.get("content") or {}).get("parts") or []
+            content = "".join(str((part or {}).get("text") or "") for part in parts)
+            finish = cand.get("finishReason")
+            if finish:
+                chunk = _openai_chunk(stream_id, model, content or None, finish_reason=_GEMINI_FINISH_REASONS.get(finish, str(finish).lower()))
+                if event.get("usageMetadata"):
+                    chunk["usage"] = _gemini_usage(event)
+                    _record_usage("gemini", chunk["usage"])
+                yield chunk
+            elif content:
+                yield _openai_chunk(stream_id, model, content)
+
+
+_CALLS = {"groq": _call_groq, "ollama": _call_ollama, "gemini": _call_gemini}
+_STREAMS = {"groq": _stream_groq, "ollama": _stream_ollama, "gemini": _stream_gemini}
+
+
+def _json_response(status: int, payload: object, extra_headers: dict | None = None) -> tuple[int, list, bytes]:
+    return _json_bytes_response(status, json.dumps(payload).encode("utf-8"), extra_headers)
+
+
+def _json_bytes_response(status: int, data: bytes, extra_headers: dict | None = None) -> tuple[int, list, bytes]:
+    headers = [("Content-Type", "application/json; charset=utf-8"), ("Content-Length", str(len(data)))]
+    headers.extend((extra_headers or {}).items())
+    return status, headers, data
+
+
+def _error_page(status: int, message: str) -> tuple[int, list, bytes]:
+    """Same HTML error page BaseHTTPRequestHandler.send_error produces."""
+    explain = HTTPStatus(status).description if status in HTTPStatus._value2member_map_ else ""
+    body = (BaseHTTPRequestHandler.error_message_format % {
+        "code": status,
+        "message": html.escape(message, quote=False),
+        "explain": html.escape(explain, quote=False),
+    }).encode("utf-8", "replace")
+    return status, [("Content-Type", BaseHTTPRequestHandler.error_content_type), ("Content-Length", str(len(body)))], body
+
+
+def _fallback_allowed(provider: str, status: int) -> bool:
+    """Optional fallback to Ollama on common upstream failures (503: circuit open)."""
+    return AI_FALLBACK_PROVIDER == "ollama" and provider != "ollama" and status in (401, 403, 429, 500, 503)
+
+
+def _cache_directive(headers) -> str:
+    """Client cache directive: "bypass", "refresh" or ""."""
+    directive = str(headers.get("X-AI-Cache") or "").strip().lower()
+    cache_control = str(headers.get("Cache-Control") or "").lower()
+    if directive == "bypass" or "no-store" in cache_control:
+        return "bypass"
+    if directive == "refresh" or "no-cache" in cache_control:
+        return "refresh"
+    return ""
+
+
+def _cache_lookup_mode(headers, provider: str, payload: dict) -> tuple[str | None, str | None]:
+    """Return (cache key, mode) where mode is "lookup", "refresh", "bypass" or None (cache off)."""
+    if _response_cache is None:
+        return None, None
+    directive = _cache_directive(headers)
+    if directive == "bypass":
+        return None, "bypass"
+    if not AI_CACHE_ALL and not _is_deterministic(payload):
+        return None, "bypass"
+    key = ResponseCache.key(provider, payload)
+    if directive == "refresh":
+        return key, "refresh"
+    return key, "lookup"
+
+
+async def _cache_call(method, *args):
+    # The disk tier does file I/O: keep it off the event loop
+    if _response_cache.disk_dir:
+        return await asyncio.to_thread(method, *args)
+    return method(*args)
+
+
+def _is_app_route(path: str) -> bool:
+    """Paths served by _api_response rather than from disk."""
+    return path.startswith("/api/") or path.split("?", 1)[0] == "/metrics"
+
+
+async def _api_response(method: str, path: str, headers, body: bytes, trace: dict | None = None):
+    """Route /api/* and /metrics requests; returns (status, headers, body) or None for other paths.
+
+    body in the result is bytes, or an async iterator of bytes for streamed
+    responses (the server loop frames it with chunked transfer encoding).
+    trace, if given, collects the request's timing breakdown for TIMING_LOG.
+    """
+    if trace is not None:
+        _request_trace.set(trace)
+    route = path.split("?", 1)[0]
+    if route == "/metrics" and method in ("GET", "HEAD"):
+        data = _render_metrics().encode("utf-8")
+        return 200, [("Content-Type", "text/plain; version=0.0.4; charset=utf-8"), ("Content-Length", str(len(data))), ("Cache-Control", "no-store")], data
+    if route == "/api/dev/stats" and method in ("GET", "HEAD"):
+        return _json_response(200, _dev_stats(), {"Cache-Control": "no-store"})
+    if route in AI_ROUTES or route == BATCH_ROUTE:
+        if method != "POST":
+            return 405, [("Allow", "POST"), ("Content-Length", "0")], b""
+        if route == BATCH_ROUTE:
+            return await _ai_batch(body, headers)
+        return await _ai_chat(AI_ROUTES[route], body, headers)
+    return None
+
+
+def _chat_request(body: dict, force_provider: str | None) -> tuple[str, dict]:
+    """Validate a chat body; return (provider, upstream payload). Raises ValueError."""
+    model = body.get("model")
+    messages = body.get("messages")
+    temperature = body.get("temperature", 0.2)
+    max_tokens = body.get("max_tokens", 2048)
+    provider_body = str(body.get("provider") or "").strip().lower()
+    json_mode = bool(body.get("jsonMode") or False)
+    response_format = body.get("response_format")
+
+    if not model or not isinstance(messages, list):
+        raise ValueError("Invalid body: model and messages are required")
+
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature if isinstance(temperature, (int, float)) else 0.2,
+        "max_tokens": max_tokens if isinstance(max_tokens, int) else 2048,
+    }
+
+    # Optional JSON mode support for OpenAI-compatible APIs (e.g., Groq)
+    # If the client requests jsonMode, enforce it via response_format unless already provided.
+    if isinstance(response_format, dict):
+        payload["response_format"] = response_format
+    elif json_mode:
+        payload["response_format"] = {"type": "json_object"}
+
+    provider = (force_provider or provider_body or AI_PROVIDER or "groq").lower()
+    return provider, payload
+
+
+async def _ai_chat(force_provider: str | None, raw: bytes, headers):
+    try:
+        body = json.loads(raw.decode("utf-8")) if raw else {}
+        if not isinstance(body, dict):
+            raise ValueError("Expected a JSON object")
+    except Exception as e:
+        return _json_response(400, {"error": f"Invalid JSON: {e}"})
+
+    try:
+        provider, payload = _chat_request(body, force_provider)
+    except ValueError as e:
+        return _json_response(400, {"error": str(e)})
+
+    saved = _compact_payload(provider, payload)
+    if body.get("stream") is True:
+        response = await _ai_stream(provider, payload)
+    else:
+        response = await _ai_complete(provider, payload, headers)
+    if saved is None:
+        return response
+    status, response_headers, data = response
+    return status, [*response_headers, ("X-AI-Tokens-Saved", str(saved))], data
+
+
+async def _ai_complete(provider: str, payload: dict, headers):
+    """Non-streaming chat: cache lookup, then a (coalesced) upstream call."""
+    cache_key, cache_mode = _cache_lookup_mode(headers, provider, payload)
+    if cache_mode == "lookup":
+        cached = await _cache_call(_response_cache.get, cache_key)
+        _trace(cache="HIT" if cached is not None else "MISS")
+        if cached is not None:
+            data, age = cached
+            return _json_bytes_response(200, data, {"X-AI-Cache": "HIT", "Age": str(int(age))})
+        cache_mode = "miss"
+
+    if _single_flight is None or _cache_directive(headers) == "bypass":
+        return await _ai_upstream(provider, payload, cache_key, cache_mode)
+
+    # Identical concurrent requests share one upstream call (and one cache store)
+    flight_key = cache_key or ResponseCache.key(provider, payload)
+    response, shared = await _single_flight.do(flight_key, lambda: _ai_upstream(provider, payload, cache_key, cache_mode))
+    if shared:
+        _trace(coalesced=True)
+        status, response_headers, data = response
+        return status, [*response_headers, ("X-AI-Coalesced", "1")], data
+    return response
+
+
+_batch_limits = _parse_provider_ints(AI_BATCH_CONCURRENCY)
+_batch_slots: dict[str, asyncio.Semaphore] = {}
+
+
+def _batch_slot(provider: str) -> asyncio.Semaphore:
+    # Created on first use, on the event loop that runs the pipeline
+    slot = _batch_slots.get(provider)
+    if slot is None:
+        slot = _batch_slots[provider] = asyncio.Semaphore(_batch_limits.get(provider, 2))
+    return slot
+
+
+async def _batch_item(index: int, item: object, headers) -> dict:
+    # Items share the batch request's context: keep their cache/provider details out of its trace
+    _request_trace.set(None)
+    started = time.monotonic()
+    try:
+        if not isinstance(item, dict):
+            raise ValueError("Invalid body: expected a JSON object")
+        provider, payload = _chat_request(item, None)
+    except ValueError as e:
+        return {"index": index, "status": 400, "provider": None, "cache": None, "tokens_saved": None, "duration_ms": 0, "body": {"error": str(e)}}
+    saved = None
+    try:
+        saved = _compact_payload(provider, payload)
+        async with _batch_slot(provider):
+            status, response_headers, data = await _ai_complete(provider, payload, headers)
+        body = json.loads(data)
+    except Exception as e:
+        status, response_headers, body = 500, [], {"error": "Unexpected server error", "details": str(e)}
+    meta = dict(response_headers)
+    return {
+        "index": index,
+        "status": status,
+        "provider": meta.get("X-AI-Provider"),
+        "cache": meta.get("X-AI-Cache"),
+        "tokens_saved": saved,
+        "duration_ms": round((time.monotonic() - started) * 1000),
+        "body": body,
+    }
+
+
+def _batch_summary(results: list[dict], started: float) -> dict:
+    ok = sum(1 for result in results if result["status"] < 400)
+    return {"count": len(results), "ok": ok, "failed": len(results) - ok, "duration_ms": round((time.monotonic() - started) * 1000)}
+
+
+async def _ai_batch(raw: bytes, headers):
+    try:
+        body = json.loads(raw.decode("utf-8")) if raw else {}
+    except Exception as e:
+        return _json_response(400, {"error": f"Invalid JSON: {e}"})
+    items = body if isinstance(body, list) else body.get("requests") if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        return _json_response(400, {"error": "Invalid body: requests must be a non-empty array"})
+    if len(items) > AI_BATCH_MAX_ITEMS:
+        return _json_response(400, {"error": f"Invalid body: at most {AI_BATCH_MAX_ITEMS} requests per batch"})
+
+    stream = (isinstance(body, dict) and body.get("stream") is True) or "application/x-ndjson" in str(headers.get("Accept") or "")
+    _trace(batch=len(items))
+    started = time.monotonic()
+    tasks = [asyncio.ensure_future(_batch_item(index, item, headers)) for index, item in enumerate(items)]
+
+    if not stream:
+        results = await asyncio.gather(*tasks)
+        return _json_response(200, {"results": results, "summary": _batch_summary(results, started)})
+
+    async def lines():
+        results = []
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                results.append(result)
+                yield json.dumps(result).encode("utf-8") + b"\n"
+            yield json.dumps({"done": True, **_batch_summary(results, started)}).encode("utf-8") + b"\n"
+        finally:
+            # Client went away mid-batch: stop the remaining items
+            for task in tasks:
+                task.cancel()
+
+    return 200, [("Content-Type", "application/x-ndjson; charset=utf-8"), ("Cache-Control", "no-cache"), ("X-Accel-Buffering", "no")], lines()
+
+
+def _breaker_open_error(provider: str) -> UpstreamError:
+    retry_in_ms = _breakers[provider].stats()["retry_in_ms"]
+    return UpstreamError(503, {"error": f"{provider} circuit open", "retry_in_ms": retry_in_ms}, f"{provider} circuit open")
+
+
+async def _timed_call(provider: str, payload: dict) -> tuple[dict, str]:
+    breaker = _breakers[provider]
+    if not breaker.allow():
+        raise _breaker_open_error(provider)
+    started = time.monotonic()
+    try:
+        data = await _CALLS[provider](payload)
+    except asyncio.CancelledError:
+        # Lost a hedge race: the time so far is a lower bound, but without it a
+        # provider that always loses would never move its own deadline
+        _latency[provider].observe(time.monotonic() - started)
+        breaker.release()
+        raise
+    except Exception as e:
+        breaker.record(not _is_provider_failure(e))
+        raise
+    elapsed = time.monotonic() - started
+    breaker.record(True, elapsed)
+    _latency[provider].observe(elapsed)
+    _trace(provider=provider, upstream_ms=round(elapsed * 1000, 1))
+    return data, provider
+
+
+async def _hedged_call(provider: str, payload: dict) -> tuple[dict, str]:
+    """Call provider; past its hedge deadline, race AI_HEDGE_PROVIDER. Returns (data, provider that answered)."""
+    provider = provider if provider in _CALLS else "groq"
+    secondary = AI_HEDGE_PROVIDER
+    if secondary not in _CALLS or secondary == provider:
+        return await _timed_call(provider, payload)
+
+    primary = asyncio.ensure_future(_timed_call(provider, payload))
+    done, _ = await asyncio.wait({primary}, timeout=_hedge_delay_s(provider))
+    if done:
+        # Answered (or failed) in time: no hedge
+        return primary.result()
+
+    _hedge_counters["fired"] += 1
+    _trace(hedged=True)
+    hedge = asyncio.ensure_future(_timed_call(secondary, {**payload, "model": _model_for_provider(secondary, payload.get("model"))}))
+    pending = {primary, hedge}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    _hedge_counters["primary_won" if task is primary else "hedge_won"] += 1
+                    return task.result()
+            # One side failed: keep waiting for the other
+        _hedge_counters["both_failed"] += 1
+        return primary.result()  # raises the primary's error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _payload_for(provider: str, requested: str, payload: dict) -> dict:
+    return payload if provider == requested else {**payload, "model": _model_for_provider(provider, payload.get("model"))}
+
+
+def _count_failover(requested: str, provider: str):
+    if provider != requested:
+        _metrics.inc("devserver_ai_failovers_total", **{"from": requested, "to": provider})
+        _trace(failover=provider)
+
+
+async def _routed_call(provider: str, payload: dict) -> tuple[dict, str]:
+    """_hedged_call on the first healthy candidate; provider failures move on to the next one."""
+    provider = provider if provider in _CALLS else "groq"
+    error: Exception | None = None
+    for candidate in _route_candidates(provider):
+        try:
+            result = await _hedged_call(candidate, _payload_for(candidate, provider, payload))
+        except (UpstreamError, URLError) as e:
+            if not _is_provider_failure(e):
+                raise
+            error = e
+            continue
+        _count_failover(provider, candidate)
+        return result
+    raise error
+
+
+async def _ai_upstream(provider: str, payload: dict, cache_key: str | None, cache_mode: str | None):
+    try:
+        data, served_by = await _routed_call(provider, payload)
+        encoded = json.dumps(data).encode("utf-8")
+        if cache_mode in ("miss", "refresh"):
+            await _cache_call(_response_cache.put, cache_key, encoded)
+        headers = {"X-AI-Provider": served_by}
+        if cache_mode:
+            headers["X-AI-Cache"] = cache_mode.upper()
+        return _json_bytes_response(200, encoded, headers)
+    except UpstreamError as e:
+        if _fallback_allowed(provider, e.status):
+            _metrics.inc("devserver_ai_fallbacks_total", **{"from": provider, "to": "ollama"})
+            _trace(fallback="ollama")
+            try:
+                data, _ = await _timed_call("ollama", payload)
+                return _json_response(200, data)
+            except Exception as oe:
+                return _json_response(e.status, {"error": "Upstream error", "details": e.details, "fallback_error": str(oe)})
+        return _json_response(e.status, {"error": "Upstream error", "details": e.details})
+    except URLError as e:
+        return _json_response(502, {"error": "Upstream unreachable", "details": str(e)})
+    except Exception as e:
+        return _json_response(500, {"error": "Unexpected server error", "details": str(e)})
+
+
+async def _open_stream(provider: str, payload: dict):
+    """Start a provider stream through its breaker; returns (chunks, first chunk)."""
+    breaker = _breakers[provider]
+    if not breaker.allow():
+        raise _breaker_open_error(provider)
+    started = time.monotonic()
+    chunks = _STREAMS[provider](payload)
+    try:
+        first = await anext(chunks, None)
+    except asyncio.CancelledError:
+        breaker.release()
+        raise
+    except Exception as e:
+        breaker.record(not _is_provider_failure(e))
+        raise
+    # Time to first chunk, so slow-to-start providers count as slow
+    breaker.record(True, time.monotonic() - started)
+    return chunks, first
+
+
+async def _routed_stream(provider: str, payload: dict):
+    provider = provider if provider in _STREAMS else "groq"
+    error: Exception | None = None
+    for candidate in _route_candidates(provider):
+        try:
+            chunks, first = await _open_stream(candidate, _payload_for(candidate, provider, payload))
+        except (UpstreamError, URLError) as e:
+            if not _is_provider_failure(e):
+                raise
+            error = e
+            continue
+        _count_failover(provider, candidate)
+        _trace(provider=candidate)
+        return chunks, first
+    raise error
+
+
+async def _ai_stream(provider: str, payload: dict):
+    _trace(provider=provider, stream=True)
+    try:
+        chunks, first = await _routed_stream(provider, payload)
+    except UpstreamError as e:
+        # Same optional fallback as the non-streaming path
+        if not _fallback_allowed(provider, e.status):
+            return _json_response(e.status, {"error": "Upstream error", "details": e.details})
+        _metrics.inc("devserver_ai_fallbacks_total", **{"from": provider, "to": "ollama"})
+        _trace(fallback="ollama")
+        try:
+            chunks, first = await _open_stream("ollama", payload)
+        except Exception as oe:
+            return _json_response(e.status, {"error": "Upstream error", "details": e.details, "fallback_error": str(oe)})
+    except URLError as e:
+        return _json_response(502, {"error": "Upstream unreachable", "details": str(e)})
+    except Exception as e:
+        return _json_response(500, {"error": "Unexpected server error", "details": str(e)})
+
+    async def frames():
+        try:
+            if first is not None:
+                yield _sse_frame(first)
+            async for chunk in chunks:
+                yield _sse_frame(chunk)
+        except Exception as e:
+            # Headers are already sent; report the failure in-band
+            details = e.details if isinstance(e, UpstreamError) else str(e)
+            yield _sse_frame({"error": "Upstream stream error", "details": details})
+        finally:
+            # Also runs when the browser goes away: stop reading upstream
+            await chunks.aclose()
+        yield b"data: [DONE]\n\n"
+
+    headers = [("Content-Type", "text/event-stream; charset=utf-8"), ("Cache-Control", "no-cache"), ("X-Accel-Buffering", "no")]
+    return 200, headers, frames()
+
+
+_io_loop: asyncio.AbstractEventLoop | None = None
+_io_loop_lock = threading.Lock()
+
+
+def _background_loop() -> asyncio.AbstractEventLoop:
+    """Event loop thread that runs upstream I/O for the threaded server."""
+    global _io_loop
+    with _io_loop_lock:
+        if _io_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="upstream-io", daemon=True).start()
+            _io_loop = loop
+        return _io_loop
+
+
+def _run_async(coro):
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop()).result()
+
+
+def _iter_async(agen):
+    """Drive an async iterator on the background loop from a handler thread."""
+    loop = _background_loop()
+    try:
+        while True:
+            try:
+                yield asyncio.run_coroutine_threadsafe(agen.__anext__(), loop).result()
+            except StopAsyncIteration:
+                return
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+
+def _dev_stats() -> dict:
+    return {
+        "static": _static.stats(),
+        "images": _images.stats() if _images is not None else {"enabled": False},
+        "cache": _response_cache.stats() if _response_cache is not None else {"enabled": False},
+        "coalescing": _single_flight.stats() if _single_flight is not None else {"enabled": False},
+        "compaction": {**_compaction_counters, "budgets": _compact_budgets, "keep_turns": AI_COMPACT_KEEP_TURNS} if AI_COMPACT else {"enabled": False},
+        "latency": {provider: histogram.stats() for provider, histogram in _latency.items()},
+        "routing": {
+            "providers": AI_ROUTING_PROVIDERS,
+            "breakers": {provider: breaker.stats() for provider, breaker in _breakers.items()},
+        },
+        "hedging": {
+            "provider": AI_HEDGE_PROVIDER or None,
+            **_hedge_counters,
+            "deadlines_ms": {provider: round(_hedge_delay_s(provider) * 1000) for provider in _latency} if AI_HEDGE_PROVIDER else {},
+        },
+        "pool": _pool.stats(),
+        "rate_limits": _rate_limiter.stats(),
+    }
+
+
 def get_lan_ip() -> str | None:
     try:
         s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -188,44 +3162,43 @@ def get_lan_ip() -> str | None:
 
 class Handler(BaseHTTPRequestHandler):
     server_version = "GRPerformDevServer/1.0"
-
-    def _send_json(self, status: int, payload: dict):
-        data = json.dumps(payload).encode("utf-8")
-        self.send_response(status)
-        self.send_header("Content-Type", "application/json; charset=utf-8")
-        self.send_header("Content-Length", str(len(data)))
+    # HTTP/1.1: browsers can reuse the connection (every response has a
+    # Content-Length or is chunked); idle keep-alive sockets time out.
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT_S
+    # Headers and body go out as separate writes: without TCP_NODELAY, keep-alive
+    # responses stall ~40 ms on delayed ACKs
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        _metrics.inc("devserver_open_connections")
+
+    def finish(self):
+        _metrics.inc("devserver_open_connections", -1)
+        super().finish()
+
+    def handle_one_request(self):
+        self._status = None
+        self._trace = {}
+        started = time.perf_counter()
+        _metrics.inc("devserver_http_requests_in_flight")
         try:
-            self.end_headers()
-            self.wfile.write(data)
-        except BrokenPipeError:
-            # Client disconnected (e.g., user stopped request); ignore.
-            return
+            super().handle_one_request()
+        finally:
+            _metrics.inc("devserver_http_requests_in_flight", -1)
+            if self._status is not None:
+                _record_request(self.command, self.path, self._status, time.perf_counter() - started, self._trace)
 
-    def _read_json_body(self) -> dict:
-        length = int(self.headers.get("Content-Length", "0"))
-        if length <= 0:
-            return {}
-        if length > 1_000_000:
-            raise ValueError("Body too large")
-        raw = self.rfile.read(length)
-        return json.loads(raw.decode("utf-8"))
+    def send_response(self, code, message=None):
+        self._status = code
+        super().send_response(code, message)
 
     def do_POST(self):
-        if self.path == "/api/ai/chat":
-            return self._handle_ai_chat(force_provider=None)
-        if self.path == "/api/ai/groq-chat":
-            return self._handle_ai_chat(force_provider="groq")
-        if self.path == "/api/ai/ollama-chat":
-            return self._handle_ai_chat(force_provider="ollama")
-        if self.path == "/api/ai/gemini-chat":
-            return self._handle_ai_chat(force_provider="gemini")
-        self.send_error(404, "Not found")
+        return self._handle_api() or self.send_error(404, "Not found")
 
     def do_GET(self):
-        if self.path in ("/api/ai/chat", "/api/ai/groq-chat", "/api/ai/ollama-chat", "/api/ai/gemini-chat"):
-            self.send_response(405)
-            self.send_header("Allow", "POST")
-            self.end_headers()
+        if self._handle_api():
             return
 
         # Browsers often request /favicon.ico by default; avoid noisy 404s in local dev.
@@ -239,266 +3212,315 @@ class Handler(BaseHTTPRequestHandler):
     def do_HEAD(self):
         return self.do_GET()
 
-    def _handle_ai_chat(self, force_provider: str | None):
-        if self.command != "POST":
-            self.send_response(405)
-            self.send_header("Allow", "POST")
-            self.end_headers()
+    def _handle_api(self) -> bool:
+        """Serve /api/* and /metrics through the shared async pipeline; False if the path isn't one."""
+        if not _is_app_route(self.path):
+            return False
+        length = _content_length(self.headers)
+        if length is None or length > _max_body_bytes(self.path):
+            # The body can't be skipped reliably: answer and drop the connection
+            self.close_connection = True
+            self._send(*_json_response(400, {"error": "Invalid JSON: bad Content-Length" if length is None else "Invalid JSON: Body too large"}))
+            return True
+        body = self.rfile.read(length) if length > 0 else b""
+
+        response = _run_async(_api_response(self.command, self.path, self.headers, body, self._trace))
+        if response is None:
+            return False
+        self._send(*response)
+        return True
+
+    def _send(self, status: int, headers: list, body):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        if isinstance(body, bytes):
+            try:
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                # Client disconnected (e.g., user stopped request); ignore.
+                self.close_connection = True
             return
 
+        # Streamed body: chunked transfer encoding
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        pieces = _iter_async(body)
         try:
-            body = self._read_json_body()
-        except Exception as e:
-            return self._send_json(400, {"error": f"Invalid JSON: {e}"})
-
-        model = body.get("model")
-        messages = body.get("messages")
-        temperature = body.get("temperature", 0.2)
-        max_tokens = body.get("max_tokens", 2048)
-        provider_body = str(body.get("provider") or "").strip().lower()
-        json_mode = bool(body.get("jsonMode") or False)
-        response_format = body.get("response_format")
-
-        if not model or not isinstance(messages, list):
-            return self._send_json(400, {"error": "Invalid body: model and messages are required"})
-
-        payload = {
-            "model": model,
-            "messages": messages,
-            "temperature": temperature if isinstance(temperature, (int, float)) else 0.2,
-            "max_tokens": max_tokens if isinstance(max_tokens, int) else 2048,
-        }
-
-        # Optional JSON mode support for OpenAI-compatible APIs (e.g., Groq)
-        # If the client requests jsonMode, enforce it via response_format unless already provided.
-        if isinstance(response_format, dict):
-            payload["response_format"] = response_format
-        elif json_mode:
-            payload["response_format"] = {"type": "json_object"}
+            for piece in pieces:
+                self.wfile.write(f"{len(piece):x}\r\n".encode("ascii") + piece + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Browser went away: closing the iterator stops the upstream read
+            pieces.close()
+            self.close_connection = True
 
-        provider = (force_provider or provider_body or AI_PROVIDER or "groq").lower()
+    def _serve_static(self):
+        status, headers, body = _static_response(self.path, self.headers)
+        if status == 400:
+            return self.send_error(400, "Bad request")
+        if status == 404:
+            return self.send_error(404, "Not found")
 
-        _throttle_ai_calls()
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
 
+        if self.command == "HEAD" or status not in (200, 206):
+            return
         try:
-            if provider == "ollama":
-                data = self._call_ollama(payload)
-                return self._send_json(200, data)
-
-            if provider == "gemini":
-                data = self._call_gemini(payload)
-                return self._send_json(200, data)
-
-            # Default: Groq
-            data = self._call_groq(payload)
-            return self._send_json(200, data)
-        except UpstreamError as e:
-            status = int(getattr(e, "status", 500) or 500)
-            details = getattr(e, "details", None)
-
-            # Optional fallback to Ollama on common upstream failures
-            if (
-                AI_FALLBACK_PROVIDER == "ollama"
-                and provider != "ollama"
-                and status in (401, 403, 429, 500)
-            ):
-                try:
-                    data = self._call_ollama(payload)
-                    return self._send_json(200, data)
-                except Exception as oe:
-                    return self._send_json(status, {"error": "Upstream error", "details": details, "fallback_error": str(oe)})
-
-            return self._send_json(status, {"error": "Upstream error", "details": details})
-        except URLError as e:
-            return self._send_json(502, {"error": "Upstream unreachable", "details": str(e)})
-        except Exception as e:
-            return self._send_json(500, {"error": "Unexpected server error", "details": str(e)})
+            if isinstance(body, FileRange):
+                body.send(self.connection)
+            else:
+                self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # Download cancelled
+            self.close_connection = True
 
-    def _call_groq(self, payload: dict) -> dict:
-        api_key = os.environ.get("GROQ_API_KEY")
-        if not api_key:
-            raise UpstreamError(500, {"error": "Server misconfigured: GROQ_API_KEY missing"}, "GROQ_API_KEY missing")
 
-        attempt = 0
-        while True:
-            status, data, headers = _http_post_json(
-                "https://api.groq.com/openai/v1/chat/completions",
-                payload,
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "User-Agent": "GRPerform/1.0 (Python dev-server)",
-                },
-                timeout=60,
-            )
-
-            if status == 429 and attempt < AI_MAX_429_RETRIES:
-                ra = headers.get("Retry-After") if headers else None
-                try:
-                    ra_ms = int(float(ra) * 1000) if ra is not None else None
-                except Exception:
-                    ra_ms = None
-                backoff = ra_ms if ra_ms is not None else min(5000, int(900 * (2**attempt)))
-                _sleep(backoff)
-                attempt += 1
-                continue
+class ThreadedHTTPServer(ThreadingHTTPServer):
+    # socketserver's default backlog of 5 makes bursts of new connections wait on SYN retries
+    request_queue_size = ASYNC_BACKLOG
 
-            if status >= 400:
-                raise UpstreamError(status, data, "Groq API error")
 
-            return data
+class AsyncHTTPServer:
+    """HTTP/1.1 server on asyncio streams (SERVER_MODE=asyncio).
 
-    def _call_ollama(self, payload: dict) -> dict:
-        model_raw = payload.get("model")
-        looks_like_ollama_id = isinstance(model_raw, str) and (":" in model_raw)
-        model = model_raw if looks_like_ollama_id else OLLAMA_DEFAULT_MODEL
+    Serves the same routes as Handler with keep-alive connections. Upstream
+    AI calls are awaited on the same loop, so thousands of pending calls
+    cost coroutines and sockets instead of threads. Static file reads run in
+    the default thread pool.
+    """
 
-        messages = payload.get("messages") if isinstance(payload.get("messages"), list) else []
-        temperature = payload.get("temperature") if isinstance(payload.get("temperature"), (int, float)) else 0.2
-        max_tokens = payload.get("max_tokens") if isinstance(payload.get("max_tokens"), int) else 2048
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
 
-        url = f"{OLLAMA_URL.rstrip('/')}/api/chat"
-        wants_json = False
-        try:
-            wants_json = isinstance(payload.get("response_format"), dict) and payload.get("response_format", {}).get("type") == "json_object"
-        except Exception:
-            wants_json = False
+    async def start(self) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._serve_connection, self.host, self.port, backlog=ASYNC_BACKLOG, reuse_address=True)
 
-        status, data, _ = _http_post_json(
-            url,
-            {
-                "model": model,
-                "messages": messages,
-                "stream": False,
-                **({"format": "json"} if wants_json else {}),
-                "options": {"temperature": temperature, "num_predict": max_tokens},
-            },
-            headers={},
-            timeout=120,
-        )
-
-        if status >= 400:
-            raise UpstreamError(status, data, "Ollama API error")
-
-        content = ""
+    async def _serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        peer = writer.get_extra_info("peername")
+        client = peer[0] if peer else "-"
+        _metrics.inc("devserver_open_connections")
         try:
-            content = str((data or {}).get("message", {}).get("content") or "")
-        except Exception:
-            content = ""
-        return _wrap_ollama_as_openai(model, content)
-
-    def _call_gemini(self, payload: dict) -> dict:
-        if not GEMINI_API_KEY:
-            raise UpstreamError(500, {"error": "Server misconfigured: GEMINI_API_KEY missing"}, "GEMINI_API_KEY missing")
-
-        model_raw = payload.get("model")
-        model = str(model_raw or "gemini-2.0-flash").strip() or "gemini-2.0-flash"
-
-        messages = payload.get("messages") if isinstance(payload.get("messages"), list) else []
-        temperature = payload.get("temperature") if isinstance(payload.get("temperature"), (int, float)) else 0.2
-        max_tokens = payload.get("max_tokens") if isinstance(payload.get("max_tokens"), int) else 2048
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader), KEEPALIVE_TIMEOUT_S)
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                if request is None:
+                    return
+                if isinstance(request, tuple):
+                    # Malformed request: answer and drop the connection
+                    await self._write(writer, "HTTP/1.1", "GET", *request, keep_alive=False)
+                    return
+                keep_alive = await self._handle(request, writer, client)
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.CancelledError):
+            return
+        finally:
+            _metrics.inc("devserver_open_connections", -1)
+            writer.close()
 
-        wants_json = False
+    async def _read_request(self, reader: asyncio.StreamReader):
+        """Return a request dict, None on a cleanly closed connection, or an error response tuple."""
         try:
-            wants_json = isinstance(payload.get("response_format"), dict) and payload.get("response_format", {}).get("type") == "json_object"
-        except Exception:
-            wants_json = False
-
-        # Gemini: split system instructions vs chat turns
-        sys_parts: list[str] = []
-        contents: list[dict] = []
-        for m in messages:
-            role = str((m or {}).get("role") or "").strip().lower()
-            text = str((m or {}).get("content") or "")
-            if not text:
-                continue
-            if role == "system":
-                sys_parts.append(text)
-                continue
-            gem_role = "user" if role in ("user", "developer") else "model" if role == "assistant" else "user"
-            contents.append({"role": gem_role, "parts": [{"text": text}]})
-
-        body: dict = {
-            "contents": contents or [{"role": "user", "parts": [{"text": ""}]}],
-            "generationConfig": {
-                "temperature": float(temperature),
-                "maxOutputTokens": int(max_tokens),
-                **({"responseMimeType": "application/json"} if wants_json else {}),
-            },
-        }
-        if sys_parts:
-            body["systemInstruction"] = {"parts": [{"text": "\n\n".join(sys_parts)}]}
-
-        url = f"{GEMINI_BASE_URL.rstrip('/')}/models/{model}:generateContent?key={GEMINI_API_KEY}"
-        status, data, _ = _http_post_json(url, body, headers={}, timeout=120)
-        if status >= 400:
-            raise UpstreamError(status, data, "Gemini API error")
-
-        content_text = ""
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise
+        request_line, _, header_block = head.partition(b"\r\n")
         try:
-            cand = (data or {}).get("candidates", [{}])[0]
-            parts = ((cand or {}).get("content") or {}).get("parts") or []
-            if parts:
-                content_text = str((parts[0] or {}).get("text") or "")
-        except Exception:
-            content_text = ""
-
-        wrapped = _wrap_ollama_as_openai(model, content_text)
+            method, target, version = request_line.decode("latin-1").split()
+        except ValueError:
+            return _error_page(400, "Bad request syntax")
+        headers = http.client.parse_headers(io.BytesIO(header_block))
+
+        if "chunked" in str(headers.get("Transfer-Encoding") or "").lower():
+            return _error_page(411, "Length Required")
+        length = _content_length(headers)
+        if length is None:
+            return _json_response(400, {"error": "Invalid JSON: bad Content-Length"})
+        if length > _max_body_bytes(target):
+            return _json_response(400, {"error": "Invalid JSON: Body too large"})
+        body = await reader.readexactly(length) if length > 0 else b""
+
+        connection = str(headers.get("Connection") or "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+        return {"method": method, "path": target, "version": version, "headers": headers, "body": body, "keep_alive": keep_alive}
+
+    async def _handle(self, request: dict, writer: asyncio.StreamWriter, client: str) -> bool:
+        started = time.perf_counter()
+        trace: dict = {}
+        _metrics.inc("devserver_http_requests_in_flight")
         try:
-            usage = (data or {}).get("usageMetadata") or {}
-            wrapped["usage"] = {
-                "prompt_tokens": int(usage.get("promptTokenCount") or 0),
-                "completion_tokens": int(usage.get("candidatesTokenCount") or 0),
-                "total_tokens": int(usage.get("totalTokenCount") or 0),
-            }
-        except Exception:
-            pass
-        return wrapped
+            status, keep_alive = await self._respond(request, writer, client, trace)
+        finally:
+            _metrics.inc("devserver_http_requests_in_flight", -1)
+        _record_request(request["method"], request["path"], status, time.perf_counter() - started, trace)
+        return keep_alive
+
+    async def _respond(self, request: dict, writer: asyncio.StreamWriter, client: str, trace: dict) -> tuple[int, bool]:
+        method, path = request["method"], request["path"]
+        response = None
+        if _is_app_route(path):
+            response = await _api_response(method, path, request["headers"], request["body"], trace)
+        if response is None:
+            if method not in ("GET", "HEAD"):
+                response = _error_page(404 if method == "POST" else 501, "Not found" if method == "POST" else "Unsupported method")
+            elif path.split("?", 1)[0] == "/favicon.ico":
+                # Browsers often request /favicon.ico by default; avoid noisy 404s in local dev.
+                response = 204, [("Cache-Control", "no-store")], b""
+            else:
+                status, headers, body = await asyncio.to_thread(_static_response, path, request["headers"])
+                if status in (400, 404):
+                    response = _error_page(status, "Bad request" if status == 400 else "Not found")
+                else:
+                    response = status, headers, body
+
+        status = response[0]
+        sys.stderr.write(f'{client} - - [{time.strftime("%d/%b/%Y %H:%M:%S")}] "{method} {path} {request["version"]}" {status} -\n')
+        return status, await self._write(writer, request["version"], method, *response, keep_alive=request["keep_alive"])
+
+    async def _write(self, writer: asyncio.StreamWriter, version: str, method: str, status: int, headers: list, body, keep_alive: bool) -> bool:
+        streamed = not isinstance(body, (bytes, FileRange))
+        # HTTP/1.0 clients can't parse chunked bodies: stream raw and close instead
+        chunked = streamed and version == "HTTP/1.1"
+        keep_alive = keep_alive and (chunked or not streamed)
+
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}", f"Server: {Handler.server_version}", f"Date: {formatdate(usegmt=True)}"]
+        lines += [f"{name}: {value}" for name, value in headers]
+        if chunked:
+            lines.append("Transfer-Encoding: chunked")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+        if isinstance(body, FileRange):
+            await writer.drain()
+            if method != "HEAD":
+                try:
+                    await body.send_async(writer)
+                except ConnectionError:
+                    return False
+            return keep_alive
 
-    def _serve_static(self):
-        path = self.path.split("?", 1)[0]
-        if path == "/":
-            path = "/index.html"
+        if not streamed:
+            if method != "HEAD" and body:
+                writer.write(body)
+            await writer.drain()
+            return keep_alive
 
-        # Prevent path traversal
-        rel = path.lstrip("/")
-        file_path = (ROOT_DIR / rel).resolve()
-        if not str(file_path).startswith(str(ROOT_DIR)):
-            return self.send_error(400, "Bad request")
+        try:
+            async for piece in body:
+                writer.write(f"{len(piece):x}\r\n".encode("ascii") + piece + b"\r\n" if chunked else piece)
+                await writer.drain()
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        except ConnectionError:
+            # Browser went away: closing the iterator stops the upstream read
+            await body.aclose()
+            return False
+        return keep_alive
+
+
+def _raise_open_files_limit():
+    """Best-effort: lift the soft RLIMIT_NOFILE to the hard limit (thousands of sockets)."""
+    try:
+        import resource
 
-        if not file_path.exists() or not file_path.is_file():
-            return self.send_error(404, "Not found")
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or hard > soft:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard if hard != resource.RLIM_INFINITY else max(soft, 65536), hard))
+    except (ImportError, ValueError, OSError):
+        return
 
-        ctype, _ = mimetypes.guess_type(str(file_path))
-        if not ctype:
-            ctype = "application/octet-stream"
 
-        data = file_path.read_bytes()
-        self.send_response(200)
-        self.send_header("Content-Type", ctype)
-        self.send_header("Cache-Control", "no-store")
-        self.send_header("Content-Length", str(len(data)))
-        self.end_headers()
+async def _serve_async(ports: list[int]):
+    global _io_loop
+    _io_loop = asyncio.get_running_loop()
+    _raise_open_files_limit()
 
-        if self.command != "HEAD":
-            self.wfile.write(data)
+    servers = []
+    for port in ports:
+        try:
+            servers.append(await AsyncHTTPServer(HOST, port).start())
+        except OSError as e:
+            if port == PORT:
+                raise
+            print(f"[dev-server] Note: couldn't bind :{port} ({e}); continuing on :{PORT}")
+            continue
+        if port != PORT:
+            print(f"[dev-server] Also listening on http://localhost:{port}")
+    await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+def _format_mb(n: int) -> str:
+    return f"{n / (1024 * 1024):.1f} MB"
+
+
+def _pregenerate_images(argv: list[str]) -> int:
+    """`python3 dev-server.py pregenerate-images`: encode every image variant ahead of time."""
+    parser = argparse.ArgumentParser(prog="dev-server.py pregenerate-images", description="Generate the responsive image variants served for ?w= / ?fmt= requests.")
+    parser.add_argument("--dir", default="assets", help="directory to scan, relative to the project root (default: assets)")
+    parser.add_argument("--formats", default="webp", help="comma-separated output formats (default: webp)")
+    parser.add_argument("--prune", action="store_true", help="delete cached variants not produced by this run")
+    args = parser.parse_args(argv)
+
+    images = _images or ImageDerivatives(_static, _cache_dir(IMAGE_CACHE_DIR), ImageDerivatives.parse_widths(IMAGE_WIDTHS), IMAGE_QUALITY, IMAGE_WORKERS)
+    formats = [{"jpg": "jpeg"}.get(fmt, fmt) for fmt in (part.strip().lower() for part in args.formats.split(",")) if fmt]
+    started = time.perf_counter()
+    try:
+        report = images.pregenerate(_cache_dir(args.dir), formats, prune=args.prune)
+    except ValueError as e:
+        print(f"[dev-server] {e}", file=sys.stderr)
+        return 2
+
+    print(f"[dev-server] {report['sources']} images ({_format_mb(report['source_bytes'])}) -> {images.cache_dir}")
+    print(f"[dev-server] {report['generated']} variants generated in {time.perf_counter() - started:.1f}s, {report['pruned']} pruned")
+    for key, size in report["variants"].items():
+        share = size / report["source_bytes"] * 100 if report["source_bytes"] else 0.0
+        print(f"  {key:<14}{_format_mb(size):>10}  ({share:.1f}% of the originals)")
+    for source in report["skipped"]:
+        print(f"[dev-server] skipped: {source}", file=sys.stderr)
+    for error in report["errors"]:
+        print(f"[dev-server] failed: {error}", file=sys.stderr)
+    return 1 if report["errors"] else 0
 
 
 def main():
-    print(f"[dev-server] Running on http://localhost:{PORT}")
+    print(f"[dev-server] Running on http://localhost:{PORT} ({SERVER_MODE} mode)")
     if HOST == "0.0.0.0":
         lan = get_lan_ip()
         if lan:
             print(f"[dev-server] LAN: http://{lan}:{PORT}")
     print("[dev-server] Open: /generate-workout.html (AI) or /coach-dashboard.html (UI)")
 
-    httpd = ThreadingHTTPServer((HOST, PORT), Handler)
+    if SERVER_MODE == "asyncio":
+        try:
+            asyncio.run(_serve_async([PORT] if PORT == 3010 else [PORT, 3010]))
+        except KeyboardInterrupt:
+            pass
+        return
+
+    httpd = ThreadedHTTPServer((HOST, PORT), Handler)
 
     # Compatibility: many links/tests expect :3010.
     # Run an additional listener on 3010 (serving the same app + APIs) when possible.
     # Best-effort only: if the port is busy, keep the main server running.
     if PORT != 3010:
         try:
-            httpd_3010 = ThreadingHTTPServer((HOST, 3010), Handler)
+            httpd_3010 = ThreadedHTTPServer((HOST, 3010), Handler)
             t = threading.Thread(target=httpd_3010.serve_forever, daemon=True)
             t.start()
             print("[dev-server] Also listening on http://localhost:3010")
@@ -513,4 +3535,6 @@ def main():
 
 
 if __name__ == "__main__":
+    if sys.argv[1:2] == ["pregenerate-images"]:
+        sys.exit(_pregenerate_images(sys.argv[2:]))
     main()
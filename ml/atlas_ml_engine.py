@@ -16,25 +16,40 @@ Requires: Python 3.9+, scikit-learn, pandas, numpy
 """
 
 import os
+import copy
 import json
+import shutil
+import asyncio
+import functools
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple, Any
-from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Optional, Tuple, Any, Union
+from dataclasses import dataclass, asdict, field, fields
 from enum import Enum
 
 # ML Libraries
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans, AgglomerativeClustering
-from sklearn.ensemble import GradientBoostingRegressor, IsolationForest
+from sklearn.cluster import KMeans, MiniBatchKMeans, AgglomerativeClustering
+from sklearn.base import clone
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor, IsolationForest
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (enables HalvingRandomSearchCV)
+from sklearn.inspection import permutation_importance
 from sklearn.preprocessing import StandardScaler, MinMaxScaler
-from sklearn.model_selection import cross_val_score
+from sklearn.model_selection import KFold, HalvingRandomSearchCV
 from sklearn.metrics import mean_squared_error, r2_score
 import joblib
 
 # API
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 import uvicorn
 
@@ -86,6 +101,239 @@ class PredictionOutput:
     risk_factors: List[str]
     recommendations: List[str]
 
+# Training progress hook: progress(stage, info), e.g. ("clustering_k", {"k": 3, ...})
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
+
+def _report(progress: Optional[ProgressCallback], stage: str, **info):
+    if progress is not None:
+        progress(stage, info)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# FEATURE STORE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+# Athlete-level columns (AthleteFeatures fields) and their API defaults
+ATHLETE_COLUMNS = [f.name for f in fields(AthleteFeatures)]
+ATHLETE_DEFAULTS = {
+    "body_fat_percentage": 15.0,
+    "avg_hrv": 60.0,
+    "avg_sleep_quality": 75.0,
+    "avg_recovery_score": 75.0,
+    "weekly_training_volume": 20.0,
+    "avg_intensity": 75.0,
+    "strength_ratio": 1.5,
+    "progression_rate": 1.0,
+    "adherence_rate": 85.0,
+    "injury_history": 0.0,
+    "stress_level": 5.0
+}
+
+# Prediction-level columns; planned_intensity is PredictionInput.avg_intensity
+PREDICTION_DEFAULTS = {
+    "training_weeks": 12.0,
+    "weekly_volume": 15.0,
+    "planned_intensity": 75.0
+}
+
+# Model inputs, in matrix column order
+CLUSTER_FEATURES = [
+    "avg_hrv", "avg_sleep_quality", "avg_recovery_score", "weekly_training_volume",
+    "avg_intensity", "progression_rate", "adherence_rate", "training_age",
+    "strength_ratio", "stress_level"
+]
+PREDICTION_FEATURES = [
+    "current_1rm", "training_weeks", "weekly_volume", "planned_intensity",
+    "training_age", "body_weight", "avg_hrv", "avg_recovery_score",
+    "progression_rate", "adherence_rate", "stress_level"
+]
+
+class AthleteFeatureStore:
+    """
+    Columnar feature store: one contiguous float64 array per feature, rows
+    keyed by athlete_id, with an optional target column (future 1RM).
+    
+    Both engines accept a store wherever they accept lists of
+    AthleteFeatures / PredictionInput, so large training and scoring sets
+    run on column arrays without per-row Python work. Model matrices are
+    assembled once per column set and cached.
+    """
+    
+    def __init__(self, columns: Dict[str, np.ndarray], athlete_ids: Optional[np.ndarray] = None,
+                 target: Optional[np.ndarray] = None):
+        self.columns = {name: np.ascontiguousarray(values, dtype=np.float64) for name, values in columns.items()}
+        n = len(next(iter(self.columns.values()))) if self.columns else 0
+        self.athlete_ids = np.asarray(athlete_ids if athlete_ids is not None else np.arange(n).astype(str), dtype=object)
+        self.target = np.ascontiguousarray(target, dtype=np.float64) if target is not None else None
+        self._matrices: Dict[Tuple[str, ...], np.ndarray] = {}
+    
+    def __len__(self) -> int:
+        return len(self.athlete_ids)
+    
+    def column(self, name: str) -> np.ndarray:
+        if name not in self.columns:
+            raise ValueError(f"Feature store has no column '{name}'")
+        return self.columns[name]
+    
+    def matrix(self, names: List[str]) -> np.ndarray:
+        """(n_rows, len(names)) C-contiguous float64 matrix"""
+        key = tuple(names)
+        if key not in self._matrices:
+            X = np.empty((len(self), len(names)), dtype=np.float64)
+            for j, name in enumerate(names):
+                X[:, j] = self.column(name)
+            self._matrices[key] = X
+        return self._matrices[key]
+    
+    def subset(self, rows) -> "AthleteFeatureStore":
+        rows = np.asarray(rows, dtype=np.intp)
+        return AthleteFeatureStore(
+            {name: values[rows] for name, values in self.columns.items()},
+            self.athlete_ids[rows],
+            self.target[rows] if self.target is not None else None
+        )
+    
+    def to_frame(self) -> pd.DataFrame:
+        frame = pd.DataFrame(self.columns, index=pd.Index(self.athlete_ids, name="athlete_id"))
+        if self.target is not None:
+            frame["target_1rm"] = self.target
+        return frame
+    
+    @classmethod
+    def coerce(cls, data: Union["AthleteFeatureStore", List[Any]]) -> "AthleteFeatureStore":
+        return data if isinstance(data, cls) else cls.from_records(data)
+    
+    @classmethod
+    def from_records(cls, records: List[Any]) -> "AthleteFeatureStore":
+        """Build a store from AthleteFeatures or PredictionInput objects"""
+        n = len(records)
+        if n and isinstance(records[0], PredictionInput):
+            athletes = [r.features for r in records]
+            columns = {
+                "current_1rm": np.fromiter((r.current_1rm for r in records), np.float64, n),
+                "training_weeks": np.fromiter((r.training_weeks for r in records), np.float64, n),
+                "weekly_volume": np.fromiter((r.weekly_volume for r in records), np.float64, n),
+                "planned_intensity": np.fromiter((r.avg_intensity for r in records), np.float64, n)
+            }
+            ids = np.array([r.athlete_id for r in records], dtype=object)
+        else:
+            athletes, columns, ids = records, {}, None
+        
+        for name in ATHLETE_COLUMNS:
+            columns[name] = np.fromiter((getattr(a, name) for a in athletes), np.float64, n)
+        return cls(columns, ids)
+    
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame, target_column: Optional[str] = None,
+                   id_column: str = "athlete_id") -> "AthleteFeatureStore":
+        """Build a store from a wide frame (one column per feature); missing features get API defaults"""
+        if id_column in frame.columns:
+            ids = frame[id_column].astype(str).to_numpy(dtype=object)
+        else:
+            ids = frame.index.astype(str).to_numpy(dtype=object)
+        
+        columns = {}
+        for name in ATHLETE_COLUMNS + ["current_1rm"] + list(PREDICTION_DEFAULTS):
+            default = ATHLETE_DEFAULTS.get(name, PREDICTION_DEFAULTS.get(name))
+            if name in frame.columns:
+                values = pd.to_numeric(frame[name], errors="coerce")
+                columns[name] = (values.fillna(default) if default is not None else values).to_numpy(np.float64)
+            elif default is not None:
+                columns[name] = np.full(len(frame), default, dtype=np.float64)
+        
+        target = frame[target_column].to_numpy(np.float64) if target_column else None
+        return cls(columns, ids, target)
+    
+    @classmethod
+    def from_csv(cls, path: str, target_column: Optional[str] = None, **kwargs) -> "AthleteFeatureStore":
+        return cls.from_frame(pd.read_csv(path, **kwargs), target_column)
+    
+    @classmethod
+    def from_parquet(cls, path: str, target_column: Optional[str] = None, **kwargs) -> "AthleteFeatureStore":
+        """Requires pyarrow or fastparquet"""
+        return cls.from_frame(pd.read_parquet(path, **kwargs), target_column)
+    
+    @classmethod
+    def from_tables(cls, athletes: Union[str, pd.DataFrame],
+                    progress_metrics: Union[str, pd.DataFrame, None] = None) -> "AthleteFeatureStore":
+        """
+        Athlete-level store from exports of the `athletes` and
+        `progress_metrics` tables (CSV or Parquet paths, or DataFrames).
+        
+        progress_metrics rows whose metric_name is a feature name
+        (e.g. "avg_hrv") are averaged per athlete; the latest "weight" and
+        "body_fat" metrics override the athletes table values.
+        """
+        return cls.from_frame(_athlete_table_frame(athletes, progress_metrics))
+    
+    @classmethod
+    def progression_from_tables(cls, athletes: Union[str, pd.DataFrame],
+                                progress_metrics: Union[str, pd.DataFrame],
+                                metric_type: str = "exercise_pr") -> "AthleteFeatureStore":
+        """
+        Training set for StrengthProgressionPredictor: consecutive
+        `exercise_pr` records per athlete and exercise become
+        (current_1rm, training_weeks) -> target_1rm pairs.
+        """
+        metrics = _read_table(progress_metrics)
+        prs = metrics[metrics["metric_type"] == metric_type].copy()
+        prs["recorded_at"] = pd.to_datetime(prs["recorded_at"], utc=True)
+        prs = prs.sort_values(["athlete_id", "metric_name", "recorded_at"])
+        
+        group = prs.groupby(["athlete_id", "metric_name"], sort=False)
+        prs["current_1rm"] = group["value"].shift(1)
+        elapsed = prs["recorded_at"] - group["recorded_at"].shift(1)
+        prs["training_weeks"] = np.maximum(1, np.round(elapsed.dt.days / 7))
+        pairs = prs.dropna(subset=["current_1rm"]).rename(columns={"value": "target_1rm"})
+        
+        athlete_frame = _athlete_table_frame(athletes, metrics)
+        frame = pairs[["athlete_id", "current_1rm", "training_weeks", "target_1rm"]].merge(
+            athlete_frame, on="athlete_id", how="inner"
+        )
+        return cls.from_frame(frame, target_column="target_1rm")
+
+def _read_table(source: Union[str, pd.DataFrame]) -> pd.DataFrame:
+    """DataFrame passthrough, or read a CSV/Parquet export by file extension"""
+    if isinstance(source, pd.DataFrame):
+        return source
+    if str(source).lower().endswith((".parquet", ".pq")):
+        return pd.read_parquet(source)
+    return pd.read_csv(source)
+
+def _athlete_table_frame(athletes: Union[str, pd.DataFrame],
+                         progress_metrics: Union[str, pd.DataFrame, None]) -> pd.DataFrame:
+    """Wide athlete feature frame from the athletes / progress_metrics exports"""
+    table = _read_table(athletes)
+    frame = pd.DataFrame({"athlete_id": table["id"].astype(str)})
+    for source, target in (("years_of_training", "training_age"), ("weight_kg", "body_weight"),
+                           ("height_cm", "height"), ("body_fat_percentage", "body_fat_percentage")):
+        if source in table.columns:
+            frame[target] = pd.to_numeric(table[source], errors="coerce").to_numpy()
+    if "birth_date" in table.columns:
+        birth = pd.to_datetime(table["birth_date"], errors="coerce")
+        frame["age"] = ((pd.Timestamp.now() - birth).dt.days / 365.25).to_numpy()
+    
+    if progress_metrics is not None:
+        metrics = _read_table(progress_metrics).copy()
+        metrics["athlete_id"] = metrics["athlete_id"].astype(str)
+        
+        named = metrics[metrics["metric_name"].isin(ATHLETE_COLUMNS)]
+        if len(named):
+            means = named.pivot_table(index="athlete_id", columns="metric_name", values="value", aggfunc="mean")
+            frame = frame.drop(columns=[c for c in means.columns if c in frame.columns])
+            frame = frame.merge(means, left_on="athlete_id", right_index=True, how="left")
+        
+        for metric_type, target in (("weight", "body_weight"), ("body_fat", "body_fat_percentage")):
+            rows = metrics[metrics["metric_type"] == metric_type]
+            if len(rows):
+                latest = rows.sort_values("recorded_at").groupby("athlete_id")["value"].last()
+                mapped = frame["athlete_id"].map(latest)
+                frame[target] = mapped.fillna(frame[target]) if target in frame.columns else mapped
+    
+    for name in ("age", "training_age", "body_weight", "height"):
+        if name not in frame.columns:
+            frame[name] = np.nan
+    return frame
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # ATHLETE CLUSTERING ENGINE
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -94,87 +342,241 @@ class AthleteClusteringEngine:
     """
     Clusters athletes based on their response patterns to training.
     Uses K-Means with optimal cluster selection via silhouette score.
+    
+    Fit modes:
+    - exact: KMeans(n_init=10) per candidate k, full silhouette score
+    - scalable: MiniBatchKMeans per candidate k, scored on a stratified
+      sample of sample_size rows (or with the Calinski-Harabasz index)
+    - auto: scalable above scalable_threshold athletes, exact otherwise
+    
+    Candidate k values are evaluated in parallel (n_jobs) and the winning
+    candidate model is kept as-is instead of being refitted.
+    
+    partial_fit() folds new athletes into the scaler statistics and the
+    centroids incrementally, and only re-clusters a reservoir sample of the
+    population when drift is measured (inertia ratio or scaler mean shift).
     """
     
-    def __init__(self, n_clusters: int = 6):
+    FIT_MODES = ("auto", "exact", "scalable")
+    CRITERIA = ("silhouette", "calinski_harabasz")
+    
+    def __init__(self, n_clusters: int = 6, fit_mode: str = "auto", criterion: str = "silhouette",
+                 sample_size: int = 10000, n_jobs: Optional[int] = None,
+                 scalable_threshold: int = 10000, reservoir_size: int = 50000,
+                 drift_threshold: float = 1.5, shift_threshold: float = 0.5):
+        if fit_mode not in self.FIT_MODES:
+            raise ValueError(f"Unknown fit mode '{fit_mode}'. Use one of {self.FIT_MODES}")
+        if criterion not in self.CRITERIA:
+            raise ValueError(f"Unknown criterion '{criterion}'. Use one of {self.CRITERIA}")
         self.n_clusters = n_clusters
+        self.fit_mode = fit_mode
+        self.criterion = criterion
+        self.sample_size = sample_size
+        self.n_jobs = n_jobs
+        self.scalable_threshold = scalable_threshold
+        self.reservoir_size = reservoir_size
+        self.drift_threshold = drift_threshold
+        self.shift_threshold = shift_threshold
         self.kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
         self.scaler = StandardScaler()
         self.cluster_labels = list(AthleteCluster)
         self.is_fitted = False
         
-    def prepare_features(self, athletes: List[AthleteFeatures]) -> np.ndarray:
-        """Convert athlete features to numpy array for clustering"""
-        feature_matrix = []
-        
-        for athlete in athletes:
-            features = [
-                athlete.avg_hrv,
-                athlete.avg_sleep_quality,
-                athlete.avg_recovery_score,
-                athlete.weekly_training_volume,
-                athlete.avg_intensity,
-                athlete.progression_rate,
-                athlete.adherence_rate,
-                athlete.training_age,
-                athlete.strength_ratio,
-                athlete.stress_level
-            ]
-            feature_matrix.append(features)
-            
-        return np.array(feature_matrix)
+        # Incremental update state (set by fit)
+        self.center_counts: Optional[np.ndarray] = None
+        self.baseline_inertia: Optional[float] = None
+        self.running_inertia: Optional[float] = None
+        self.fit_mean: Optional[np.ndarray] = None
+        self.fit_scale: Optional[np.ndarray] = None
+        self.reservoir: Optional[np.ndarray] = None
+        self.n_seen = 0
+        self._rng = np.random.default_rng(42)
+        
+    def prepare_features(self, athletes: Union[List[AthleteFeatures], AthleteFeatureStore]) -> np.ndarray:
+        """Convert athlete features to a contiguous float64 matrix for clustering"""
+        return AthleteFeatureStore.coerce(athletes).matrix(CLUSTER_FEATURES)
     
-    def fit(self, athletes: List[AthleteFeatures]) -> Dict[str, Any]:
+    def fit(self, athletes: Union[List[AthleteFeatures], AthleteFeatureStore],
+            progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
         """Fit clustering model on athlete data"""
-        X = self.prepare_features(athletes)
+        return self._fit_matrix(self.prepare_features(athletes), progress)
+    
+    def _fit_matrix(self, X: np.ndarray, progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        self.scaler = StandardScaler()
         X_scaled = self.scaler.fit_transform(X)
         
-        # Find optimal number of clusters
-        best_score = -1
-        best_k = self.n_clusters
+        mode = self.fit_mode
+        if mode == "auto":
+            mode = "scalable" if len(X_scaled) > self.scalable_threshold else "exact"
+        
+        # Find optimal number of clusters, evaluating candidates in parallel
+        k_values = range(2, min(len(X), 8))
+        results = joblib.Parallel(n_jobs=self.n_jobs, return_as="generator")(
+            joblib.delayed(_evaluate_cluster_count)(
+                X_scaled, k, mode, self.criterion, self.sample_size
+            )
+            for k in k_values
+        )
         
-        from sklearn.metrics import silhouette_score
+        candidates = []
+        for k, score, model in results:
+            candidates.append((k, score, model))
+            _report(progress, "clustering_k", k=k, score=score, done=len(candidates), total=len(k_values))
         
-        for k in range(2, min(len(athletes), 8)):
-            kmeans_temp = KMeans(n_clusters=k, random_state=42, n_init=10)
-            labels = kmeans_temp.fit_predict(X_scaled)
-            score = silhouette_score(X_scaled, labels)
-            
+        best_score = -1
+        best_k = self.n_clusters
+        best_model = None
+        for k, score, model in candidates:
             if score > best_score:
                 best_score = score
                 best_k = k
+                best_model = model
+        
+        # Reuse the winning candidate; only fit here if no candidate could be evaluated
+        if best_model is None:
+            best_model = KMeans(n_clusters=best_k, random_state=42, n_init=10).fit(X_scaled)
         
-        # Fit with optimal k
         self.n_clusters = best_k
-        self.kmeans = KMeans(n_clusters=best_k, random_state=42, n_init=10)
-        self.kmeans.fit(X_scaled)
+        self.kmeans = best_model
         self.is_fitted = True
+        self._reset_incremental_state(X, X_scaled)
         
         return {
             "optimal_clusters": best_k,
-            "silhouette_score": best_score,
+            "fit_mode": mode,
+            "criterion": self.criterion,
+            f"{self.criterion}_score": best_score,
+            "candidate_scores": {k: score for k, score, _ in candidates},
             "cluster_centers": self.kmeans.cluster_centers_.tolist()
         }
     
+    def partial_fit(self, athletes: Union[List[AthleteFeatures], AthleteFeatureStore],
+                    refit_on_drift: bool = True) -> Dict[str, Any]:
+        """
+        Fold new athletes into the model without a full retrain.
+        
+        - Scaler mean/variance are updated as running statistics and the
+          centroids are re-expressed in the new scaled space
+        - Each centroid moves towards its new members with a 1/count
+          learning rate (MiniBatchKMeans-style running mean)
+        - Drift is the ratio of the running inertia to the inertia at fit
+          time, plus the shift of the feature means in fit-time standard
+          deviations; past either threshold the reservoir is re-clustered
+        """
+        X = self.prepare_features(athletes)
+        if not self.is_fitted:
+            return {"updated": len(X), "refitted": True, "fit": self._fit_matrix(X)}
+        if len(X) == 0:
+            return {"updated": 0, "drift_detected": False, "refitted": False}
+        
+        # Copy-on-write so concurrent predictions never see half-updated state
+        old_mean, old_scale = self.scaler.mean_, self.scaler.scale_
+        centers_raw = self.kmeans.cluster_centers_ * old_scale + old_mean
+        scaler = copy.deepcopy(self.scaler)
+        scaler.partial_fit(X)
+        centers = (centers_raw - scaler.mean_) / scaler.scale_
+        
+        X_scaled = scaler.transform(X)
+        distances = _squared_distances(X_scaled, centers)
+        labels = distances.argmin(axis=1)
+        batch_inertia = float(distances[np.arange(len(X)), labels].mean())
+        
+        counts = np.array(self.center_counts, dtype=float)
+        for label in np.unique(labels):
+            members = X_scaled[labels == label]
+            counts[label] += len(members)
+            centers[label] += (members.sum(axis=0) - len(members) * centers[label]) / counts[label]
+        
+        kmeans = copy.deepcopy(self.kmeans)
+        kmeans.cluster_centers_ = centers
+        self.scaler, self.kmeans, self.center_counts = scaler, kmeans, counts
+        
+        # Exponentially weighted inertia, weighted by batch size
+        weight = min(1.0, len(X) / max(1.0, self.reservoir_size * 0.1))
+        self.running_inertia = (1 - weight) * self.running_inertia + weight * batch_inertia
+        self._update_reservoir(X)
+        
+        inertia_ratio = self.running_inertia / self.baseline_inertia if self.baseline_inertia else 1.0
+        scaler_shift = float(np.max(np.abs(scaler.mean_ - self.fit_mean) / self.fit_scale))
+        drift = inertia_ratio > self.drift_threshold or scaler_shift > self.shift_threshold
+        
+        result = {
+            "updated": len(X),
+            "n_seen": self.n_seen,
+            "batch_inertia": batch_inertia,
+            "baseline_inertia": self.baseline_inertia,
+            "inertia_ratio": inertia_ratio,
+            "scaler_shift": scaler_shift,
+            "drift_detected": drift,
+            "refitted": False
+        }
+        if drift and refit_on_drift:
+            n_seen = self.n_seen
+            result["fit"] = self._fit_matrix(np.array(self.reservoir))
+            self.n_seen = n_seen
+            result["refitted"] = True
+        return result
+    
+    def _reset_incremental_state(self, X: np.ndarray, X_scaled: np.ndarray):
+        distances = _squared_distances(X_scaled, self.kmeans.cluster_centers_)
+        labels = distances.argmin(axis=1)
+        self.center_counts = np.bincount(labels, minlength=self.n_clusters).astype(float)
+        self.baseline_inertia = float(distances[np.arange(len(X)), labels].mean())
+        self.running_inertia = self.baseline_inertia
+        self.fit_mean = self.scaler.mean_.copy()
+        self.fit_scale = self.scaler.scale_.copy()
+        
+        self.n_seen = len(X)
+        if len(X) > self.reservoir_size:
+            X = X[self._rng.choice(len(X), size=self.reservoir_size, replace=False)]
+        self.reservoir = np.array(X, dtype=float)
+    
+    def _update_reservoir(self, X: np.ndarray):
+        """Reservoir sampling (Algorithm R) of raw feature rows for re-clustering"""
+        free = max(0, self.reservoir_size - len(self.reservoir))
+        head, tail = X[:free], X[free:]
+        reservoir = np.vstack([self.reservoir, head]) if len(head) else np.array(self.reservoir)
+        
+        if len(tail):
+            seen = self.n_seen + len(head) + np.arange(len(tail))
+            slots = self._rng.integers(0, seen + 1)
+            keep = slots < self.reservoir_size
+            reservoir[slots[keep]] = tail[keep]
+        
+        self.reservoir = reservoir
+        self.n_seen += len(X)
+    
     def predict(self, athlete: AthleteFeatures) -> Tuple[str, Dict]:
         """Predict cluster for a single athlete"""
+        return self.predict_batch([athlete])[0]
+    
+    def predict_batch(self, athletes: Union[List[AthleteFeatures], AthleteFeatureStore]) -> List[Tuple[str, Dict]]:
+        """Predict clusters for many athletes with one scaler/model pass"""
         if not self.is_fitted:
             raise ValueError("Model not fitted. Call fit() first.")
+        if len(athletes) == 0:
+            return []
             
-        X = self.prepare_features([athlete])
+        X = self.prepare_features(athletes)
         X_scaled = self.scaler.transform(X)
         
-        cluster_id = self.kmeans.predict(X_scaled)[0]
-        distances = self.kmeans.transform(X_scaled)[0]
+        # Distances to every centroid; the nearest one is the assigned cluster
+        distances = self.kmeans.transform(X_scaled)
+        cluster_ids = distances.argmin(axis=1)
+        nearest = distances[np.arange(len(cluster_ids)), cluster_ids]
+        confidences = 1 - nearest / distances.sum(axis=1)
         
         # Map cluster to meaningful label based on centroid characteristics
-        cluster_type = self._interpret_cluster(cluster_id)
-        
-        return cluster_type, {
-            "cluster_id": int(cluster_id),
-            "confidence": 1 - (distances[cluster_id] / distances.sum()),
-            "distances_to_clusters": distances.tolist()
-        }
+        cluster_types = {cid: self._interpret_cluster(cid) for cid in np.unique(cluster_ids)}
+        
+        return [
+            (cluster_types[cid], {
+                "cluster_id": int(cid),
+                "confidence": float(confidence),
+                "distances_to_clusters": row.tolist()
+            })
+            for cid, confidence, row in zip(cluster_ids, confidences, distances)
+        ]
     
     def _interpret_cluster(self, cluster_id: int) -> str:
         """Interpret cluster based on centroid features"""
@@ -209,21 +611,137 @@ class AthleteClusteringEngine:
         return AthleteCluster.MODERATE_RESPONDER.value
     
     def save(self, path: str):
-        """Save model to disk"""
+        """Save model to disk (uncompressed, so it can be memory-mapped on load)"""
         joblib.dump({
             'kmeans': self.kmeans,
             'scaler': self.scaler,
             'n_clusters': self.n_clusters,
-            'is_fitted': self.is_fitted
+            'is_fitted': self.is_fitted,
+            'incremental': {
+                'center_counts': self.center_counts,
+                'baseline_inertia': self.baseline_inertia,
+                'running_inertia': self.running_inertia,
+                'fit_mean': self.fit_mean,
+                'fit_scale': self.fit_scale,
+                'reservoir': self.reservoir,
+                'n_seen': self.n_seen
+            }
         }, path)
     
-    def load(self, path: str):
-        """Load model from disk"""
-        data = joblib.load(path)
+    def load(self, path: str, mmap_mode: Optional[str] = None):
+        """Load model from disk; mmap_mode="r" maps centroids and scaler stats read-only"""
+        data = joblib.load(path, mmap_mode=mmap_mode)
         self.kmeans = data['kmeans']
         self.scaler = data['scaler']
         self.n_clusters = data['n_clusters']
         self.is_fitted = data['is_fitted']
+        for name, value in data.get('incremental', {}).items():
+            setattr(self, name, value)
+
+def _squared_distances(X: np.ndarray, centers: np.ndarray) -> np.ndarray:
+    """Squared euclidean distance of every row to every center, shape (n, k)"""
+    distances = (X ** 2).sum(axis=1)[:, None] - 2 * X @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    return np.maximum(distances, 0, out=distances)
+
+def _evaluate_cluster_count(X: np.ndarray, k: int, mode: str, criterion: str,
+                            sample_size: int) -> Tuple[int, float, Any]:
+    """Fit one candidate k and score it; returns (k, score, fitted model)"""
+    from sklearn.metrics import silhouette_score, calinski_harabasz_score
+    
+    if mode == "scalable":
+        model = MiniBatchKMeans(n_clusters=k, random_state=42, n_init=3, batch_size=2048)
+    else:
+        model = KMeans(n_clusters=k, random_state=42, n_init=10)
+    labels = model.fit_predict(X)
+    
+    if criterion == "calinski_harabasz":
+        # Linear in n, no sampling needed
+        return k, float(calinski_harabasz_score(X, labels)), model
+    
+    if mode == "scalable" and len(X) > sample_size:
+        idx = _stratified_sample(labels, sample_size, np.random.default_rng(42))
+        X, labels = X[idx], labels[idx]
+    if len(np.unique(labels)) < 2:
+        return k, -1.0, model
+    return k, float(silhouette_score(X, labels)), model
+
+def _stratified_sample(labels: np.ndarray, sample_size: int, rng: np.random.Generator) -> np.ndarray:
+    """Indices of a sample that keeps every cluster's share of the population"""
+    idx = []
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        take = max(1, int(round(sample_size * len(members) / len(labels))))
+        idx.append(rng.choice(members, size=min(take, len(members)), replace=False))
+    return np.concatenate(idx)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# CONFIDENCE INTERVAL ENGINE
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ConfidenceIntervalEngine:
+    """
+    Confidence intervals for Gradient Boosting predictions, computed for a
+    whole input matrix at once.
+    
+    Methods:
+    - tree_variance: spread of the per-tree contributions. A single
+      model.apply() call returns the leaf reached in every tree and the
+      contributions are gathered from a precomputed leaf-value table.
+    - quantile: paired lower/upper models (GradientBoosting or
+      HistGradientBoosting) trained with quantile loss at alpha/2 and
+      1 - alpha/2.
+    """
+    
+    METHODS = ("tree_variance", "quantile")
+    
+    def __init__(self, method: str = "tree_variance", alpha: float = 0.05, z: float = 1.96):
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown CI method '{method}'. Use one of {self.METHODS}")
+        self.method = method
+        self.alpha = alpha
+        self.z = z
+        self.leaf_values: Optional[np.ndarray] = None
+        self.lower_model = None
+        self.upper_model = None
+        
+    def fit(self, model, X: np.ndarray, y: np.ndarray):
+        """Prepare the interval estimator for a freshly fitted model"""
+        if self.method == "quantile":
+            level = "quantile" if isinstance(model, HistGradientBoostingRegressor) else "alpha"
+            self.lower_model = clone(model).set_params(loss="quantile", **{level: self.alpha / 2})
+            self.upper_model = clone(model).set_params(loss="quantile", **{level: 1 - self.alpha / 2})
+            self.lower_model.fit(X, y)
+            self.upper_model.fit(X, y)
+        else:
+            self.leaf_values = self._build_leaf_values(model)
+        return self
+    
+    def interval(self, model, X: np.ndarray, predicted: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (lower, upper) bounds for every row of X"""
+        if self.method == "quantile":
+            lower = self.lower_model.predict(X)
+            upper = self.upper_model.predict(X)
+            return np.minimum(lower, upper), np.maximum(lower, upper)
+        
+        std = self.tree_contributions(model, X).std(axis=1)
+        return predicted - self.z * std, predicted + self.z * std
+    
+    def tree_contributions(self, model, X: np.ndarray) -> np.ndarray:
+        """Raw output of every tree for every row, shape (n_samples, n_estimators)"""
+        if self.leaf_values is None:
+            self.leaf_values = self._build_leaf_values(model)
+        
+        leaves = model.apply(X).reshape(len(X), -1).astype(np.intp)
+        return self.leaf_values[np.arange(leaves.shape[1]), leaves]
+    
+    @staticmethod
+    def _build_leaf_values(model) -> np.ndarray:
+        """Padded (n_estimators, max_node_count) table of node output values"""
+        trees = [estimator[0].tree_ for estimator in model.estimators_]
+        table = np.zeros((len(trees), max(t.node_count for t in trees)))
+        for i, tree in enumerate(trees):
+            table[i, :tree.node_count] = tree.value[:, 0, 0]
+        return table
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # STRENGTH PROGRESSION PREDICTOR
@@ -232,10 +750,38 @@ class AthleteClusteringEngine:
 class StrengthProgressionPredictor:
     """
     Predicts future 1RM based on athlete characteristics and training parameters.
-    Uses Gradient Boosting with confidence intervals.
+    Uses Gradient Boosting with confidence intervals ("tree_variance" or "quantile").
+    
+    Training options:
+    - n_jobs: CV folds (and the hyperparameter search) run in parallel
+    - tune: successive-halving random search over the boosting parameters
+      before cross-validation
+    - hist_threshold: at or above this many rows the model switches to
+      HistGradientBoostingRegressor (intervals then use the quantile method,
+      since histogram trees have no per-tree leaf table)
     """
     
-    def __init__(self):
+    FEATURE_NAMES = ['current_1rm', 'weeks', 'volume', 'intensity', 'training_age',
+                     'weight', 'hrv', 'recovery', 'progression', 'adherence', 'stress']
+    
+    GBR_SEARCH_SPACE = {
+        "n_estimators": [100, 200, 400],
+        "max_depth": [3, 4, 5, 6],
+        "learning_rate": [0.03, 0.05, 0.1, 0.2],
+        "subsample": [0.7, 0.85, 1.0],
+        "min_samples_leaf": [1, 5, 20]
+    }
+    
+    HIST_SEARCH_SPACE = {
+        "max_iter": [100, 200, 400],
+        "max_leaf_nodes": [15, 31, 63],
+        "learning_rate": [0.03, 0.05, 0.1, 0.2],
+        "min_samples_leaf": [10, 20, 50],
+        "l2_regularization": [0.0, 0.1, 1.0]
+    }
+    
+    def __init__(self, ci_method: str = "tree_variance", n_jobs: Optional[int] = None,
+                 tune: bool = False, tune_candidates: int = 24, hist_threshold: Optional[int] = 50000):
         self.model = GradientBoostingRegressor(
             n_estimators=100,
             max_depth=5,
@@ -243,159 +789,206 @@ class StrengthProgressionPredictor:
             random_state=42
         )
         self.scaler = StandardScaler()
+        self.ci_engine = ConfidenceIntervalEngine(method=ci_method)
+        self.n_jobs = n_jobs
+        self.tune = tune
+        self.tune_candidates = tune_candidates
+        self.hist_threshold = hist_threshold
         self.is_fitted = False
         
-    def prepare_features(self, data: List[PredictionInput]) -> np.ndarray:
-        """Prepare features for prediction"""
-        features = []
-        
-        for d in data:
-            row = [
-                d.current_1rm,
-                d.training_weeks,
-                d.weekly_volume,
-                d.avg_intensity,
-                d.features.training_age,
-                d.features.body_weight,
-                d.features.avg_hrv,
-                d.features.avg_recovery_score,
-                d.features.progression_rate,
-                d.features.adherence_rate,
-                d.features.stress_level
-            ]
-            features.append(row)
-            
-        return np.array(features)
+    def prepare_features(self, data: Union[List[PredictionInput], AthleteFeatureStore]) -> np.ndarray:
+        """Prepare a contiguous float64 feature matrix for prediction"""
+        return AthleteFeatureStore.coerce(data).matrix(PREDICTION_FEATURES)
     
-    def fit(self, data: List[PredictionInput], targets: List[float]) -> Dict:
-        """Train the model on historical data"""
-        X = self.prepare_features(data)
-        X_scaled = self.scaler.fit_transform(X)
-        y = np.array(targets)
-        
-        # Cross-validation
-        cv_scores = cross_val_score(self.model, X_scaled, y, cv=5, scoring='r2')
+    def fit(self, data: Union[List[PredictionInput], AthleteFeatureStore],
+            targets: Optional[List[float]] = None,
+            progress: Optional[ProgressCallback] = None) -> Dict:
+        """Train the model on historical data (targets default to the store's target column)"""
+        timings: Dict[str, float] = {}
+        
+        @contextmanager
+        def stage(name: str):
+            start = time.perf_counter()
+            yield
+            timings[name] = round(time.perf_counter() - start, 3)
+        
+        with stage("prepare"):
+            store = AthleteFeatureStore.coerce(data)
+            X = self.prepare_features(store)
+            X_scaled = self.scaler.fit_transform(X)
+            y = np.asarray(targets if targets is not None else store.target, dtype=np.float64)
+        
+        if self.hist_threshold is not None and len(y) >= self.hist_threshold:
+            self.model = HistGradientBoostingRegressor(max_iter=200, learning_rate=0.1, random_state=42)
+            self.ci_engine = ConfidenceIntervalEngine(
+                method="quantile", alpha=self.ci_engine.alpha, z=self.ci_engine.z
+            )
+        
+        # Successive-halving search: many candidates on few samples, survivors on more
+        best_params = None
+        if self.tune:
+            _report(progress, "progression_tuning", candidates=self.tune_candidates)
+            with stage("tuning"):
+                space = (self.HIST_SEARCH_SPACE if isinstance(self.model, HistGradientBoostingRegressor)
+                         else self.GBR_SEARCH_SPACE)
+                search = HalvingRandomSearchCV(
+                    clone(self.model), space,
+                    n_candidates=self.tune_candidates,
+                    factor=3,
+                    cv=5,
+                    scoring="r2",
+                    refit=False,
+                    random_state=42,
+                    n_jobs=self.n_jobs
+                ).fit(X_scaled, y)
+                best_params = search.best_params_
+                self.model.set_params(**best_params)
+            _report(progress, "progression_tuned", params=best_params, r2=float(search.best_score_))
+        
+        # Cross-validation (same folds as cross_val_score(cv=5)), folds in parallel
+        with stage("cross_validation"):
+            folds = joblib.Parallel(n_jobs=self.n_jobs, return_as="generator")(
+                joblib.delayed(_score_fold)(self.model, X_scaled, y, train, test)
+                for train, test in KFold(n_splits=5).split(X_scaled)
+            )
+            cv_scores = []
+            for score in folds:
+                cv_scores.append(score)
+                _report(progress, "progression_cv", fold=len(cv_scores), folds=5, r2=score)
+            cv_scores = np.array(cv_scores)
         
         # Final fit
-        self.model.fit(X_scaled, y)
+        _report(progress, "progression_fit", samples=len(y))
+        with stage("final_fit"):
+            self.model.fit(X_scaled, y)
+        with stage("confidence_intervals"):
+            self.ci_engine.fit(self.model, X_scaled, y)
         self.is_fitted = True
         
+        with stage("feature_importances"):
+            importances = getattr(self.model, "feature_importances_", None)
+            if importances is None:
+                sample = slice(None, 5000)
+                importances = permutation_importance(
+                    self.model, X_scaled[sample], y[sample],
+                    n_repeats=3, random_state=42, n_jobs=self.n_jobs
+                ).importances_mean
+        
         return {
             "cv_r2_mean": cv_scores.mean(),
             "cv_r2_std": cv_scores.std(),
-            "feature_importances": dict(zip(
-                ['current_1rm', 'weeks', 'volume', 'intensity', 'training_age', 
-                 'weight', 'hrv', 'recovery', 'progression', 'adherence', 'stress'],
-                self.model.feature_importances_.tolist()
-            ))
+            "model": type(self.model).__name__,
+            "best_params": best_params,
+            "timings": timings,
+            "feature_importances": dict(zip(self.FEATURE_NAMES, importances.tolist()))
         }
     
     def predict(self, input_data: PredictionInput) -> PredictionOutput:
         """Predict future 1RM with confidence interval"""
-        if not self.is_fitted:
-            # Return heuristic prediction if not fitted
-            return self._heuristic_prediction(input_data)
-        
-        X = self.prepare_features([input_data])
-        X_scaled = self.scaler.transform(X)
-        
-        # Point prediction
-        predicted = self.model.predict(X_scaled)[0]
-        
-        # Confidence interval using tree variance
-        predictions = []
-        for tree in self.model.estimators_:
-            pred = tree[0].predict(X_scaled)[0]
-            predictions.append(pred)
-        
-        std = np.std(predictions)
-        ci_lower = predicted - 1.96 * std
-        ci_upper = predicted + 1.96 * std
-        
-        # Generate risk factors and recommendations
-        risk_factors = self._assess_risks(input_data)
-        recommendations = self._generate_recommendations(input_data, predicted)
+        return self.predict_batch([input_data])[0]
+    
+    def predict_batch(self, inputs: Union[List[PredictionInput], AthleteFeatureStore]) -> List[PredictionOutput]:
+        """Predict future 1RM for many inputs with one scaler/model pass"""
+        store = AthleteFeatureStore.coerce(inputs)
+        if len(store) == 0:
+            return []
         
-        return PredictionOutput(
-            predicted_1rm=round(predicted, 1),
-            confidence_interval=(round(ci_lower, 1), round(ci_upper, 1)),
-            risk_factors=risk_factors,
-            recommendations=recommendations
-        )
+        if not self.is_fitted:
+            # Heuristic prediction if not fitted
+            predicted = self._heuristic_predict(store)
+            ci_lower, ci_upper = predicted * 0.95, predicted * 1.05
+        else:
+            X_scaled = self.scaler.transform(self.prepare_features(store))
+            
+            # Point predictions
+            predicted = self.model.predict(X_scaled)
+            
+            # Confidence intervals for the whole batch
+            ci_lower, ci_upper = self.ci_engine.interval(self.model, X_scaled, predicted)
+        
+        risks = self._assess_risks(store)
+        recommendations = self._generate_recommendations(store, predicted)
+        
+        return [
+            PredictionOutput(
+                predicted_1rm=round(float(pred), 1),
+                confidence_interval=(round(float(lower), 1), round(float(upper), 1)),
+                risk_factors=risk,
+                recommendations=recs
+            )
+            for pred, lower, upper, risk, recs in zip(predicted, ci_lower, ci_upper, risks, recommendations)
+        ]
+    
+    def save(self, path: str):
+        """Save model to disk (uncompressed, so it can be memory-mapped on load)"""
+        joblib.dump({
+            'model': self.model,
+            'scaler': self.scaler,
+            'ci_engine': self.ci_engine,
+            'is_fitted': self.is_fitted
+        }, path)
+    
+    def load(self, path: str, mmap_mode: Optional[str] = None):
+        """Load model from disk; mmap_mode="r" maps scaler stats and CI tables read-only"""
+        data = joblib.load(path, mmap_mode=mmap_mode)
+        self.model = data['model']
+        self.scaler = data['scaler']
+        self.ci_engine = data['ci_engine']
+        self.is_fitted = data['is_fitted']
     
-    def _heuristic_prediction(self, input_data: PredictionInput) -> PredictionOutput:
+    def _heuristic_predict(self, store: AthleteFeatureStore) -> np.ndarray:
         """Fallback prediction using domain knowledge"""
-        current = input_data.current_1rm
-        weeks = input_data.training_weeks
-        training_age = input_data.features.training_age
-        
-        # Progression rate decreases with training age
-        if training_age < 1:
-            weekly_gain = 0.015  # 1.5% per week for beginners
-        elif training_age < 3:
-            weekly_gain = 0.008  # 0.8% per week for intermediate
-        else:
-            weekly_gain = 0.003  # 0.3% per week for advanced
+        current = store.column("current_1rm")
+        weeks = store.column("training_weeks")
+        training_age = store.column("training_age")
         
-        # Adjust for recovery and adherence
-        modifier = (input_data.features.avg_recovery_score / 100) * (input_data.features.adherence_rate / 100)
+        # Progression rate decreases with training age:
+        # 1.5% per week for beginners, 0.8% for intermediate, 0.3% for advanced
+        weekly_gain = np.select([training_age < 1, training_age < 3], [0.015, 0.008], 0.003)
         
-        predicted = current * (1 + weekly_gain * weeks * modifier)
+        # Adjust for recovery and adherence
+        modifier = (store.column("avg_recovery_score") / 100) * (store.column("adherence_rate") / 100)
         
-        return PredictionOutput(
-            predicted_1rm=round(predicted, 1),
-            confidence_interval=(round(predicted * 0.95, 1), round(predicted * 1.05, 1)),
-            risk_factors=self._assess_risks(input_data),
-            recommendations=self._generate_recommendations(input_data, predicted)
-        )
+        return current * (1 + weekly_gain * weeks * modifier)
     
-    def _assess_risks(self, data: PredictionInput) -> List[str]:
-        """Identify potential risk factors"""
-        risks = []
-        
-        if data.features.avg_hrv < 40:
-            risks.append("Low HRV indicates poor recovery capacity")
-        
-        if data.features.avg_sleep_quality < 60:
-            risks.append("Sleep quality below optimal for adaptation")
-        
-        if data.features.stress_level > 7:
-            risks.append("High stress may impair recovery")
-        
-        if data.weekly_volume > 25:
-            risks.append("High training volume may lead to overreaching")
-        
-        if data.avg_intensity > 85:
-            risks.append("Sustained high intensity increases injury risk")
-        
-        if data.features.adherence_rate < 70:
-            risks.append("Low adherence will reduce expected gains")
-        
-        return risks
+    def _assess_risks(self, store: AthleteFeatureStore) -> List[List[str]]:
+        """Identify potential risk factors for every row"""
+        c = store.column
+        return _rule_messages(len(store), [
+            (c("avg_hrv") < 40, "Low HRV indicates poor recovery capacity"),
+            (c("avg_sleep_quality") < 60, "Sleep quality below optimal for adaptation"),
+            (c("stress_level") > 7, "High stress may impair recovery"),
+            (c("weekly_volume") > 25, "High training volume may lead to overreaching"),
+            (c("planned_intensity") > 85, "Sustained high intensity increases injury risk"),
+            (c("adherence_rate") < 70, "Low adherence will reduce expected gains")
+        ])
     
-    def _generate_recommendations(self, data: PredictionInput, predicted: float) -> List[str]:
-        """Generate actionable recommendations"""
-        recs = []
-        
-        gain = (predicted - data.current_1rm) / data.current_1rm * 100
-        
-        if gain < 5:
-            recs.append("Consider deload week to enhance recovery")
-            recs.append("Evaluate if volume needs adjustment")
-        
-        if data.features.avg_hrv < 50:
-            recs.append("Prioritize recovery: sleep, nutrition, stress management")
-        
-        if data.features.progression_rate < 0.5:
-            recs.append("Try periodization variation (DUP, block, conjugate)")
-        
-        if data.avg_intensity > 80:
-            recs.append("Include more submaximal volume work")
-        
-        if data.features.training_age > 5:
-            recs.append("Focus on technique refinement and weak points")
-        
-        return recs
+    def _generate_recommendations(self, store: AthleteFeatureStore, predicted: np.ndarray) -> List[List[str]]:
+        """Generate actionable recommendations for every row"""
+        c = store.column
+        gain = (predicted - c("current_1rm")) / c("current_1rm") * 100
+        
+        return _rule_messages(len(store), [
+            (gain < 5, "Consider deload week to enhance recovery"),
+            (gain < 5, "Evaluate if volume needs adjustment"),
+            (c("avg_hrv") < 50, "Prioritize recovery: sleep, nutrition, stress management"),
+            (c("progression_rate") < 0.5, "Try periodization variation (DUP, block, conjugate)"),
+            (c("planned_intensity") > 80, "Include more submaximal volume work"),
+            (c("training_age") > 5, "Focus on technique refinement and weak points")
+        ])
+
+def _score_fold(model, X: np.ndarray, y: np.ndarray, train: np.ndarray, test: np.ndarray) -> float:
+    """R² of a fresh clone of model on one CV fold"""
+    fold_model = clone(model).fit(X[train], y[train])
+    return float(r2_score(y[test], fold_model.predict(X[test])))
+
+def _rule_messages(n: int, rules: List[Tuple[np.ndarray, str]]) -> List[List[str]]:
+    """Per-row message lists from (boolean mask, message) rules, in rule order"""
+    messages: List[List[str]] = [[] for _ in range(n)]
+    for mask, message in rules:
+        for i in np.flatnonzero(mask):
+            messages[i].append(message)
+    return messages
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # PLATEAU & OVERTRAINING DETECTOR
@@ -415,29 +1008,72 @@ class PlateauDetector:
         )
         self.is_fitted = False
         
+    # (metric, trend, points, warning) rules, checked in order
+    OVERTRAINING_RULES = [
+        ("hrv", "declining", 25, "HRV declining - possible overreaching"),
+        ("hrv", "low_plateau", 15, "HRV consistently low"),
+        ("sleep_quality", "declining", 20, "Sleep quality decreasing"),
+        ("resting_hr", "improving", 25, "Resting heart rate increasing"),  # Improving = increasing = bad
+        ("performance", "declining", 30, "Performance declining despite training"),
+        ("performance", "plateau", 10, "Performance plateaued - consider variation")
+    ]
+    
     def analyze_trend(self, values: List[float], window: int = 4) -> Dict:
         """Analyze trend in a time series"""
         if len(values) < window:
             return {"trend": "insufficient_data", "slope": 0}
         
-        # Simple linear regression
-        x = np.arange(len(values))
-        y = np.array(values)
+        trends = self.analyze_trends([{"series": values}], window=window)
+        return _trend_entry(trends, 0, 0)
+    
+    def analyze_trends(self, series: List[Dict[str, List[float]]],
+                       metrics: Optional[List[str]] = None, window: int = 4) -> Dict[str, Any]:
+        """
+        Trends for a whole roster at once: every athlete × metric series is
+        packed into one zero-padded (athletes, metrics, time) tensor with a
+        validity mask, and the least-squares slopes come from masked sums:
         
-        slope = np.polyfit(x, y, 1)[0]
+            slope = (n·Σxy - Σx·Σy) / (n·Σx² - (Σx)²)
         
-        if abs(slope) < 0.01:
-            trend = "plateau"
-        elif slope > 0:
-            trend = "improving"
-        else:
-            trend = "declining"
+        Series shorter than window are flagged "insufficient_data".
+        Returns arrays of shape (athletes, metrics) keyed by statistic.
+        """
+        if metrics is None:
+            metrics = list(dict.fromkeys(name for athlete in series for name in athlete))
+        values, lengths = _series_tensor(series, metrics)
+        
+        x = np.arange(values.shape[2], dtype=np.float64)
+        mask = x < lengths[..., None]
+        n = lengths.astype(np.float64)
+        sx = (mask * x).sum(axis=2)
+        sxx = (mask * x * x).sum(axis=2)
+        sy = values.sum(axis=2)
+        sxy = (values * x).sum(axis=2)
+        denominator = n * sxx - sx * sx
+        with np.errstate(divide="ignore", invalid="ignore"):
+            slope = np.where(denominator > 0, (n * sxy - sx * sy) / denominator, 0.0)
+        
+        sufficient = lengths >= window
+        slope = np.where(sufficient, slope, 0.0)
+        first = values[..., 0]
+        last = np.take_along_axis(values, np.maximum(lengths - 1, 0)[..., None], axis=2)[..., 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change_percent = np.where(first != 0, (last - first) / first * 100, 0.0)
+        
+        trend = np.select(
+            [~sufficient, np.abs(slope) < 0.01, slope > 0],
+            ["insufficient_data", "plateau", "improving"],
+            "declining"
+        )
         
         return {
+            "metrics": metrics,
+            "lengths": lengths,
+            "sufficient": sufficient,
             "trend": trend,
             "slope": slope,
-            "last_value": values[-1],
-            "change_percent": ((values[-1] - values[0]) / values[0] * 100) if values[0] != 0 else 0
+            "last_value": last,
+            "change_percent": change_percent
         }
     
     def detect_overtraining(self, metrics: Dict[str, List[float]]) -> Dict:
@@ -448,65 +1084,558 @@ class PlateauDetector:
         - Performance trend
         - Resting HR trend (increasing = bad)
         """
-        warnings = []
-        risk_score = 0
-        
-        # HRV analysis
-        if "hrv" in metrics and len(metrics["hrv"]) >= 4:
-            hrv_trend = self.analyze_trend(metrics["hrv"])
-            if hrv_trend["trend"] == "declining":
-                warnings.append("HRV declining - possible overreaching")
-                risk_score += 25
-            elif hrv_trend["trend"] == "plateau" and metrics["hrv"][-1] < 50:
-                warnings.append("HRV consistently low")
-                risk_score += 15
-        
-        # Sleep quality
-        if "sleep_quality" in metrics and len(metrics["sleep_quality"]) >= 4:
-            sleep_trend = self.analyze_trend(metrics["sleep_quality"])
-            if sleep_trend["trend"] == "declining":
-                warnings.append("Sleep quality decreasing")
-                risk_score += 20
-        
-        # Resting HR (should stay stable or decrease)
-        if "resting_hr" in metrics and len(metrics["resting_hr"]) >= 4:
-            hr_trend = self.analyze_trend(metrics["resting_hr"])
-            if hr_trend["trend"] == "improving":  # Improving = increasing = bad
-                warnings.append("Resting heart rate increasing")
-                risk_score += 25
-        
-        # Performance
-        if "performance" in metrics and len(metrics["performance"]) >= 4:
-            perf_trend = self.analyze_trend(metrics["performance"])
-            if perf_trend["trend"] == "declining":
-                warnings.append("Performance declining despite training")
-                risk_score += 30
-            elif perf_trend["trend"] == "plateau":
-                warnings.append("Performance plateaued - consider variation")
-                risk_score += 10
-        
-        # Determine overall risk level
-        if risk_score >= 60:
-            risk_level = "high"
-            recommendation = "Recommend deload week or active recovery"
-        elif risk_score >= 30:
-            risk_level = "moderate"
-            recommendation = "Monitor closely, consider reducing volume"
-        else:
-            risk_level = "low"
-            recommendation = "Continue current program"
-        
+        return self.detect_overtraining_batch([metrics])[0]
+    
+    def detect_overtraining_batch(self, series: List[Dict[str, List[float]]]) -> List[Dict]:
+        """Screen many athletes with one vectorized trend pass (each series is fitted once)"""
+        if not series:
+            return []
+        
+        trends = self.analyze_trends(series, window=4)
+        metrics = trends["metrics"]
+        
+        def rule_mask(metric: str, condition: str) -> np.ndarray:
+            if metric not in metrics:
+                return np.zeros(len(series), dtype=bool)
+            j = metrics.index(metric)
+            trend = trends["trend"][:, j]
+            if condition == "low_plateau":
+                return (trend == "plateau") & (trends["last_value"][:, j] < 50)
+            return trend == condition
+        
+        masks = [rule_mask(metric, condition) for metric, condition, _, _ in self.OVERTRAINING_RULES]
+        risk_scores = sum(mask * points for mask, (_, _, points, _) in zip(masks, self.OVERTRAINING_RULES))
+        warnings = _rule_messages(len(series), [
+            (mask, message) for mask, (_, _, _, message) in zip(masks, self.OVERTRAINING_RULES)
+        ])
+        
+        results = []
+        for i, risk_score in enumerate(risk_scores.tolist()):
+            # Determine overall risk level
+            if risk_score >= 60:
+                risk_level = "high"
+                recommendation = "Recommend deload week or active recovery"
+            elif risk_score >= 30:
+                risk_level = "moderate"
+                recommendation = "Monitor closely, consider reducing volume"
+            else:
+                risk_level = "low"
+                recommendation = "Continue current program"
+            
+            results.append({
+                "risk_level": risk_level,
+                "risk_score": risk_score,
+                "warnings": warnings[i],
+                "recommendation": recommendation,
+                "trends": {
+                    metric: _trend_entry(trends, i, j)
+                    for j, metric in enumerate(metrics)
+                    if metric in series[i] and trends["sufficient"][i, j]
+                }
+            })
+        return results
+    
+    def save(self, path: str):
+        """Save model to disk"""
+        joblib.dump({
+            'isolation_forest': self.isolation_forest,
+            'is_fitted': self.is_fitted
+        }, path)
+    
+    def load(self, path: str, mmap_mode: Optional[str] = None):
+        """Load model from disk"""
+        data = joblib.load(path, mmap_mode=mmap_mode)
+        self.isolation_forest = data['isolation_forest']
+        self.is_fitted = data['is_fitted']
+
+def _series_tensor(series: List[Dict[str, List[float]]], metrics: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Zero-padded (athletes, metrics, max_len) values and (athletes, metrics) lengths"""
+    lengths = np.array(
+        [[len(athlete.get(metric) or ()) for metric in metrics] for athlete in series],
+        dtype=np.intp
+    ).reshape(len(series), len(metrics))
+    values = np.zeros(lengths.shape + (max(1, int(lengths.max(initial=0))),))
+    for i, athlete in enumerate(series):
+        for j, metric in enumerate(metrics):
+            if lengths[i, j]:
+                values[i, j, :lengths[i, j]] = athlete[metric]
+    return values, lengths
+
+def _trend_entry(trends: Dict[str, Any], i: int, j: int) -> Dict:
+    """analyze_trend-style dict for one athlete/metric cell of analyze_trends output"""
+    return {
+        "trend": str(trends["trend"][i, j]),
+        "slope": float(trends["slope"][i, j]),
+        "last_value": float(trends["last_value"][i, j]),
+        "change_percent": float(trends["change_percent"][i, j])
+    }
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# MODEL REGISTRY
+# ═══════════════════════════════════════════════════════════════════════════════
+
+class ModelRegistry:
+    """
+    Versioned on-disk model store shared by all server workers.
+    
+    Layout:
+        <root>/versions/<version>/clustering.joblib
+        <root>/versions/<version>/progression.joblib
+        <root>/versions/<version>/plateau.joblib
+        <root>/versions/<version>/manifest.json
+        <root>/CURRENT                      name of the promoted version
+    
+    Artifacts are written uncompressed and loaded with mmap_mode="r", so the
+    numpy arrays inside them (centroids, scaler statistics, CI leaf tables)
+    are backed by the same read-only page-cache pages in every worker.
+    sklearn tree objects copy their node arrays when unpickled and stay
+    per-process.
+    
+    Version directories are immutable once published. Promotion rewrites
+    CURRENT with an atomic os.replace(); workers poll it and swap their
+    models without a restart. Only versions published by incremental
+    updates (source "partial_fit") are pruned automatically; training and
+    other versions stay available as promotion and rollback targets.
+    """
+    
+    ARTIFACTS = {
+        "clustering_engine": "clustering.joblib",
+        "progression_predictor": "progression.joblib",
+        "plateau_detector": "plateau.joblib"
+    }
+    
+    def __init__(self, root: str, keep_versions: int = 5):
+        self.root = os.path.abspath(root)
+        self.keep_versions = keep_versions
+        self.versions_dir = os.path.join(self.root, "versions")
+        os.makedirs(self.versions_dir, exist_ok=True)
+    
+    def publish(self, models: Dict[str, Any], metadata: Optional[Dict] = None,
+                promote: bool = True) -> str:
+        """Write a new immutable version and optionally promote it"""
+        version = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+        staging = os.path.join(self.versions_dir, f".staging-{version}-{os.getpid()}")
+        os.makedirs(staging)
+        
+        for name, filename in self.ARTIFACTS.items():
+            models[name].save(os.path.join(staging, filename))
+        with open(os.path.join(staging, "manifest.json"), "w") as f:
+            json.dump({
+                "version": version,
+                "created_at": datetime.utcnow().isoformat() + "Z",
+                "metadata": metadata or {}
+            }, f, indent=2, default=str)
+        
+        os.rename(staging, os.path.join(self.versions_dir, version))
+        if promote:
+            self.promote(version)
+        return version
+    
+    def promote(self, version: str):
+        """Atomically point CURRENT at an existing version"""
+        if version not in self.versions():
+            raise ValueError(f"Unknown model version '{version}'")
+        
+        tmp = os.path.join(self.root, f".CURRENT-{os.getpid()}")
+        with open(tmp, "w") as f:
+            f.write(version)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.root, "CURRENT"))
+        self._prune(keep=version)
+    
+    @contextmanager
+    def lock(self):
+        """Exclusive cross-worker lock for read-modify-publish cycles (POSIX only)"""
+        try:
+            import fcntl
+        except ImportError:
+            yield
+            return
+        with open(os.path.join(self.root, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+    
+    def current_version(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.root, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+    
+    def versions(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.versions_dir)
+            if not name.startswith(".")
+        )
+    
+    def manifest(self, version: str) -> Dict:
+        with open(os.path.join(self.versions_dir, version, "manifest.json")) as f:
+            return json.load(f)
+    
+    def load(self, version: str, mmap_mode: Optional[str] = "r") -> Dict[str, Any]:
+        """Load every artifact of a version into fresh model instances"""
+        models = {
+            "clustering_engine": AthleteClusteringEngine(),
+            "progression_predictor": StrengthProgressionPredictor(),
+            "plateau_detector": PlateauDetector()
+        }
+        for name, filename in self.ARTIFACTS.items():
+            models[name].load(os.path.join(self.versions_dir, version, filename), mmap_mode=mmap_mode)
+        return models
+    
+    def _prune(self, keep: str):
+        """Drop the oldest incremental-update versions beyond keep_versions (never the promoted one)"""
+        prunable = []
+        for version in self.versions():
+            try:
+                source = self.manifest(version).get("metadata", {}).get("source")
+            except (OSError, ValueError):
+                continue
+            if source == "partial_fit" and version != keep:
+                prunable.append(version)
+        for version in prunable[:max(0, len(prunable) - self.keep_versions)]:
+            # Workers still mapping an old version keep its pages until they swap
+            shutil.rmtree(os.path.join(self.versions_dir, version), ignore_errors=True)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# TRAINING JOBS
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class TrainingDataset:
+    """
+    Training data source: either a wide CSV/Parquet export (one column per
+    feature, plus current_1rm/target columns for the progression model) or
+    exports of the `athletes` and `progress_metrics` tables.
+    """
+    dataset_path: Optional[str] = None
+    athletes_path: Optional[str] = None
+    progress_metrics_path: Optional[str] = None
+    target_column: str = "target_1rm"
+    
+    def load(self) -> Tuple[Optional[AthleteFeatureStore], Optional[AthleteFeatureStore]]:
+        """(athlete-level store for clustering, row-level store for progression)"""
+        if self.athletes_path:
+            athletes = AthleteFeatureStore.from_tables(self.athletes_path, self.progress_metrics_path)
+            progression = None
+            if self.progress_metrics_path:
+                progression = AthleteFeatureStore.progression_from_tables(
+                    self.athletes_path, self.progress_metrics_path
+                )
+            return athletes, progression
+        
+        if not self.dataset_path:
+            raise ValueError("No dataset: set dataset_path or athletes_path")
+        
+        frame = _read_table(self.dataset_path)
+        progression = None
+        if self.target_column in frame.columns and "current_1rm" in frame.columns:
+            progression = AthleteFeatureStore.from_frame(frame, target_column=self.target_column)
+        if "athlete_id" in frame.columns:
+            frame = frame.drop_duplicates("athlete_id", keep="last")
+        return AthleteFeatureStore.from_frame(frame), progression
+
+@dataclass
+class TrainingJob:
+    job_id: str
+    dataset: TrainingDataset
+    train_clustering: bool = True
+    train_progression: bool = True
+    tune_progression: bool = False
+    promote: bool = True
+    status: str = "queued"  # queued | running | succeeded | failed
+    created_at: str = field(default_factory=lambda: datetime.utcnow().isoformat() + "Z")
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    events: List[Dict] = field(default_factory=list)
+    result: Dict = field(default_factory=dict)
+    error: Optional[str] = None
+    model_version: Optional[str] = None
+    cleanup_dir: Optional[str] = None
+    
+    def emit(self, stage: str, info: Dict[str, Any]):
+        """ProgressCallback: append a progress event"""
+        self.events.append({
+            "seq": len(self.events),
+            "time": datetime.utcnow().isoformat() + "Z",
+            "stage": stage,
+            **info
+        })
+    
+    def summary(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "progress": self.events[-1] if self.events else None,
+            "result": self.result,
+            "error": self.error,
+            "model_version": self.model_version
+        }
+
+class TrainingJobManager:
+    """
+    Runs training jobs one at a time on a background thread.
+    
+    Jobs train fresh model instances, so serving keeps using the current
+    models for the whole run. Only when every stage succeeds does on_trained
+    publish and promote the new models (returning the registry version).
+    """
+    
+    def __init__(self, on_trained: Callable[[TrainingJob, Dict[str, Any]], Optional[str]],
+                 max_jobs_kept: int = 50, n_jobs: Optional[int] = -1):
+        self.on_trained = on_trained
+        self.n_jobs = n_jobs
+        self.max_jobs_kept = max_jobs_kept
+        self.jobs: Dict[str, TrainingJob] = {}
+        self._worker = ThreadPoolExecutor(max_workers=1, thread_name_prefix="atlas-training")
+    
+    def submit(self, dataset: TrainingDataset, **options) -> TrainingJob:
+        job = TrainingJob(job_id=uuid.uuid4().hex[:12], dataset=dataset, **options)
+        self.jobs[job.job_id] = job
+        self._evict()
+        self._worker.submit(self._run, job)
+        return job
+    
+    def get(self, job_id: str) -> Optional[TrainingJob]:
+        return self.jobs.get(job_id)
+    
+    def shutdown(self):
+        self._worker.shutdown(wait=False)
+    
+    def _run(self, job: TrainingJob):
+        job.status = "running"
+        job.started_at = datetime.utcnow().isoformat() + "Z"
+        try:
+            job.emit("loading", {})
+            athletes, progression = job.dataset.load()
+            trained: Dict[str, Any] = {}
+            
+            if job.train_clustering and athletes is not None and len(athletes) >= 3:
+                job.emit("clustering", {"samples": len(athletes)})
+                engine = AthleteClusteringEngine(n_jobs=self.n_jobs)
+                job.result["clustering"] = engine.fit(athletes, progress=job.emit)
+                trained["clustering_engine"] = engine
+            
+            if job.train_progression and progression is not None and len(progression) >= 5:
+                job.emit("progression", {"samples": len(progression)})
+                predictor = StrengthProgressionPredictor(n_jobs=self.n_jobs, tune=job.tune_progression)
+                job.result["progression"] = predictor.fit(progression, progress=job.emit)
+                trained["progression_predictor"] = predictor
+            
+            if not trained:
+                raise ValueError("Dataset has nothing to train (need >= 3 athletes or >= 5 progression rows)")
+            
+            job.emit("publishing", {"models": sorted(trained)})
+            job.model_version = self.on_trained(job, trained)
+            job.status = "succeeded"
+            job.emit("succeeded", {"model_version": job.model_version})
+        except Exception as e:
+            job.status = "failed"
+            job.error = str(e)
+            job.emit("failed", {"error": str(e)})
+        finally:
+            job.finished_at = datetime.utcnow().isoformat() + "Z"
+            if job.cleanup_dir:
+                shutil.rmtree(job.cleanup_dir, ignore_errors=True)
+    
+    def _evict(self):
+        finished = [j for j in self.jobs.values() if j.finished_at is not None]
+        for job in finished[:max(0, len(self.jobs) - self.max_jobs_kept)]:
+            del self.jobs[job.job_id]
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# INFERENCE EXECUTOR
+# ═══════════════════════════════════════════════════════════════════════════════
+
+@dataclass
+class InferenceConfig:
+    """
+    Inference executor settings.
+    
+    Environment variables:
+    - ATLAS_INFERENCE_THREADS: thread pool size (numpy/sklearn paths that release the GIL)
+    - ATLAS_INFERENCE_PROCESSES: process pool size for heavy endpoints (0 = disabled)
+    - ATLAS_INFERENCE_QUEUE_DEPTH: requests allowed to wait per endpoint before 429
+    - ATLAS_ENDPOINT_LIMITS: per-endpoint concurrency, e.g. "predict=2,cluster=8"
+    - ATLAS_PROCESS_ENDPOINTS: endpoints routed to the process pool, e.g. "predict,predict_batch"
+    - ATLAS_INFERENCE_LIGHT_THREADS: threads reserved for light endpoints
+    - ATLAS_LIGHT_ENDPOINTS: single-item endpoints served by the reserved threads, e.g. "cluster,overtraining"
+    """
+    thread_workers: int = 4
+    process_workers: int = 0
+    queue_depth: int = 32
+    endpoint_limits: Dict[str, int] = field(default_factory=dict)
+    process_endpoints: Tuple[str, ...] = ("predict", "predict_batch")
+    light_workers: int = 2
+    light_endpoints: Tuple[str, ...] = ("cluster", "overtraining")
+    
+    @classmethod
+    def from_env(cls) -> "InferenceConfig":
+        limits = {}
+        for item in os.environ.get("ATLAS_ENDPOINT_LIMITS", "").split(","):
+            name, _, value = item.partition("=")
+            if name.strip() and value.strip():
+                limits[name.strip()] = max(1, int(value))
+        
+        process_endpoints = os.environ.get("ATLAS_PROCESS_ENDPOINTS")
+        light_endpoints = os.environ.get("ATLAS_LIGHT_ENDPOINTS")
+        return cls(
+            thread_workers=max(1, int(os.environ.get("ATLAS_INFERENCE_THREADS", "4"))),
+            process_workers=max(0, int(os.environ.get("ATLAS_INFERENCE_PROCESSES", "0"))),
+            queue_depth=max(0, int(os.environ.get("ATLAS_INFERENCE_QUEUE_DEPTH", "32"))),
+            endpoint_limits=limits,
+            process_endpoints=(
+                tuple(e.strip() for e in process_endpoints.split(",") if e.strip())
+                if process_endpoints is not None else cls.process_endpoints
+            ),
+            light_workers=max(1, int(os.environ.get("ATLAS_INFERENCE_LIGHT_THREADS", "2"))),
+            light_endpoints=(
+                tuple(e.strip() for e in light_endpoints.split(",") if e.strip())
+                if light_endpoints is not None else cls.light_endpoints
+            )
+        )
+
+class _EndpointLimit:
+    """Concurrency limit and bounded wait queue for one endpoint"""
+    
+    def __init__(self, limit: int, queue_depth: int):
+        self.limit = limit
+        self.queue_depth = queue_depth
+        self.pending = 0  # running + waiting
+        self.rejected = 0
+        self._semaphore: Optional[asyncio.Semaphore] = None
+    
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the server's running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.limit)
+        return self._semaphore
+    
+    @property
+    def saturated(self) -> bool:
+        return self.pending >= self.limit + self.queue_depth
+
+class InferenceExecutor:
+    """
+    Runs blocking model code off the asyncio event loop.
+    
+    Endpoints run on a thread pool; endpoints listed in process_endpoints
+    run on a process pool whose workers hold a copy of the model singletons.
+    light_endpoints get their own small thread pool, so /cluster keeps
+    answering while /predict batches occupy every other worker. Each
+    endpoint has its own concurrency limit and wait queue; when the queue is
+    full the request is rejected with 429 instead of piling up behind
+    long-running work.
+    """
+    
+    def __init__(self, config: InferenceConfig):
+        self.config = config
+        self.thread_pool = ThreadPoolExecutor(
+            max_workers=config.thread_workers,
+            thread_name_prefix="atlas-inference"
+        )
+        self.light_pool = ThreadPoolExecutor(
+            max_workers=config.light_workers,
+            thread_name_prefix="atlas-inference-light"
+        )
+        self.process_pool: Optional[ProcessPoolExecutor] = None
+        self._limits: Dict[str, _EndpointLimit] = {}
+    
+    async def run(self, endpoint: str, fn, *args):
+        """Run fn(*args) for endpoint on the configured pool, with backpressure"""
+        limit = self._limit(endpoint)
+        if limit.saturated:
+            limit.rejected += 1
+            raise HTTPException(
+                status_code=429,
+                detail=f"Inference queue for '{endpoint}' is full, retry later",
+                headers={"Retry-After": "1"}
+            )
+        
+        limit.pending += 1
+        try:
+            async with limit.semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(self._pool_for(endpoint), functools.partial(fn, *args))
+        except HTTPException:
+            raise
+        except BrokenProcessPool:
+            self.publish_models()
+            raise HTTPException(status_code=503, detail="Inference worker crashed, retry later")
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            limit.pending -= 1
+    
+    def publish_models(self):
+        """
+        Recycle the process pool so its workers pick up the current model
+        singletons. Call after fitting or loading models.
+        """
+        if self.process_pool is not None:
+            self.process_pool.shutdown(wait=False)
+            self.process_pool = None
+    
+    def shutdown(self):
+        self.thread_pool.shutdown(wait=False)
+        self.light_pool.shutdown(wait=False)
+        self.publish_models()
+    
+    def stats(self) -> Dict[str, Any]:
         return {
-            "risk_level": risk_level,
-            "risk_score": risk_score,
-            "warnings": warnings,
-            "recommendation": recommendation,
-            "trends": {
-                metric: self.analyze_trend(values) 
-                for metric, values in metrics.items() 
-                if len(values) >= 4
+            "thread_workers": self.config.thread_workers,
+            "process_workers": self.config.process_workers,
+            "light_workers": self.config.light_workers,
+            "endpoints": {
+                name: {"limit": l.limit, "pending": l.pending, "rejected": l.rejected}
+                for name, l in self._limits.items()
             }
         }
+    
+    def _limit(self, endpoint: str) -> _EndpointLimit:
+        if endpoint not in self._limits:
+            default = self.config.thread_workers
+            if endpoint in self.config.light_endpoints:
+                default = self.config.light_workers
+            elif endpoint in self.config.process_endpoints and self.config.process_workers > 0:
+                default = self.config.process_workers
+            self._limits[endpoint] = _EndpointLimit(
+                self.config.endpoint_limits.get(endpoint, default),
+                self.config.queue_depth
+            )
+        return self._limits[endpoint]
+    
+    def _pool_for(self, endpoint: str):
+        if endpoint in self.config.light_endpoints:
+            return self.light_pool
+        if self.config.process_workers <= 0 or endpoint not in self.config.process_endpoints:
+            return self.thread_pool
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                max_workers=self.config.process_workers,
+                initializer=_init_inference_worker,
+                initargs=({
+                    "clustering_engine": clustering_engine,
+                    "progression_predictor": progression_predictor,
+                    "plateau_detector": plateau_detector
+                },)
+            )
+        return self.process_pool
+
+def _init_inference_worker(models: Dict[str, Any]):
+    """Install the parent's model singletons in a process pool worker"""
+    global clustering_engine, progression_predictor, plateau_detector
+    clustering_engine = models["clustering_engine"]
+    progression_predictor = models["progression_predictor"]
+    plateau_detector = models["plateau_detector"]
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # FASTAPI APPLICATION
@@ -532,6 +1661,102 @@ clustering_engine = AthleteClusteringEngine()
 progression_predictor = StrengthProgressionPredictor()
 plateau_detector = PlateauDetector()
 
+# Upper bound on items accepted by the /batch endpoints
+MAX_BATCH_SIZE = int(os.environ.get("ATLAS_MAX_BATCH_SIZE", "20000"))
+
+# Model calls run here, never on the event loop
+inference = InferenceExecutor(InferenceConfig.from_env())
+
+@app.on_event("shutdown")
+async def shutdown_inference():
+    inference.shutdown()
+
+# Shared model registry for multi-worker serving (empty = in-process models only)
+MODEL_DIR = os.environ.get("ATLAS_MODEL_DIR", "")
+MODEL_POLL_SECONDS = float(os.environ.get("ATLAS_MODEL_POLL_SECONDS", "5"))
+model_registry = ModelRegistry(MODEL_DIR) if MODEL_DIR else None
+model_version: Optional[str] = None
+
+# Serializes in-place model updates (e.g. /cluster/update) within this worker
+_model_update_lock = threading.Lock()
+
+# /cluster/update publishes a registry version on refits, or once this many rows
+# have been folded in since the last publish; smaller updates stay in this worker
+UPDATE_PUBLISH_ROWS = int(os.environ.get("ATLAS_UPDATE_PUBLISH_ROWS", "5000"))
+_unpublished_update_rows = 0
+
+def _current_models() -> Dict[str, Any]:
+    return {
+        "clustering_engine": clustering_engine,
+        "progression_predictor": progression_predictor,
+        "plateau_detector": plateau_detector
+    }
+
+def install_models(models: Dict[str, Any], version: Optional[str] = None):
+    """Swap the serving model singletons (and the process pool copies)"""
+    global clustering_engine, progression_predictor, plateau_detector, model_version
+    clustering_engine = models["clustering_engine"]
+    progression_predictor = models["progression_predictor"]
+    plateau_detector = models["plateau_detector"]
+    model_version = version
+    inference.publish_models()
+
+def _sync_models_from_registry() -> bool:
+    """Load the promoted registry version if it differs from the one being served"""
+    if model_registry is None:
+        return False
+    version = model_registry.current_version()
+    if version is None or version == model_version:
+        return False
+    install_models(model_registry.load(version), version)
+    return True
+
+async def _poll_model_registry():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(MODEL_POLL_SECONDS)
+        try:
+            await loop.run_in_executor(None, _sync_models_from_registry)
+        except Exception as e:
+            print(f"[atlas-ml] Model sync failed: {e}")
+
+def _promote_trained_models(job: TrainingJob, trained: Dict[str, Any]) -> Optional[str]:
+    """Publish a finished job's models to the registry and, if requested, start serving them"""
+    registry_lock = model_registry.lock() if model_registry is not None else nullcontext()
+    with _model_update_lock, registry_lock:
+        models = {**_current_models(), **trained}
+        version = None
+        if model_registry is not None:
+            version = model_registry.publish(models, {
+                "source": "training_job",
+                "job_id": job.job_id,
+                "trained": sorted(trained),
+                "result": job.result
+            }, promote=job.promote)
+        if job.promote:
+            install_models(models, version)
+    return version
+
+# Cores used by a training job for CV folds, search candidates and k candidates (-1 = all)
+TRAINING_JOBS = int(os.environ.get("ATLAS_TRAINING_JOBS", "-1"))
+
+training_jobs = TrainingJobManager(on_trained=_promote_trained_models, n_jobs=TRAINING_JOBS)
+
+# Upper bound on a /train/upload dataset body
+MAX_UPLOAD_MB = int(os.environ.get("ATLAS_MAX_UPLOAD_MB", "512"))
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+
+@app.on_event("shutdown")
+async def shutdown_training():
+    training_jobs.shutdown()
+
+@app.on_event("startup")
+async def start_model_sync():
+    if model_registry is None:
+        return
+    await asyncio.get_running_loop().run_in_executor(None, _sync_models_from_registry)
+    app.state.model_sync_task = asyncio.create_task(_poll_model_registry())
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # API MODELS
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -568,6 +1793,16 @@ class OvertrainingRequest(BaseModel):
     resting_hr: List[float] = []
     performance: List[float] = []
 
+class TrainRequest(BaseModel):
+    dataset_path: Optional[str] = None
+    athletes_path: Optional[str] = None
+    progress_metrics_path: Optional[str] = None
+    target_column: str = "target_1rm"
+    train_clustering: bool = True
+    train_progression: bool = True
+    tune_progression: bool = False
+    promote: bool = True
+
 # ═══════════════════════════════════════════════════════════════════════════════
 # API ENDPOINTS
 # ═══════════════════════════════════════════════════════════════════════════════
@@ -580,8 +1815,14 @@ async def root():
         "status": "operational",
         "endpoints": [
             "/cluster",
+            "/cluster/batch",
+            "/cluster/update",
             "/predict",
+            "/predict/batch",
             "/overtraining",
+            "/overtraining/batch",
+            "/train",
+            "/models",
             "/health"
         ]
     }
@@ -591,83 +1832,303 @@ async def health():
     return {
         "status": "healthy",
         "clustering_fitted": clustering_engine.is_fitted,
-        "predictor_fitted": progression_predictor.is_fitted
+        "predictor_fitted": progression_predictor.is_fitted,
+        "model_version": model_version,
+        "inference": inference.stats()
     }
 
+@app.get("/models")
+async def list_models():
+    """List registry versions and the one being served"""
+    registry = _require_registry()
+    return {
+        "current": registry.current_version(),
+        "serving": model_version,
+        "versions": [registry.manifest(v) for v in registry.versions()]
+    }
+
+@app.post("/models/{version}/promote")
+async def promote_model(version: str):
+    """Atomically promote a stored version; every worker picks it up on its next poll"""
+    registry = _require_registry()
+    try:
+        registry.promote(version)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    await asyncio.get_running_loop().run_in_executor(None, _sync_models_from_registry)
+    return {"current": version, "serving": model_version}
+
+@app.post("/train", status_code=202)
+async def start_training(request: TrainRequest):
+    """Start a background training job from dataset files on the server"""
+    dataset = TrainingDataset(
+        dataset_path=request.dataset_path,
+        athletes_path=request.athletes_path,
+        progress_metrics_path=request.progress_metrics_path,
+        target_column=request.target_column
+    )
+    if not dataset.dataset_path and not dataset.athletes_path:
+        raise HTTPException(status_code=400, detail="Set dataset_path or athletes_path")
+    
+    job = training_jobs.submit(
+        dataset,
+        train_clustering=request.train_clustering,
+        train_progression=request.train_progression,
+        tune_progression=request.tune_progression,
+        promote=request.promote
+    )
+    return job.summary()
+
+@app.post("/train/upload", status_code=202)
+async def start_training_upload(request: Request, format: str = "parquet", target_column: str = "target_1rm",
+                                train_clustering: bool = True, train_progression: bool = True,
+                                tune_progression: bool = False, promote: bool = True):
+    """Start a background training job from a Parquet (or ?format=csv) file sent as the request body"""
+    if format not in ("parquet", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'parquet' or 'csv'")
+    
+    too_large = f"Upload too large (max {MAX_UPLOAD_MB} MB)"
+    try:
+        declared = int(request.headers.get("content-length", "0"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid Content-Length")
+    if declared > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=too_large)
+    
+    loop = asyncio.get_running_loop()
+    upload_dir = tempfile.mkdtemp(prefix="atlas-train-")
+    path = os.path.join(upload_dir, f"dataset.{format}")
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            async for chunk in request.stream():
+                size += len(chunk)
+                if size > MAX_UPLOAD_BYTES:
+                    raise HTTPException(status_code=413, detail=too_large)
+                # Disk writes run off the event loop so other requests keep being served
+                await loop.run_in_executor(None, f.write, chunk)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty upload")
+    except BaseException:
+        shutil.rmtree(upload_dir, ignore_errors=True)
+        raise
+    
+    job = training_jobs.submit(
+        TrainingDataset(dataset_path=path, target_column=target_column),
+        train_clustering=train_clustering,
+        train_progression=train_progression,
+        tune_progression=tune_progression,
+        promote=promote,
+        cleanup_dir=upload_dir
+    )
+    return job.summary()
+
+@app.get("/train")
+async def list_training_jobs():
+    return {"jobs": [job.summary() for job in training_jobs.jobs.values()]}
+
+@app.get("/train/{job_id}")
+async def get_training_job(job_id: str):
+    return _require_job(job_id).summary()
+
+@app.get("/train/{job_id}/events")
+async def stream_training_events(job_id: str):
+    """Server-sent events with every progress event of a job, until it finishes"""
+    job = _require_job(job_id)
+    
+    async def events():
+        sent = 0
+        while True:
+            finished = job.finished_at is not None
+            while sent < len(job.events):
+                yield f"data: {json.dumps(job.events[sent], default=str)}\n\n"
+                sent += 1
+            if finished:
+                yield f"event: end\ndata: {json.dumps(job.summary(), default=str)}\n\n"
+                return
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def _require_job(job_id: str) -> TrainingJob:
+    job = training_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown training job '{job_id}'")
+    return job
+
+def _require_registry() -> ModelRegistry:
+    if model_registry is None:
+        raise HTTPException(status_code=404, detail="Model registry disabled (ATLAS_MODEL_DIR is empty)")
+    return model_registry
+
 @app.post("/cluster")
 async def cluster_athlete(athlete: AthleteData):
     """Classify an athlete into a response cluster"""
-    try:
-        features = AthleteFeatures(**athlete.dict())
-        
-        if clustering_engine.is_fitted:
-            cluster_type, details = clustering_engine.predict(features)
-        else:
-            # Return heuristic classification
-            cluster_type = _heuristic_cluster(features)
-            details = {"note": "Model not trained, using heuristics"}
-        
-        return {
-            "cluster": cluster_type,
-            "details": details,
-            "description": _get_cluster_description(cluster_type)
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await inference.run("cluster", _cluster_athlete, athlete)
+
+def _cluster_athlete(athlete: AthleteData) -> Dict:
+    features = AthleteFeatures(**athlete.dict())
+    
+    if clustering_engine.is_fitted:
+        cluster_type, details = clustering_engine.predict(features)
+    else:
+        # Return heuristic classification
+        cluster_type = _heuristic_cluster(features)
+        details = {"note": "Model not trained, using heuristics"}
+    
+    return _cluster_response(cluster_type, details)
+
+@app.post("/cluster/batch")
+async def cluster_athletes_batch(athletes: List[AthleteData]):
+    """Classify many athletes with a single vectorized model call"""
+    _check_batch_size(athletes)
+    return await inference.run("cluster_batch", _cluster_athletes_batch, athletes)
+
+def _cluster_athletes_batch(athletes: List[AthleteData]) -> Dict:
+    results: List[Optional[Dict]] = [None] * len(athletes)
+    errors: List[Dict] = []
+    
+    features = [AthleteFeatures(**a.dict()) for a in athletes]
+    store = AthleteFeatureStore.from_records(features)
+    valid = _finite_rows(clustering_engine.prepare_features(store), errors)
+    
+    if clustering_engine.is_fitted:
+        predictions = clustering_engine.predict_batch(store.subset(valid))
+    else:
+        note = {"note": "Model not trained, using heuristics"}
+        predictions = [(_heuristic_cluster(features[i]), dict(note)) for i in valid]
+    
+    for i, (cluster_type, details) in zip(valid, predictions):
+        results[i] = _cluster_response(cluster_type, details)
+    
+    return _batch_response(results, errors)
+
+@app.post("/cluster/update")
+async def update_clusters(athletes: List[AthleteData]):
+    """Fold newly onboarded athletes into the clustering model incrementally"""
+    if not athletes:
+        raise HTTPException(status_code=400, detail="No athletes to update the model with")
+    _check_batch_size(athletes)
+    return await inference.run("cluster_update", _update_clusters, athletes)
+
+def _update_clusters(athletes: List[AthleteData]) -> Dict:
+    global _unpublished_update_rows
+    errors: List[Dict] = []
+    store = AthleteFeatureStore.from_records([AthleteFeatures(**a.dict()) for a in athletes])
+    valid = _finite_rows(clustering_engine.prepare_features(store), errors)
+    
+    registry_lock = model_registry.lock() if model_registry is not None else nullcontext()
+    with _model_update_lock, registry_lock:
+        # Start from the latest promoted model so updates from other workers are kept
+        if _sync_models_from_registry():
+            _unpublished_update_rows = 0
+        if not clustering_engine.is_fitted and len(valid) < clustering_engine.n_clusters:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Untrained model: need at least {clustering_engine.n_clusters} valid athletes for the first fit, got {len(valid)}"
+            )
+        result = clustering_engine.partial_fit(store.subset(valid))
+        _unpublished_update_rows += result["updated"]
+        
+        # Publishing writes every artifact and recycles the process pool: only do it
+        # for refits or once enough rows have accumulated
+        version = model_version
+        published = result["refitted"] or _unpublished_update_rows >= UPDATE_PUBLISH_ROWS
+        if published:
+            if model_registry is not None:
+                version = model_registry.publish(_current_models(), {
+                    "source": "partial_fit",
+                    "updated": _unpublished_update_rows,
+                    "refitted": result["refitted"]
+                })
+            install_models(_current_models(), version)
+            _unpublished_update_rows = 0
+        elif any(e.startswith("cluster") for e in inference.config.process_endpoints):
+            # Process workers hold their own model copies; refresh them for this update
+            inference.publish_models()
+        result["published"] = published
+    
+    result["model_version"] = version
+    result["errors"] = errors
+    return result
 
 @app.post("/predict")
 async def predict_progression(request: PredictionRequest):
     """Predict strength progression"""
-    try:
-        features = AthleteFeatures(**request.athlete.dict())
-        
-        input_data = PredictionInput(
-            athlete_id=request.athlete_id,
-            current_1rm=request.current_1rm,
-            exercise=request.exercise,
-            training_weeks=request.training_weeks,
-            weekly_volume=request.weekly_volume,
-            avg_intensity=request.avg_intensity,
-            features=features
-        )
-        
-        result = progression_predictor.predict(input_data)
-        
-        return {
-            "exercise": request.exercise,
-            "current_1rm": request.current_1rm,
-            "predicted_1rm": result.predicted_1rm,
-            "gain_kg": round(result.predicted_1rm - request.current_1rm, 1),
-            "gain_percent": round((result.predicted_1rm - request.current_1rm) / request.current_1rm * 100, 1),
-            "confidence_interval": result.confidence_interval,
-            "risk_factors": result.risk_factors,
-            "recommendations": result.recommendations
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await inference.run("predict", _predict_progression, request)
+
+def _predict_progression(request: PredictionRequest) -> Dict:
+    input_data = _prediction_input(request)
+    result = progression_predictor.predict(input_data)
+    return _prediction_response(request, result)
+
+@app.post("/predict/batch")
+async def predict_progression_batch(requests: List[PredictionRequest]):
+    """Predict strength progression for many athletes with a single vectorized model call"""
+    _check_batch_size(requests)
+    return await inference.run("predict_batch", _predict_progression_batch, requests)
+
+def _predict_progression_batch(requests: List[PredictionRequest]) -> Dict:
+    results: List[Optional[Dict]] = [None] * len(requests)
+    errors: List[Dict] = []
+    
+    candidates = []
+    for i, request in enumerate(requests):
+        if request.current_1rm <= 0:
+            errors.append({"index": i, "error": "current_1rm must be positive"})
+        else:
+            candidates.append(i)
+    if not candidates:
+        # An empty store has no prediction columns to build a matrix from
+        return _batch_response(results, errors)
+    
+    store = AthleteFeatureStore.from_records([_prediction_input(requests[i]) for i in candidates])
+    finite = _finite_rows(progression_predictor.prepare_features(store), errors, candidates)
+    valid = [candidates[j] for j in finite]
+    
+    predictions = progression_predictor.predict_batch(store.subset(finite))
+    for i, result in zip(valid, predictions):
+        results[i] = _prediction_response(requests[i], result)
+    
+    return _batch_response(results, errors)
 
 @app.post("/overtraining")
 async def check_overtraining(request: OvertrainingRequest):
     """Detect overtraining risk"""
-    try:
-        metrics = {
-            "hrv": request.hrv,
-            "sleep_quality": request.sleep_quality,
-            "resting_hr": request.resting_hr,
-            "performance": request.performance
-        }
-        
-        # Filter empty lists
-        metrics = {k: v for k, v in metrics.items() if v}
-        
+    return await inference.run("overtraining", _check_overtraining, request)
+
+def _check_overtraining(request: OvertrainingRequest) -> Dict:
+    metrics = _overtraining_metrics(request)
+    
+    if not metrics:
+        return {"error": "No metrics provided"}
+    
+    return plateau_detector.detect_overtraining(metrics)
+
+@app.post("/overtraining/batch")
+async def check_overtraining_batch(requests: List[OvertrainingRequest]):
+    """Detect overtraining risk for many athletes"""
+    _check_batch_size(requests)
+    return await inference.run("overtraining_batch", _check_overtraining_batch, requests)
+
+def _check_overtraining_batch(requests: List[OvertrainingRequest]) -> Dict:
+    results: List[Optional[Dict]] = [None] * len(requests)
+    errors: List[Dict] = []
+    
+    indices, series = [], []
+    for i, request in enumerate(requests):
+        metrics = _overtraining_metrics(request)
         if not metrics:
-            return {"error": "No metrics provided"}
-        
-        result = plateau_detector.detect_overtraining(metrics)
-        
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+            errors.append({"index": i, "error": "No metrics provided"})
+            continue
+        indices.append(i)
+        series.append(metrics)
+    
+    # One vectorized pass for the whole batch
+    for i, result in zip(indices, plateau_detector.detect_overtraining_batch(series)):
+        results[i] = result
+    
+    return _batch_response(results, errors)
 
 # ═══════════════════════════════════════════════════════════════════════════════
 # HELPER FUNCTIONS
@@ -688,6 +2149,85 @@ def _heuristic_cluster(features: AthleteFeatures) -> str:
     else:
         return AthleteCluster.MODERATE_RESPONDER.value
 
+def _cluster_response(cluster_type: str, details: Dict) -> Dict:
+    """Build the /cluster response body"""
+    return {
+        "cluster": cluster_type,
+        "details": details,
+        "description": _get_cluster_description(cluster_type)
+    }
+
+def _prediction_input(request: PredictionRequest) -> PredictionInput:
+    """Convert an API prediction request into model input"""
+    return PredictionInput(
+        athlete_id=request.athlete_id,
+        current_1rm=request.current_1rm,
+        exercise=request.exercise,
+        training_weeks=request.training_weeks,
+        weekly_volume=request.weekly_volume,
+        avg_intensity=request.avg_intensity,
+        features=AthleteFeatures(**request.athlete.dict())
+    )
+
+def _prediction_response(request: PredictionRequest, result: PredictionOutput) -> Dict:
+    """Build the /predict response body"""
+    return {
+        "exercise": request.exercise,
+        "current_1rm": request.current_1rm,
+        "predicted_1rm": result.predicted_1rm,
+        "gain_kg": round(result.predicted_1rm - request.current_1rm, 1),
+        "gain_percent": round((result.predicted_1rm - request.current_1rm) / request.current_1rm * 100, 1),
+        "confidence_interval": result.confidence_interval,
+        "risk_factors": result.risk_factors,
+        "recommendations": result.recommendations
+    }
+
+def _overtraining_metrics(request: OvertrainingRequest) -> Dict[str, List[float]]:
+    """Collect the non-empty metric series of an overtraining request"""
+    metrics = {
+        "hrv": request.hrv,
+        "sleep_quality": request.sleep_quality,
+        "resting_hr": request.resting_hr,
+        "performance": request.performance
+    }
+    
+    # Filter empty lists
+    return {k: v for k, v in metrics.items() if v}
+
+def _check_batch_size(items: List[Any]):
+    """Reject batches above MAX_BATCH_SIZE"""
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(items)} items (max {MAX_BATCH_SIZE})"
+        )
+
+def _finite_rows(X: np.ndarray, errors: List[Dict], indices: Optional[List[int]] = None) -> List[int]:
+    """
+    Return positions of rows in X whose features are all finite.
+    Rejected rows are appended to errors using their index in the original batch.
+    """
+    if len(X) == 0:
+        return []
+    
+    finite = np.isfinite(X).all(axis=1)
+    for j in np.flatnonzero(~finite):
+        index = indices[j] if indices is not None else int(j)
+        errors.append({"index": int(index), "error": "Non-finite feature values"})
+    
+    return np.flatnonzero(finite).tolist()
+
+def _batch_response(results: List[Optional[Dict]], errors: List[Dict]) -> Dict:
+    """Build a batch response with per-item results and per-item errors"""
+    errors.sort(key=lambda e: e["index"])
+    return {
+        "count": len(results),
+        "succeeded": len(results) - len(errors),
+        "failed": len(errors),
+        "results": results,
+        "errors": errors
+    }
+
 def _get_cluster_description(cluster: str) -> Dict:
     """Get description and recommendations for cluster"""
     descriptions = {
@@ -775,6 +2315,7 @@ if __name__ == "__main__":
 ║    POST /cluster     - Classify athlete into response cluster             ║
 ║    POST /predict     - Predict strength progression                       ║
 ║    POST /overtraining - Detect overtraining risk                          ║
+║    POST /{cluster,predict,overtraining}/batch - Batch variants            ║
 ║    GET  /health      - Check service health                               ║
 ╚═══════════════════════════════════════════════════════════════════════════╝
     """)
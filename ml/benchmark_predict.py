@@ -0,0 +1,199 @@
+"""
+═══════════════════════════════════════════════════════════════════════════════
+⏱️ ATLAS ML ENGINE - PREDICTION LATENCY BENCHMARK
+═══════════════════════════════════════════════════════════════════════════════
+
+Compares StrengthProgressionPredictor latency before and after the vectorized
+confidence interval engine, on synthetic athletes.
+
+- before: the original per-row StrengthProgressionPredictor.predict (Python
+          feature rows, one tree[0].predict call per estimator), reproduced here
+- after:  ConfidenceIntervalEngine (tree_variance and quantile modes)
+
+Reports p50/p99 latency for single predictions and for batches.
+
+Usage:
+  python benchmark_predict.py [--samples 2000] [--repeats 200] [--batch-sizes 100,1000]
+"""
+
+import argparse
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from atlas_ml_engine import (
+    AthleteFeatures,
+    ConfidenceIntervalEngine,
+    PredictionInput,
+    StrengthProgressionPredictor,
+)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# SYNTHETIC DATA
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def make_dataset(n: int, seed: int = 42):
+    """Synthetic prediction inputs with a plausible 1RM target"""
+    rng = np.random.default_rng(seed)
+    inputs: List[PredictionInput] = []
+    targets: List[float] = []
+
+    for i in range(n):
+        features = AthleteFeatures(
+            age=float(rng.uniform(18, 50)),
+            training_age=float(rng.uniform(0, 10)),
+            body_weight=float(rng.uniform(55, 110)),
+            height=float(rng.uniform(160, 200)),
+            body_fat_percentage=float(rng.uniform(8, 25)),
+            avg_hrv=float(rng.uniform(30, 90)),
+            avg_sleep_quality=float(rng.uniform(50, 95)),
+            avg_recovery_score=float(rng.uniform(50, 95)),
+            weekly_training_volume=float(rng.uniform(10, 30)),
+            avg_intensity=float(rng.uniform(60, 90)),
+            strength_ratio=float(rng.uniform(1.0, 2.5)),
+            progression_rate=float(rng.uniform(0, 3)),
+            adherence_rate=float(rng.uniform(50, 100)),
+            injury_history=int(rng.integers(0, 3)),
+            stress_level=float(rng.uniform(1, 9))
+        )
+        current = float(rng.uniform(60, 220))
+        weeks = int(rng.integers(4, 16))
+        inputs.append(PredictionInput(
+            athlete_id=f"athlete-{i}",
+            current_1rm=current,
+            exercise="squat",
+            training_weeks=weeks,
+            weekly_volume=int(rng.integers(8, 30)),
+            avg_intensity=float(rng.uniform(60, 90)),
+            features=features
+        ))
+        gain = 0.01 * weeks * (features.adherence_rate / 100) / (1 + features.training_age / 3)
+        targets.append(current * (1 + gain) + float(rng.normal(0, 2)))
+
+    return inputs, targets
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BASELINE: ORIGINAL PER-ROW PREDICTION PATH
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def _legacy_features(data: List[PredictionInput]) -> np.ndarray:
+    """Original prepare_features: one Python list per row"""
+    features = []
+    for d in data:
+        row = [
+            d.current_1rm,
+            d.training_weeks,
+            d.weekly_volume,
+            d.avg_intensity,
+            d.features.training_age,
+            d.features.body_weight,
+            d.features.avg_hrv,
+            d.features.avg_recovery_score,
+            d.features.progression_rate,
+            d.features.adherence_rate,
+            d.features.stress_level
+        ]
+        features.append(row)
+    return np.array(features)
+
+def _legacy_risks(data: PredictionInput) -> List[str]:
+    """Original _assess_risks"""
+    risks = []
+    if data.features.avg_hrv < 40:
+        risks.append("Low HRV indicates poor recovery capacity")
+    if data.features.avg_sleep_quality < 60:
+        risks.append("Sleep quality below optimal for adaptation")
+    if data.features.stress_level > 7:
+        risks.append("High stress may impair recovery")
+    if data.weekly_volume > 25:
+        risks.append("High training volume may lead to overreaching")
+    if data.avg_intensity > 85:
+        risks.append("Sustained high intensity increases injury risk")
+    if data.features.adherence_rate < 70:
+        risks.append("Low adherence will reduce expected gains")
+    return risks
+
+def _legacy_recommendations(data: PredictionInput, predicted: float) -> List[str]:
+    """Original _generate_recommendations"""
+    recs = []
+    gain = (predicted - data.current_1rm) / data.current_1rm * 100
+    if gain < 5:
+        recs.append("Consider deload week to enhance recovery")
+        recs.append("Evaluate if volume needs adjustment")
+    if data.features.avg_hrv < 50:
+        recs.append("Prioritize recovery: sleep, nutrition, stress management")
+    if data.features.progression_rate < 0.5:
+        recs.append("Try periodization variation (DUP, block, conjugate)")
+    if data.avg_intensity > 80:
+        recs.append("Include more submaximal volume work")
+    if data.features.training_age > 5:
+        recs.append("Focus on technique refinement and weak points")
+    return recs
+
+def legacy_predict(predictor: StrengthProgressionPredictor, inputs: List[PredictionInput]):
+    """Original predict, called once per row, using the fitted predictor's scaler and model"""
+    for input_data in inputs:
+        X_scaled = predictor.scaler.transform(_legacy_features([input_data]))
+        predicted = predictor.model.predict(X_scaled)[0]
+        predictions = []
+        for tree in predictor.model.estimators_:
+            predictions.append(tree[0].predict(X_scaled)[0])
+        std = np.std(predictions)
+        (round(predicted - 1.96 * std, 1), round(predicted + 1.96 * std, 1))
+        _legacy_risks(input_data)
+        _legacy_recommendations(input_data, predicted)
+
+# ═══════════════════════════════════════════════════════════════════════════════
+# BENCHMARK
+# ═══════════════════════════════════════════════════════════════════════════════
+
+def measure(fn: Callable[[], None], repeats: int) -> Dict[str, float]:
+    """Run fn repeatedly and return p50/p99 latency in milliseconds"""
+    fn()  # warm-up
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50": float(np.percentile(samples, 50)),
+        "p99": float(np.percentile(samples, 99))
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", type=int, default=2000, help="training set size")
+    parser.add_argument("--repeats", type=int, default=200, help="timed iterations per scenario")
+    parser.add_argument("--batch-sizes", default="100,1000", help="comma-separated batch sizes")
+    args = parser.parse_args()
+
+    inputs, targets = make_dataset(args.samples)
+    batch_sizes = [int(b) for b in args.batch_sizes.split(",") if b.strip()]
+
+    predictors = {}
+    for method in ConfidenceIntervalEngine.METHODS:
+        predictor = StrengthProgressionPredictor(ci_method=method)
+        predictor.fit(inputs, targets)
+        predictors[method] = predictor
+
+    rows = []
+    single = inputs[:1]
+    baseline = predictors["tree_variance"]
+    rows.append(("before (original per-row)", "single", measure(lambda: legacy_predict(baseline, single), args.repeats)))
+    for method, predictor in predictors.items():
+        rows.append((f"after ({method})", "single", measure(lambda p=predictor: p.predict_batch(single), args.repeats)))
+
+    for size in batch_sizes:
+        batch = inputs[:size]
+        repeats = max(5, args.repeats // max(1, size // 50))
+        rows.append(("before (original per-row)", f"batch {size}", measure(lambda: legacy_predict(baseline, batch), repeats)))
+        for method, predictor in predictors.items():
+            rows.append((f"after ({method})", f"batch {size}", measure(lambda p=predictor: p.predict_batch(batch), repeats)))
+
+    print(f"{'variant':<26}{'workload':<14}{'p50 ms':>10}{'p99 ms':>10}")
+    for variant, workload, stats in rows:
+        print(f"{variant:<26}{workload:<14}{stats['p50']:>10.2f}{stats['p99']:>10.2f}")
+
+if __name__ == "__main__":
+    main()
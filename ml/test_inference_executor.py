@@ -0,0 +1,49 @@
+"""
+═══════════════════════════════════════════════════════════════════════════════
+🧪 ATLAS ML ENGINE - INFERENCE EXECUTOR TESTS
+═══════════════════════════════════════════════════════════════════════════════
+
+Usage:
+  python -m pytest ml/test_inference_executor.py -q
+"""
+
+import asyncio
+import threading
+
+import atlas_ml_engine as engine
+from atlas_ml_engine import AthleteData, InferenceConfig, InferenceExecutor
+
+ATHLETE = AthleteData(
+    age=28, training_age=4, body_weight=80, height=180, body_fat_percentage=14,
+    avg_hrv=65, avg_sleep_quality=80, avg_recovery_score=75, weekly_training_volume=18,
+    avg_intensity=75, strength_ratio=1.8, progression_rate=1.2, adherence_rate=90,
+    injury_history=0, stress_level=4
+)
+
+def test_cluster_answers_while_predict_batch_saturates_default_pool(monkeypatch):
+    executor = InferenceExecutor(InferenceConfig())
+    monkeypatch.setattr(engine, "inference", executor)
+    release = threading.Event()
+
+    async def scenario():
+        # Fill every predict_batch slot and its wait queue with blocked work
+        config = executor.config
+        blocked = [
+            asyncio.ensure_future(executor.run("predict_batch", release.wait, 10))
+            for _ in range(config.thread_workers + config.queue_depth)
+        ]
+        await asyncio.sleep(0.2)
+        try:
+            return await asyncio.wait_for(engine.cluster_athlete(ATHLETE), timeout=5)
+        finally:
+            release.set()
+            await asyncio.gather(*blocked)
+
+    try:
+        response = asyncio.run(scenario())
+    finally:
+        release.set()
+        executor.shutdown()
+
+    assert response["cluster"]
+    assert executor.stats()["endpoints"]["predict_batch"]["rejected"] == 0